@@ -0,0 +1,249 @@
+from sqlalchemy import select, delete, func
+from database import engine, shard_engines, shard_for
+from models import Employee, WeeklyScore, Organization, OrganizationShard
+from analytics import analytics
+from search import indexes as search_indexes
+from cache import invalidate, employees_key, CACHE_REDIS_URL
+from archive import archived_scores, delete_archived
+import argparse
+import csv
+import json
+import sys
+import time
+
+# Non-interactive admin CLI, safe to run from cron and pipelines.
+#   python admin.py orgs
+#   python admin.py employees --org ORG_ID --format csv > employees.csv
+#   python admin.py scores --org ORG_ID --from 2026-W01 --to 2026-W13 --format json
+#   python admin.py report --org ORG_ID --from 2026-W01
+#   python admin.py delete-scores --org ORG_ID --week 2026-W05 --yes
+# Rows are streamed from a server-side cursor (Postgres) in --batch-size
+# chunks and written as they arrive, so memory stays flat however many
+# rows match. Output goes to stdout, progress and summaries to stderr.
+# Only hot rows are listed; archived weeks are listed by archive.py status.
+# Deletes remove the matching archived rows too.
+#
+# After a delete the caches are invalidated through cache.py. With
+# CACHE_REDIS_URL set the web workers share that store and see it at once;
+# with the default in-memory backend they cannot, and keep serving the
+# deleted rows from their caches until those expire (CACHE_TTL_SECONDS,
+# ANALYTICS_MAX_AGE_SECONDS).
+BATCH_SIZE = 5000
+
+SCORE_COLUMNS = ["id", "week", "employee_id", "employee_name", "task_completion", "speed",
+                 "professionalism", "activity", "productivity_score"]
+
+
+def log(message):
+    print(message, file=sys.stderr)
+
+
+def write_rows(rows, columns, fmt, out):
+    if fmt == "csv":
+        writer = csv.writer(out)
+        writer.writerow(columns)
+        writer.writerows(rows)
+    elif fmt == "json":
+        # One object per line, so consumers can stream it too
+        for row in rows:
+            out.write(json.dumps(dict(zip(columns, row)), default=str) + "\n")
+    else:
+        out.write("  ".join(f"{c:<16}" for c in columns).rstrip() + "\n")
+        for row in rows:
+            out.write("  ".join(f"{'' if v is None else v!s:<16}" for v in row).rstrip() + "\n")
+
+
+def stream(conn, statement, batch_size):
+    result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(statement)
+    for partition in result.partitions():
+        yield from partition
+
+
+def week_filter(statement, args):
+    if args.from_week:
+        statement = statement.where(WeeklyScore.week >= args.from_week)
+    if args.to_week:
+        statement = statement.where(WeeklyScore.week <= args.to_week)
+    return statement
+
+
+def org_engine(organization_id, writable=False):
+    shard, frozen = shard_for(organization_id)
+    if frozen and writable:
+        sys.exit(f"❌ {organization_id} is being moved between shards, try again later")
+    return shard_engines[shard]
+
+
+def list_orgs(args, out):
+    statement = select(Organization.id, Organization.name, OrganizationShard.shard,
+                       Organization.created_at).outerjoin(
+        OrganizationShard, OrganizationShard.organization_id == Organization.id
+    ).order_by(Organization.created_at)
+    with engine.connect() as conn:
+        rows = ((id_, name, shard or "default", created)
+                for id_, name, shard, created in stream(conn, statement, args.batch_size))
+        write_rows(rows, ["id", "name", "shard", "created_at"], args.format, out)
+
+
+def list_employees(args, out):
+    statement = select(Employee.id, Employee.external_id, Employee.name,
+                       Employee.department, Employee.role).where(
+        Employee.organization_id == args.org).order_by(Employee.id)
+    with org_engine(args.org).connect() as conn:
+        write_rows(stream(conn, statement, args.batch_size),
+                   ["id", "external_id", "name", "department", "role"], args.format, out)
+
+
+def list_scores(args, out):
+    statement = select(
+        WeeklyScore.id, WeeklyScore.week, WeeklyScore.employee_id, Employee.name,
+        WeeklyScore.task_completion, WeeklyScore.speed, WeeklyScore.professionalism,
+        WeeklyScore.activity, WeeklyScore.productivity_score
+    ).outerjoin(Employee, Employee.id == WeeklyScore.employee_id).where(
+        WeeklyScore.organization_id == args.org
+    ).order_by(WeeklyScore.week, WeeklyScore.id)
+    if args.employee:
+        statement = statement.where(WeeklyScore.employee_id == args.employee)
+    with org_engine(args.org).connect() as conn:
+        write_rows(stream(conn, week_filter(statement, args), args.batch_size),
+                   SCORE_COLUMNS, args.format, out)
+
+
+def report(args, out):
+    # Aggregated in the database, one row per week
+    score = WeeklyScore.productivity_score
+    statement = select(
+        WeeklyScore.week, func.count(), func.round(func.avg(score), 2), func.min(score), func.max(score)
+    ).where(WeeklyScore.organization_id == args.org).group_by(
+        WeeklyScore.week).order_by(WeeklyScore.week)
+    with org_engine(args.org).connect() as conn:
+        write_rows(stream(conn, week_filter(statement, args), args.batch_size),
+                   ["week", "scores", "average", "min", "max"], args.format, out)
+
+
+def caches_invalidated(organization_id):
+    if not CACHE_REDIS_URL:
+        log(f"ℹ️  Web workers notice this once their caches of {organization_id} expire "
+            f"(no shared cache configured)")
+
+
+def delete_scores(args, out):
+    if not (args.from_week or args.to_week or args.all_weeks):
+        sys.exit("❌ Pass --week, --from/--to or --all-weeks")
+    shard_engine = org_engine(args.org, writable=True)
+    scope = week_filter(select(WeeklyScore.id).where(WeeklyScore.organization_id == args.org), args)
+
+    with shard_engine.connect() as conn:
+        total = conn.execute(select(func.count()).select_from(scope.subquery())).scalar()
+        if not args.yes:
+            archived = len(archived_scores(args.org, args.from_week, args.to_week))
+            log(f"🔍 {total} scores and {archived} archived scores would be deleted from {args.org}; "
+                f"pass --yes to delete them")
+            return
+
+        deleted = 0
+        started = time.monotonic()
+        while True:
+            # Small batches keep each transaction short and the lock
+            # footprint small on a live table
+            ids = conn.execute(scope.order_by(WeeklyScore.id).limit(args.batch_size)).scalars().all()
+            if not ids:
+                break
+            conn.execute(delete(WeeklyScore).where(WeeklyScore.id.in_(ids)))
+            conn.commit()
+            deleted += len(ids)
+            rate = deleted / max(time.monotonic() - started, 1e-6)
+            log(f"  {deleted}/{total} deleted ({rate:,.0f} rows/s)")
+    archived = delete_archived(args.org, from_week=args.from_week, to_week=args.to_week)
+    analytics.invalidate(args.org)
+    log(f"✅ Deleted {deleted} scores and {archived} archived scores from {args.org}")
+    caches_invalidated(args.org)
+
+
+def delete_employees(args, out):
+    # Employees and their scores; --id can be repeated
+    shard_engine = org_engine(args.org, writable=True)
+    with shard_engine.connect() as conn:
+        ids = conn.execute(select(Employee.id).where(
+            Employee.organization_id == args.org, Employee.id.in_(args.id))).scalars().all()
+        missing = sorted(set(args.id) - set(ids))
+        if missing:
+            log(f"⚠️  Not in {args.org}: {', '.join(map(str, missing))}")
+        if not args.yes:
+            log(f"🔍 {len(ids)} employees would be deleted with their scores; pass --yes to delete them")
+            return
+        for start in range(0, len(ids), args.batch_size):
+            batch = ids[start:start + args.batch_size]
+            conn.execute(delete(WeeklyScore).where(WeeklyScore.employee_id.in_(batch)))
+            conn.execute(delete(Employee).where(Employee.id.in_(batch)))
+            conn.commit()
+            log(f"  {min(start + args.batch_size, len(ids))}/{len(ids)} deleted")
+    archived = delete_archived(args.org, employee_ids=ids)
+    invalidate(employees_key(args.org))
+    analytics.invalidate(args.org)
+    search_indexes.changed(args.org, ids)
+    log(f"✅ Deleted {len(ids)} employees and {archived} archived scores from {args.org}")
+    caches_invalidated(args.org)
+
+
+def parse_args(argv=None):
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--format", choices=["table", "json", "csv"], default="table")
+    common.add_argument("--output", default="-", help="file to write (default: stdout)")
+    common.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+
+    scoped = argparse.ArgumentParser(add_help=False, parents=[common])
+    scoped.add_argument("--org", required=True, help="organization id")
+
+    weeks = argparse.ArgumentParser(add_help=False)
+    weeks.add_argument("--from", dest="from_week", default=None, help="first week, e.g. 2026-W01")
+    weeks.add_argument("--to", dest="to_week", default=None, help="last week (inclusive)")
+    weeks.add_argument("--week", default=None, help="shorthand for --from WEEK --to WEEK")
+
+    parser = argparse.ArgumentParser(description="Admin CLI")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("orgs", parents=[common], help="list organizations").set_defaults(run=list_orgs)
+    sub.add_parser("employees", parents=[scoped], help="list employees").set_defaults(run=list_employees)
+
+    scores_parser = sub.add_parser("scores", parents=[scoped, weeks], help="list scores")
+    scores_parser.add_argument("--employee", type=int, default=None)
+    scores_parser.set_defaults(run=list_scores)
+
+    sub.add_parser("report", parents=[scoped, weeks],
+                   help="per-week count, average, min and max").set_defaults(run=report)
+
+    delete_parser = sub.add_parser("delete-scores", parents=[scoped, weeks], help="delete scores")
+    delete_parser.add_argument("--all-weeks", action="store_true", help="every week of the org")
+    delete_parser.add_argument("--yes", action="store_true", help="without it only the count is shown")
+    delete_parser.set_defaults(run=delete_scores)
+
+    employees_parser = sub.add_parser("delete-employees", parents=[scoped],
+                                      help="delete employees and their scores")
+    employees_parser.add_argument("--id", type=int, action="append", required=True)
+    employees_parser.add_argument("--yes", action="store_true", help="without it only the count is shown")
+    employees_parser.set_defaults(run=delete_employees)
+
+    args = parser.parse_args(argv)
+    if getattr(args, "week", None):
+        args.from_week = args.to_week = args.week
+    for name in ("from_week", "to_week"):
+        setattr(args, name, getattr(args, name, None))
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        if args.output == "-":
+            args.run(args, sys.stdout)
+        else:
+            with open(args.output, "w", newline="") as out:
+                args.run(args, out)
+                log(f"📁 Wrote {args.output}")
+    except BrokenPipeError:
+        # Reader went away (| head); not an error in a pipeline
+        sys.stderr.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+from sqlalchemy import select
+from models import Employee, WeeklyScore
+from archive import archived_scores
+from cache import cache, MISSING
+from collections import OrderedDict
+import numpy as np
+import os
+import re
+import threading
+import time
+import uuid
+
+# Per-organization columnar copy of every score (hot and archived) for the
+# /analytics endpoints. An org is loaded on first use with one projected
+# query for its scores and one for its employees' departments, then kept up
+# to date by the score and employee write endpoints. Orgs are evicted
+# least-recently-used once the arrays pass ANALYTICS_MEMORY_MB.
+#
+# Each process has its own copy. Writers bump a version stamp in the shared
+# cache (cache.py) and readers reload when their stamp no longer matches;
+# with the in-process cache backend other workers reload after
+# ANALYTICS_MAX_AGE_SECONDS instead.
+ANALYTICS_MEMORY_MB = float(os.getenv("ANALYTICS_MEMORY_MB", "256"))
+ANALYTICS_MAX_AGE = float(os.getenv("ANALYTICS_MAX_AGE_SECONDS", "300"))
+
+METRICS = ("task_completion", "speed", "professionalism", "activity", "productivity_score")
+WEEK_LABEL = re.compile(r"^(\d{4})-W(\d{2})$")
+
+
+def version_key(organization_id):
+    return f"org:{organization_id}:analytics_version"
+
+
+def week_number(label):
+    # "2026-W05" -> 202605, so weeks sort and diff as integers; -1 if the
+    # label is not a week
+    match = WEEK_LABEL.match(label or "")
+    return int(match.group(1)) * 100 + int(match.group(2)) if match else -1
+
+
+def week_label(number):
+    return f"{number // 100}-W{number % 100:02d}"
+
+
+class OrgScores:
+    # Growable column arrays; rows [0, size) are live
+    def __init__(self, ids, employee_ids, weeks, metrics, departments, version):
+        self.size = len(ids)
+        capacity = max(16, self.size)
+        self.ids = self._grow(np.asarray(ids, dtype=np.int64), capacity)
+        self.employee_ids = self._grow(np.asarray(employee_ids, dtype=np.int64), capacity)
+        self.weeks = self._grow(np.asarray(weeks, dtype=np.int32), capacity)
+        self.metrics = {name: self._grow(np.asarray(metrics[name], dtype=np.float64), capacity)
+                        for name in METRICS}
+        self.departments = departments
+        self.version = version
+        self.loaded_at = time.monotonic()
+
+    @staticmethod
+    def _grow(values, capacity):
+        grown = np.zeros(capacity, dtype=values.dtype)
+        grown[:len(values)] = values
+        return grown
+
+    def nbytes(self):
+        return (self.ids.nbytes + self.employee_ids.nbytes + self.weeks.nbytes
+                + sum(values.nbytes for values in self.metrics.values()))
+
+    def column(self, name):
+        if name == "employee_id":
+            return self.employee_ids[:self.size]
+        if name == "week":
+            return self.weeks[:self.size]
+        return self.metrics[name][:self.size]
+
+    def live(self):
+        # Rows with a parseable week and an employee
+        return (self.weeks[:self.size] >= 0) & (self.employee_ids[:self.size] >= 0)
+
+    def append(self, score_id, employee_id, week, values):
+        if self.size == len(self.ids):
+            capacity = len(self.ids) * 2
+            self.ids = self._grow(self.ids[:self.size], capacity)
+            self.employee_ids = self._grow(self.employee_ids[:self.size], capacity)
+            self.weeks = self._grow(self.weeks[:self.size], capacity)
+            self.metrics = {name: self._grow(column[:self.size], capacity)
+                            for name, column in self.metrics.items()}
+        i = self.size
+        self.ids[i] = score_id
+        self.employee_ids[i] = employee_id if employee_id is not None else -1
+        self.weeks[i] = week
+        for name in METRICS:
+            self.metrics[name][i] = np.nan if values[name] is None else values[name]
+        self.size += 1
+
+    def remove(self, score_id):
+        # Swap the last live row into the hole
+        hits = np.flatnonzero(self.ids[:self.size] == score_id)
+        if not len(hits):
+            return
+        i, last = hits[0], self.size - 1
+        self.ids[i] = self.ids[last]
+        self.employee_ids[i] = self.employee_ids[last]
+        self.weeks[i] = self.weeks[last]
+        for column in self.metrics.values():
+            column[i] = column[last]
+        self.size -= 1
+
+
+class AnalyticsCache:
+    def __init__(self, memory_budget=ANALYTICS_MEMORY_MB * 1024 * 1024, max_age=ANALYTICS_MAX_AGE):
+        self.memory_budget = memory_budget
+        self.max_age = max_age
+        self._orgs = OrderedDict()
+        self._lock = threading.RLock()
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+
+    def _load(self, db, organization_id):
+        version = cache.get(version_key(organization_id))
+        if version is MISSING:
+            version = uuid.uuid4().hex
+            cache.set(version_key(organization_id), version)
+
+        rows = db.execute(
+            select(WeeklyScore.id, WeeklyScore.employee_id, WeeklyScore.week,
+                   *(getattr(WeeklyScore, name) for name in METRICS))
+            .where(WeeklyScore.organization_id == organization_id)
+        ).all()
+        hot_ids = {row[0] for row in rows}
+        rows += [
+            (s.id, s.employee_id, s.week, *(getattr(s, name) for name in METRICS))
+            for s in archived_scores(organization_id) if s.id not in hot_ids
+        ]
+        departments = dict(db.execute(
+            select(Employee.id, Employee.department)
+            .where(Employee.organization_id == organization_id)
+        ).all())
+
+        columns = list(zip(*rows)) if rows else [()] * (3 + len(METRICS))
+        week_numbers = {label: week_number(label) for label in set(columns[2])}
+        return OrgScores(
+            ids=columns[0],
+            employee_ids=[-1 if e is None else e for e in columns[1]],
+            weeks=[week_numbers[label] for label in columns[2]],
+            metrics={name: [np.nan if v is None else v for v in columns[3 + i]]
+                     for i, name in enumerate(METRICS)},
+            departments=departments,
+            version=version
+        )
+
+    def _fresh(self, organization_id, entry):
+        version = cache.get(version_key(organization_id))
+        if version is MISSING:
+            return time.monotonic() - entry.loaded_at < self.max_age
+        return version == entry.version
+
+    def get(self, db, organization_id):
+        with self._lock:
+            entry = self._orgs.get(organization_id)
+            if entry is not None and self._fresh(organization_id, entry):
+                self._orgs.move_to_end(organization_id)
+                self.hits += 1
+                return entry
+
+        # Loaded outside the lock so one large org does not block the rest;
+        # a write that lands mid-load changes the version and forces the
+        # next read to reload
+        entry = self._load(db, organization_id)
+        with self._lock:
+            self.loads += 1
+            self._orgs[organization_id] = entry
+            self._orgs.move_to_end(organization_id)
+            self._evict()
+        return entry
+
+    def _evict(self):
+        total = sum(entry.nbytes() for entry in self._orgs.values())
+        # Never evict the org that was just loaded
+        while total > self.memory_budget and len(self._orgs) > 1:
+            _, entry = self._orgs.popitem(last=False)
+            total -= entry.nbytes()
+            self.evictions += 1
+
+    def _update(self, organization_id, apply):
+        # Applies a write to the local copy (if loaded) and bumps the shared
+        # version so other processes reload
+        previous = cache.get(version_key(organization_id))
+        version = uuid.uuid4().hex
+        cache.set(version_key(organization_id), version)
+        with self._lock:
+            entry = self._orgs.get(organization_id)
+            if entry is None:
+                return
+            # A copy that already missed someone else's write is dropped
+            # rather than patched
+            if apply is None or (previous is not MISSING and previous != entry.version):
+                del self._orgs[organization_id]
+                return
+            apply(entry)
+            entry.version = version
+
+    def record_score(self, score):
+        self._update(score.organization_id, lambda entry: entry.append(
+            score.id, score.employee_id, week_number(score.week),
+            {name: getattr(score, name) for name in METRICS}))
+
+    def remove_score(self, organization_id, score_id):
+        self._update(organization_id, lambda entry: entry.remove(score_id))
+
+    def set_department(self, organization_id, employee_id, department):
+        self._update(organization_id, lambda entry: entry.departments.__setitem__(
+            employee_id, department))
+
+    def invalidate(self, organization_id):
+        self._update(organization_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._orgs.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "organizations": len(self._orgs),
+                "rows": sum(entry.size for entry in self._orgs.values()),
+                "bytes": sum(entry.nbytes() for entry in self._orgs.values()),
+                "memory_budget_bytes": int(self.memory_budget),
+                "loads": self.loads,
+                "hits": self.hits,
+                "evictions": self.evictions,
+            }
+
+
+analytics = AnalyticsCache()
+
+
+def _select(entry, from_week=None, to_week=None, employee_id=None):
+    mask = entry.live()
+    weeks = entry.column("week")
+    if from_week:
+        mask &= weeks >= week_number(from_week)
+    if to_week:
+        mask &= weeks <= week_number(to_week)
+    if employee_id is not None:
+        mask &= entry.column("employee_id") == employee_id
+    return mask
+
+
+def _group_means(keys, values):
+    # Mean of `values` per distinct key, ignoring NaN
+    valid = ~np.isnan(values)
+    unique, inverse = np.unique(keys[valid], return_inverse=True)
+    sums = np.bincount(inverse, weights=values[valid], minlength=len(unique))
+    counts = np.bincount(inverse, minlength=len(unique))
+    return unique, sums / counts
+
+
+def moving_averages(entry, window, metric="productivity_score", employee_id=None,
+                    from_week=None, to_week=None):
+    # Per employee and week: the metric and its mean over the last `window`
+    # weeks that employee has scores for
+    mask = _select(entry, from_week, to_week, employee_id)
+    employees = entry.column("employee_id")[mask]
+    weeks = entry.column("week")[mask]
+    values = entry.column(metric)[mask]
+
+    # One point per (employee, week)
+    keys = employees * 1_000_000 + weeks
+    keys, values = _group_means(keys, values)
+    employees, weeks = keys // 1_000_000, keys % 1_000_000
+
+    # keys are sorted, so each employee's weeks are contiguous and in order
+    starts = np.r_[0, np.flatnonzero(np.diff(employees)) + 1]
+    group_start = np.repeat(starts, np.diff(np.r_[starts, len(employees)]))
+    index = np.arange(len(values))
+    lower = np.maximum(index + 1 - window, group_start)
+    totals = np.r_[0.0, np.cumsum(values)]
+    averages = (totals[index + 1] - totals[lower]) / (index + 1 - lower)
+
+    labels = {week: week_label(week) for week in np.unique(weeks).tolist()}
+    result = {}
+    for employee, week, value, average in zip(employees.tolist(), weeks.tolist(),
+                                             np.round(values, 2).tolist(),
+                                             np.round(averages, 2).tolist()):
+        result.setdefault(employee, []).append(
+            {"week": labels[week], metric: value, "moving_average": average})
+    return result
+
+
+def department_means(entry, metric="productivity_score", from_week=None, to_week=None):
+    mask = _select(entry, from_week, to_week)
+    employees = entry.column("employee_id")[mask]
+    weeks = entry.column("week")[mask]
+    values = entry.column(metric)[mask]
+
+    names = sorted(set(entry.departments.values()))
+    codes = {name: i for i, name in enumerate(names)}
+    known = np.array(sorted(entry.departments), dtype=np.int64)
+    known_codes = np.array([codes[entry.departments[e]] for e in known.tolist()], dtype=np.int64)
+    # Scores of deleted employees fall into "Unknown"
+    unknown = len(names)
+    if len(known):
+        position = np.clip(np.searchsorted(known, employees), 0, len(known) - 1)
+        departments = np.where(known[position] == employees, known_codes[position], unknown)
+    else:
+        departments = np.full(len(employees), unknown)
+    names.append("Unknown")
+
+    base = len(names)
+    keys, means = _group_means(weeks.astype(np.int64) * base + departments, values)
+    result = {}
+    for key, mean in zip(keys.tolist(), means.tolist()):
+        result.setdefault(week_label(key // base), {})[names[key % base]] = round(mean, 2)
+    return result
+
+
+def week_over_week(entry, metric="productivity_score", from_week=None, to_week=None):
+    # Organization mean per week with the change from the previous week,
+    # and each employee's change between their two most recent weeks
+    mask = _select(entry, from_week, to_week)
+    employees = entry.column("employee_id")[mask]
+    weeks = entry.column("week")[mask]
+    values = entry.column(metric)[mask]
+
+    week_keys, week_means = _group_means(weeks.astype(np.int64), values)
+    deltas = np.r_[np.nan, np.diff(week_means)]
+    organization = [
+        {"week": week_label(week), "mean": round(mean, 2),
+         "delta": None if np.isnan(delta) else round(delta, 2)}
+        for week, mean, delta in zip(week_keys.tolist(), week_means.tolist(), deltas.tolist())
+    ]
+
+    keys, means = _group_means(employees * 1_000_000 + weeks, values)
+    employee_of = keys // 1_000_000
+    # Last point of each employee and the one before it, if it is theirs
+    last = np.r_[np.flatnonzero(np.diff(employee_of)), len(keys) - 1] if len(keys) else np.array([], int)
+    has_previous = (last > 0) & (employee_of[np.maximum(last - 1, 0)] == employee_of[last])
+    employees_latest = [
+        {"employee_id": int(employee_of[i]), "week": week_label(int(keys[i] % 1_000_000)),
+         metric: round(float(means[i]), 2),
+         "delta": round(float(means[i] - means[i - 1]), 2) if previous else None}
+        for i, previous in zip(last.tolist(), has_previous.tolist())
+    ]
+    return {"organization": organization, "employees": employees_latest}
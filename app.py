@@ -1,41 +1,50 @@
-from fastapi import FastAPI, Depends, HTTPException, Form, Header
+from fastapi import FastAPI, Depends, HTTPException, Form, Header, Query, Request, UploadFile, File, Body
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 from sqlalchemy.orm import Session
-from database import SessionLocal, engine
-from models import Employee, WeeklyScore, User, Organization, OrganizationMembership, Base
+from sqlalchemy.exc import IntegrityError
+from database import SessionLocal, engine, shard_engines, tenant_session, create_shard_schemas, insert_unless_exists, OrganizationFrozen, NEW_ORG_SHARD, DEFAULT_SHARD
+from models import Employee, WeeklyScore, User, Organization, OrganizationMembership, OrganizationShard, Job, Base
 from scoring import calculate_productivity
+from passwords import hash_password, verify_password, needs_rehash, HashingBusy, DUMMY_HASH
+from reports import weekly_report_rows, range_report_rows, report_weeks, render_excel, render_pdf, render_workbook, stream_zip, XLSX_MEDIA_TYPE
+from mailer import build_report_message, send_message
+from digest import DIGEST_SENDER_EMAIL
+from jobs import enqueue, job_to_dict
+from analytics import analytics, moving_averages, department_means, week_over_week, METRICS
+from search import search_employees, indexes as search_indexes
+from history import employee_history, MAX_HISTORY_EMPLOYEES
+from roster import RosterError, file_format, read_roster, diff_roster, apply_diff, summarize, roster_rows, stream_csv, render_roster_xlsx, FORMATS as ROSTER_FORMATS
+import statements
+from purge import purge_organization
+from batch import run_batch, MAX_BATCH_ITEMS
+from archive import archived_scores, merge_scores, find_archived_score, delete_archived, require_shared_store, open_store as open_archive_store, ArchiveNotShared
+import tasks  # noqa: F401  (registers the job handlers)
+from cache import cache, get_or_load, invalidate, me_key, members_key, employees_key
+from tracing import span, trace, instrument_engine
+from rate_limit import AdmissionControl, concurrency
+from idempotency import IdempotencyMiddleware, store as idempotency_store
+from profiling import ProfiledRoute, Profile, current_profile, should_sample, save_profile, list_profiles, load_profile, PROFILE_HEADER
 from datetime import datetime, timedelta
-import openpyxl
-from openpyxl.styles import Font, PatternFill, Alignment
-from reportlab.lib.pagesizes import letter
-from reportlab.lib import colors
-from reportlab.lib.units import inch
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet
+from functools import partial
+import anyio
 import io
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 import secrets
-import hashlib
+import time
 import uuid
 
+MAX_BUNDLE_WEEKS = 60
+
 app = FastAPI(title="Employee Productivity Tracker")
+app.router.route_class = ProfiledRoute
 
 # Create database tables on startup
 Base.metadata.create_all(bind=engine)
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[
-        "https://productivity-tracker-three.vercel.app",
-        "http://localhost:3000"
-    ],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+create_shard_schemas()
+open_archive_store()
+for shard_engine in shard_engines.values():
+    instrument_engine(shard_engine)
 
 sessions = {}
 
@@ -48,10 +57,6 @@ def get_db():
         db.close()
 
 
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
-
-
 def create_session(user_id: int, organization_id: str, role: str) -> str:
     token = secrets.token_urlsafe(32)
     sessions[token] = {
@@ -78,7 +83,8 @@ def get_current_user(authorization: str = Header(None), db: Session = Depends(ge
         raise HTTPException(status_code=401, detail="Not authenticated")
 
     token = authorization.replace("Bearer ", "")
-    session = verify_session(token)
+    with span("auth.verify_session"):
+        session = verify_session(token)
 
     if not session:
         raise HTTPException(
@@ -87,6 +93,117 @@ def get_current_user(authorization: str = Header(None), db: Session = Depends(ge
     return session
 
 
+def get_tenant_db(request: Request, current_user: dict = Depends(get_current_user)):
+    # Employees and scores live on the organization's shard
+    db = tenant_session(current_user['organization_id'],
+                        writable=request.method not in ("GET", "HEAD"))
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def session_from_request(request: Request):
+    authorization = request.headers.get("authorization")
+    if not authorization:
+        return None
+    return verify_session(authorization.replace("Bearer ", ""))
+
+
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+    session = session_from_request(request)
+
+    profile = None
+    if request.headers.get(PROFILE_HEADER) and session and session['role'] == 'admin':
+        profile = Profile("header")
+    elif should_sample():
+        profile = Profile("sampled")
+
+    if not profile:
+        return await call_next(request)
+
+    reset = current_profile.set(profile)
+    start = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        current_profile.reset(reset)
+    duration_ms = (time.perf_counter() - start) * 1000
+
+    route = request.scope.get("route")
+    # File writes and the prune go to a worker thread, off the event loop
+    await anyio.to_thread.run_sync(partial(
+        save_profile,
+        profile,
+        route=route.path if route else request.url.path,
+        method=request.method,
+        organization_id=session['organization_id'] if session else None,
+        status_code=response.status_code,
+        duration_ms=duration_ms
+    ))
+    response.headers["X-Profile-Id"] = profile.id
+    return response
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    with trace(f"{request.method} {request.url.path}", method=request.method, path=request.url.path) as root:
+        response = await call_next(request)
+        if root is not None:
+            route = request.scope.get("route")
+            root.set("route", route.path if route else None)
+            root.set("status_code", response.status_code)
+            response.headers["X-Trace-Id"] = root.trace.trace_id
+        return response
+
+
+@app.exception_handler(HashingBusy)
+async def hashing_busy_handler(request: Request, exc: HashingBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Too many sign-in attempts in progress, please retry"},
+        headers={"Retry-After": "1"}
+    )
+
+
+@app.exception_handler(OrganizationFrozen)
+async def organization_frozen_handler(request: Request, exc: OrganizationFrozen):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "This organization is being migrated, please retry shortly"},
+        headers={"Retry-After": "5"}
+    )
+
+
+app.add_middleware(AdmissionControl, verify_session=verify_session)
+
+# Outside admission control so a replayed retry is answered from the store
+# without taking a rate-limit token or a concurrency slot
+app.add_middleware(IdempotencyMiddleware, verify_session=verify_session)
+
+# Registered last so it is the outermost layer and 429/503 responses from
+# admission control still carry CORS headers
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=[
+        "https://productivity-tracker-three.vercel.app",
+        "http://localhost:3000"
+    ],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+
+def job_accepted(job):
+    return JSONResponse(
+        status_code=202,
+        content={"job_id": job.id, "status": job.status,
+                 "status_url": f"/jobs/{job.id}"}
+    )
+
+
 # ============= AUTHENTICATION =============
 
 @app.post("/auth/register")
@@ -96,26 +213,21 @@ def register(
     password: str = Form(...),
     db: Session = Depends(get_db)
 ):
-    existing_user = db.query(User).filter(
-        (User.username == username) | (User.email == email)
-    ).first()
-
-    if existing_user:
-        raise HTTPException(
-            status_code=400, detail="Username or email already exists")
-
-    # Create user
+    # Create user; the unique username and email columns reject duplicates
     organization_id = str(uuid.uuid4())
     hashed_pw = hash_password(password)
 
-    user = User(
-        username=username,
-        email=email,
-        password_hash=hashed_pw,
-        primary_organization_id=organization_id
-    )
-    db.add(user)
-    db.flush()
+    user = insert_unless_exists(db, User, {
+        "username": username,
+        "email": email,
+        "password_hash": hashed_pw,
+        "primary_organization_id": organization_id,
+        "created_at": datetime.utcnow()
+    })
+
+    if not user:
+        raise HTTPException(
+            status_code=400, detail="Username or email already exists")
 
     # Create organization
     org = Organization(
@@ -133,8 +245,10 @@ def register(
     )
     db.add(membership)
 
+    if NEW_ORG_SHARD != DEFAULT_SHARD:
+        db.add(OrganizationShard(organization_id=organization_id, shard=NEW_ORG_SHARD))
+
     db.commit()
-    db.refresh(user)
 
     token = create_session(user.id, organization_id, "admin")
 
@@ -143,8 +257,8 @@ def register(
         "token": token,
         "user": {
             "id": user.id,
-            "username": user.username,
-            "email": user.email,
+            "username": username,
+            "email": email,
             "role": "admin",
             "organization_id": organization_id
         }
@@ -157,23 +271,26 @@ def login(
     password: str = Form(...),
     db: Session = Depends(get_db)
 ):
-    user = db.query(User).filter(User.username == username).first()
+    user = db.scalars(statements.user_by_username, {"username": username}).first()
 
-    if not user or user.password_hash != hash_password(password):
+    valid = verify_password(password, user.password_hash if user else DUMMY_HASH)
+    if not user or not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
+    # Upgrade legacy SHA-256 hashes (or old KDF parameters) while we have
+    # the plaintext
+    if needs_rehash(user.password_hash):
+        user.password_hash = hash_password(password)
+        db.commit()
+
     # Get user's primary organization and role
-    membership = db.query(OrganizationMembership).filter(
-        OrganizationMembership.user_id == user.id,
-        OrganizationMembership.organization_id == user.primary_organization_id
-    ).first()
+    membership = db.scalars(statements.membership, {
+        "user_id": user.id, "organization_id": user.primary_organization_id}).first()
 
     # FIX: Handle case where membership doesn't exist
     if not membership:
         # Check if user has any memberships at all
-        any_membership = db.query(OrganizationMembership).filter(
-            OrganizationMembership.user_id == user.id
-        ).first()
+        any_membership = db.scalars(statements.any_membership, {"user_id": user.id}).first()
 
         if any_membership:
             # Use the first available membership
@@ -181,6 +298,7 @@ def login(
             # Update user's primary organization
             user.primary_organization_id = any_membership.organization_id
             db.commit()
+            invalidate(me_key(user.id))
         else:
             raise HTTPException(
                 status_code=500,
@@ -212,38 +330,49 @@ def logout(token: str = Form(...)):
 
 @app.get("/auth/me")
 def get_current_user_info(current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == current_user['user_id']).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
+    def load():
+        user = db.scalars(statements.user_by_id, {"user_id": current_user['user_id']}).first()
+        if not user:
+            return None
+
+        # Get all organizations user belongs to
+        memberships = db.query(OrganizationMembership, Organization).join(
+            Organization, OrganizationMembership.organization_id == Organization.id
+        ).filter(OrganizationMembership.user_id == user.id).all()
 
-    # Get all organizations user belongs to
-    memberships = db.query(OrganizationMembership, Organization).join(
-        Organization, OrganizationMembership.organization_id == Organization.id
-    ).filter(OrganizationMembership.user_id == user.id).all()
-
-    organizations = [
-        {
-            "id": org.id,
-            "name": org.name,
-            "role": membership.role,
-            "is_primary": org.id == user.primary_organization_id
+        return {
+            "id": user.id,
+            "username": user.username,
+            "email": user.email,
+            "organizations": [
+                {
+                    "id": org.id,
+                    "name": org.name,
+                    "role": membership.role,
+                    "is_primary": org.id == user.primary_organization_id
+                }
+                for membership, org in memberships
+            ]
         }
-        for membership, org in memberships
-    ]
 
+    user = get_or_load(me_key(current_user['user_id']), load)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    # Role and active organization come from the session, not the cache
     return {
-        "id": user.id,
-        "username": user.username,
-        "email": user.email,
+        "id": user["id"],
+        "username": user["username"],
+        "email": user["email"],
         "role": current_user['role'],
         "organization_id": current_user['organization_id'],
-        "organizations": organizations
+        "organizations": user["organizations"]
     }
 
 
 @app.delete("/auth/account")
-def delete_account(current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == current_user['user_id']).first()
+def delete_account(background: bool = False, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
+    user = db.scalars(statements.user_by_id, {"user_id": current_user['user_id']}).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -253,14 +382,31 @@ def delete_account(current_user: dict = Depends(get_current_user), db: Session =
         Organization.owner_id == user.id
     ).first()
 
+    affected_users = [user.id]
+    job = None
     if org:
-        # Delete all employees in this organization
-        db.query(Employee).filter(Employee.organization_id == org.id).delete()
-        # Delete all scores in this organization
-        db.query(WeeklyScore).filter(
-            WeeklyScore.organization_id == org.id).delete()
-        # Delete organization
-        db.delete(org)
+        affected_users += [
+            member_id for (member_id,) in db.query(OrganizationMembership.user_id).filter(
+                OrganizationMembership.organization_id == org.id)
+        ]
+
+    if org and background:
+        # Cut everyone off from the organization now and let a worker
+        # delete its employees and scores in batches
+        db.query(OrganizationMembership).filter(
+            OrganizationMembership.organization_id == org.id).delete()
+        org.owner_id = None
+        job = enqueue(db, "purge_organization", {},
+                      organization_id=org.id, user_id=user.id)
+    elif org:
+        # Scores and employees on the org's shard in batches, then every
+        # membership, the shard entry, the organization and its archive
+        tenant_db = tenant_session(org.id)
+        try:
+            purge_organization(tenant_db, org.id)
+        finally:
+            tenant_db.close()
+        db.expunge(org)
 
     # Delete all memberships
     db.query(OrganizationMembership).filter(
@@ -270,6 +416,10 @@ def delete_account(current_user: dict = Depends(get_current_user), db: Session =
     db.delete(user)
     db.commit()
 
+    invalidate(*(me_key(user_id) for user_id in set(affected_users)))
+    if org:
+        invalidate(members_key(org.id), employees_key(org.id))
+
     # Delete session
     token = None
     for t, s in sessions.items():
@@ -279,6 +429,8 @@ def delete_account(current_user: dict = Depends(get_current_user), db: Session =
     if token:
         del sessions[token]
 
+    if job:
+        return job_accepted(job)
     return {"message": "Account deleted successfully"}
 
 
@@ -291,10 +443,8 @@ def switch_organization(
     db: Session = Depends(get_db)
 ):
     # Check if user is member of this organization
-    membership = db.query(OrganizationMembership).filter(
-        OrganizationMembership.user_id == current_user['user_id'],
-        OrganizationMembership.organization_id == organization_id
-    ).first()
+    membership = db.scalars(statements.membership, {
+        "user_id": current_user['user_id'], "organization_id": organization_id}).first()
 
     if not membership:
         raise HTTPException(
@@ -315,6 +465,54 @@ def switch_organization(
     raise HTTPException(status_code=500, detail="Session not found")
 
 
+# ============= PROFILING =============
+
+@app.get("/profiles")
+def get_profiles(current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(
+            status_code=403, detail="Only admins can view profiles")
+
+    return list_profiles(current_user['organization_id'])
+
+
+@app.get("/profiles/{profile_id}")
+def download_profile(profile_id: str, current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(
+            status_code=403, detail="Only admins can view profiles")
+
+    meta, folded = load_profile(profile_id)
+    if not meta or meta['organization_id'] != current_user['organization_id']:
+        raise HTTPException(status_code=404, detail="Profile not found")
+
+    return PlainTextResponse(
+        folded,
+        headers={
+            "Content-Disposition": f"attachment; filename=profile_{profile_id}.folded"}
+    )
+
+
+# ============= CACHE =============
+
+@app.get("/cache/stats")
+def get_cache_stats(current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(
+            status_code=403, detail="Only admins can view cache stats")
+
+    return {**cache.stats(), "idempotency": idempotency_store.stats()}
+
+
+@app.get("/admission/stats")
+def get_admission_stats(current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(
+            status_code=403, detail="Only admins can view admission stats")
+
+    return concurrency.stats()
+
+
 # ============= EMPLOYEE ENDPOINTS =============
 
 @app.get("/")
@@ -323,31 +521,163 @@ def root():
 
 
 @app.get("/employees")
-def get_employees(current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    return db.query(Employee).filter(
-        Employee.organization_id == current_user['organization_id']
-    ).all()
+def get_employees(current_user: dict = Depends(get_current_user), db: Session = Depends(get_tenant_db)):
+    return get_or_load(employees_key(current_user['organization_id']), lambda: jsonable_encoder(
+        db.query(Employee).filter(
+            Employee.organization_id == current_user['organization_id']
+        ).all()
+    ))
+
+
+# /employees/bulk and /employees/search are declared before
+# /employees/{employee_id} so their paths are not read as ids
+@app.get("/employees/bulk")
+def export_employees(
+    format: str = "csv",
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_tenant_db)
+):
+    if format not in ROSTER_FORMATS:
+        raise HTTPException(
+            status_code=400, detail="format must be 'csv' or 'xlsx'")
+
+    rows = roster_rows(db, current_user['organization_id'])
+    headers = {"Content-Disposition": f"attachment; filename=employees.{format}"}
+    if format == "csv":
+        return StreamingResponse(stream_csv(rows), media_type=ROSTER_FORMATS["csv"], headers=headers)
+    with span("render.roster_xlsx"):
+        output = io.BytesIO(render_roster_xlsx(rows))
+    return StreamingResponse(output, media_type=ROSTER_FORMATS["xlsx"], headers=headers)
+
+
+@app.post("/employees/bulk")
+def import_employees(
+    file: UploadFile = File(...),
+    dry_run: bool = False,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_tenant_db)
+):
+    if current_user['role'] != 'admin':
+        raise HTTPException(
+            status_code=403, detail="Only admins can import employees")
+
+    org_id = current_user['organization_id']
+    try:
+        with span("roster.read"):
+            roster = read_roster(file.file, file_format(file.filename))
+        diff = diff_roster(db, org_id, roster)
+    except RosterError as e:
+        raise HTTPException(status_code=400, detail=e.errors)
+    except UnicodeDecodeError:
+        raise HTTPException(
+            status_code=400, detail="CSV files must be UTF-8 encoded")
+
+    if dry_run or not (diff["inserts"] or diff["updates"]):
+        return summarize(diff, dry_run)
+
+    try:
+        with span("roster.apply", inserts=len(diff["inserts"]), updates=len(diff["updates"])):
+            apply_diff(db, org_id, diff)
+    except IntegrityError:
+        # Another import added one of these external_ids in the meantime
+        db.rollback()
+        raise HTTPException(
+            status_code=409, detail="The roster changed during the import, try again")
+    invalidate(employees_key(org_id))
+    analytics.invalidate(org_id)
+    search_indexes.invalidate(org_id)
+    return summarize(diff, dry_run)
+
+
+@app.get("/employees/search")
+def search_employees_endpoint(
+    q: str,
+    limit: int = 20,
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_tenant_db)
+):
+    return search_employees(db, current_user['organization_id'], q, limit)
+
+
+def load_history(db, current_user, employee_ids, metric, from_week, to_week):
+    check_metric(metric)
+    found = set(db.scalars(statements.employee_ids_in_org, {
+        "organization_id": current_user['organization_id'], "employee_ids": employee_ids}))
+    missing = [employee_id for employee_id in employee_ids if employee_id not in found]
+    if missing:
+        raise HTTPException(
+            status_code=404, detail=f"Employee not found: {', '.join(map(str, missing))}")
+    return employee_history(db, current_user['organization_id'], employee_ids,
+                            metric, from_week, to_week)
+
+
+@app.get("/employees/history")
+def get_employee_histories(
+    ids: str,
+    metric: str = "productivity_score",
+    from_week: str = Query(None, alias="from"),
+    to_week: str = Query(None, alias="to"),
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_tenant_db)
+):
+    # ids is a comma-separated list, e.g. ?ids=12,15,31
+    try:
+        employee_ids = list(dict.fromkeys(int(i) for i in ids.split(",") if i.strip()))
+    except ValueError:
+        raise HTTPException(
+            status_code=400, detail="ids must be comma-separated employee ids")
+    if not 1 <= len(employee_ids) <= MAX_HISTORY_EMPLOYEES:
+        raise HTTPException(
+            status_code=400, detail=f"Pass between 1 and {MAX_HISTORY_EMPLOYEES} employee ids")
+
+    history = load_history(db, current_user, employee_ids, metric, from_week, to_week)
+    return {
+        "metric": metric,
+        "employees": [{"employee_id": employee_id, "weeks": weeks}
+                      for employee_id, weeks in history.items()]
+    }
+
+
+@app.get("/employees/{employee_id}/history")
+def get_employee_history(
+    employee_id: int,
+    metric: str = "productivity_score",
+    from_week: str = Query(None, alias="from"),
+    to_week: str = Query(None, alias="to"),
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_tenant_db)
+):
+    history = load_history(db, current_user, [employee_id], metric, from_week, to_week)
+    return {"employee_id": employee_id, "metric": metric, "weeks": history[employee_id]}
 
 
 @app.get("/employees/{employee_id}")
-def get_employee(employee_id: int, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    employee = db.query(Employee).filter(
-        Employee.id == employee_id,
-        Employee.organization_id == current_user['organization_id']
-    ).first()
+def get_employee(employee_id: int, current_user: dict = Depends(get_current_user), db: Session = Depends(get_tenant_db)):
+    employee = db.scalars(statements.employee, {
+        "employee_id": employee_id, "organization_id": current_user['organization_id']}).first()
 
     if not employee:
         raise HTTPException(status_code=404, detail="Employee not found")
     return employee
 
 
+def commit_employee(db, external_id):
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(
+            status_code=409, detail=f"Another employee already has external_id {external_id}")
+
+
 @app.post("/employees")
 def create_employee(
     name: str,
     department: str,
     role: str,
+    external_id: str = None,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_tenant_db)
 ):
     if current_user['role'] != 'admin':
         raise HTTPException(
@@ -357,11 +687,15 @@ def create_employee(
         name=name,
         department=department,
         role=role,
+        external_id=external_id or None,
         organization_id=current_user['organization_id']
     )
     db.add(employee)
-    db.commit()
+    commit_employee(db, external_id)
     db.refresh(employee)
+    invalidate(employees_key(current_user['organization_id']))
+    analytics.set_department(current_user['organization_id'], employee.id, employee.department)
+    search_indexes.changed(current_user['organization_id'], [employee.id])
     return employee
 
 
@@ -371,17 +705,16 @@ def update_employee(
     name: str = None,
     department: str = None,
     role: str = None,
+    external_id: str = None,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_tenant_db)
 ):
     if current_user['role'] != 'admin':
         raise HTTPException(
             status_code=403, detail="Only admins can update employees")
 
-    employee = db.query(Employee).filter(
-        Employee.id == employee_id,
-        Employee.organization_id == current_user['organization_id']
-    ).first()
+    employee = db.scalars(statements.employee, {
+        "employee_id": employee_id, "organization_id": current_user['organization_id']}).first()
 
     if not employee:
         raise HTTPException(status_code=404, detail="Employee not found")
@@ -392,9 +725,14 @@ def update_employee(
         employee.department = department
     if role:
         employee.role = role
+    if external_id:
+        employee.external_id = external_id
 
-    db.commit()
+    commit_employee(db, external_id)
     db.refresh(employee)
+    invalidate(employees_key(current_user['organization_id']))
+    analytics.set_department(current_user['organization_id'], employee.id, employee.department)
+    search_indexes.changed(current_user['organization_id'], [employee.id])
     return employee
 
 
@@ -402,16 +740,14 @@ def update_employee(
 def delete_employee(
     employee_id: int,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_tenant_db)
 ):
     if current_user['role'] != 'admin':
         raise HTTPException(
             status_code=403, detail="Only admins can delete employees")
 
-    employee = db.query(Employee).filter(
-        Employee.id == employee_id,
-        Employee.organization_id == current_user['organization_id']
-    ).first()
+    employee = db.scalars(statements.employee, {
+        "employee_id": employee_id, "organization_id": current_user['organization_id']}).first()
 
     if not employee:
         raise HTTPException(status_code=404, detail="Employee not found")
@@ -420,6 +756,11 @@ def delete_employee(
         WeeklyScore.employee_id == employee_id).delete()
     db.delete(employee)
     db.commit()
+    # and the employee's scores in weeks already moved to cold storage
+    delete_archived(current_user['organization_id'], employee_ids=[employee_id])
+    invalidate(employees_key(current_user['organization_id']))
+    analytics.invalidate(current_user['organization_id'])
+    search_indexes.changed(current_user['organization_id'], [employee_id])
     return {"message": "Employee deleted successfully"}
 
 
@@ -434,70 +775,183 @@ def add_weekly_score(
     professionalism: float,
     activity: float,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_tenant_db)
 ):
     if current_user['role'] != 'admin':
         raise HTTPException(
             status_code=403, detail="Only admins can add scores")
 
-    employee = db.query(Employee).filter(
-        Employee.id == employee_id,
-        Employee.organization_id == current_user['organization_id']
-    ).first()
-
-    if not employee:
-        raise HTTPException(status_code=404, detail="Employee not found")
-
     productivity = calculate_productivity(
         task_completion, speed, professionalism, activity
     )
 
-    score = WeeklyScore(
-        employee_id=employee_id,
-        week=week,
-        task_completion=task_completion,
-        speed=speed,
-        professionalism=professionalism,
-        activity=activity,
-        productivity_score=productivity,
-        organization_id=current_user['organization_id']
-    )
+    values = {
+        "employee_id": employee_id,
+        "week": week,
+        "task_completion": task_completion,
+        "speed": speed,
+        "professionalism": professionalism,
+        "activity": activity,
+        "productivity_score": productivity,
+        "organization_id": current_user['organization_id']
+    }
+
+    # INSERT ... SELECT FROM employees: the employee check and the insert
+    # are one statement, which returns the new id
+    row = insert_unless_exists(db, WeeklyScore, values, only_if=(
+        Employee, {"id": "employee_id", "organization_id": "organization_id"}))
+
+    if not row:
+        db.rollback()
+        employee = db.query(Employee.id).filter(
+            Employee.id == employee_id,
+            Employee.organization_id == current_user['organization_id']
+        ).first()
+        if not employee:
+            raise HTTPException(status_code=404, detail="Employee not found")
+        raise HTTPException(
+            status_code=400, detail=f"Employee already has a score for {week}")
 
-    db.add(score)
     db.commit()
-    db.refresh(score)
+    score = WeeklyScore(id=row.id, **values)
+    analytics.record_score(score)
     return score
 
 
+@app.post("/scores/recompute")
+def recompute_scores(current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(
+            status_code=403, detail="Only admins can recompute scores")
+
+    job = enqueue(db, "recompute_scores", {},
+                  organization_id=current_user['organization_id'],
+                  user_id=current_user['user_id'])
+    return job_accepted(job)
+
+
+@app.post("/scores/archive")
+def archive_scores(
+    before_week: str = Query(None, alias="before"),
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    if current_user['role'] != 'admin':
+        raise HTTPException(
+            status_code=403, detail="Only admins can archive scores")
+
+    try:
+        require_shared_store()
+    except ArchiveNotShared as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    # Defaults to the ARCHIVE_RETENTION_WEEKS window
+    job = enqueue(db, "archive_scores", {"before_week": before_week},
+                  organization_id=current_user['organization_id'],
+                  user_id=current_user['user_id'])
+    return job_accepted(job)
+
+
 @app.get("/scores")
-def get_scores(current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    return db.query(WeeklyScore).filter(
-        WeeklyScore.organization_id == current_user['organization_id']
-    ).all()
+def get_scores(
+    from_week: str = Query(None, alias="from"),
+    to_week: str = Query(None, alias="to"),
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_tenant_db)
+):
+    scores = db.scalars(statements.org_scores(from_week, to_week), {
+        "organization_id": current_user['organization_id'],
+        "from_week": from_week, "to_week": to_week}).all()
+    return merge_scores(scores, archived_scores(
+        current_user['organization_id'], from_week, to_week))
 
 
 @app.delete("/scores/{score_id}")
 def delete_score(
     score_id: int,
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_tenant_db)
 ):
     if current_user['role'] != 'admin':
         raise HTTPException(
             status_code=403, detail="Only admins can delete scores")
 
-    score = db.query(WeeklyScore).filter(
-        WeeklyScore.id == score_id,
-        WeeklyScore.organization_id == current_user['organization_id']
-    ).first()
+    score = db.scalars(statements.score, {
+        "score_id": score_id, "organization_id": current_user['organization_id']}).first()
 
     if not score:
+        if find_archived_score(current_user['organization_id'], score_id):
+            raise HTTPException(
+                status_code=409, detail="Score belongs to an archived week and is read-only")
         raise HTTPException(status_code=404, detail="Score not found")
 
     db.delete(score)
     db.commit()
+    analytics.remove_score(current_user['organization_id'], score_id)
     return {"message": "Score deleted successfully"}
 
+# ============= ANALYTICS =============
+
+def check_metric(metric):
+    if metric not in METRICS:
+        raise HTTPException(
+            status_code=400, detail=f"metric must be one of {', '.join(METRICS)}")
+
+
+@app.get("/analytics/moving-average")
+def get_moving_averages(
+    window: int = 4,
+    metric: str = "productivity_score",
+    employee_id: int = None,
+    from_week: str = Query(None, alias="from"),
+    to_week: str = Query(None, alias="to"),
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_tenant_db)
+):
+    check_metric(metric)
+    if not 1 <= window <= 52:
+        raise HTTPException(
+            status_code=400, detail="window must be between 1 and 52 weeks")
+
+    entry = analytics.get(db, current_user['organization_id'])
+    return moving_averages(entry, window, metric, employee_id, from_week, to_week)
+
+
+@app.get("/analytics/departments")
+def get_department_means(
+    metric: str = "productivity_score",
+    from_week: str = Query(None, alias="from"),
+    to_week: str = Query(None, alias="to"),
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_tenant_db)
+):
+    check_metric(metric)
+    entry = analytics.get(db, current_user['organization_id'])
+    return department_means(entry, metric, from_week, to_week)
+
+
+@app.get("/analytics/week-over-week")
+def get_week_over_week(
+    metric: str = "productivity_score",
+    from_week: str = Query(None, alias="from"),
+    to_week: str = Query(None, alias="to"),
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_tenant_db)
+):
+    check_metric(metric)
+    entry = analytics.get(db, current_user['organization_id'])
+    return week_over_week(entry, metric, from_week, to_week)
+
+
+@app.get("/analytics/stats")
+def get_analytics_stats(current_user: dict = Depends(get_current_user)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(
+            status_code=403, detail="Only admins can view analytics stats")
+
+    return analytics.stats()
+
+
 # ============= TEAM MANAGEMENT ENDPOINTS =============
 
 
@@ -507,21 +961,33 @@ def get_team_members(current_user: dict = Depends(get_current_user), db: Session
         raise HTTPException(
             status_code=403, detail="Only admins can view team members")
 
-    # Get all memberships for current organization
-    memberships = db.query(OrganizationMembership, User).join(
-        User, OrganizationMembership.user_id == User.id
-    ).filter(OrganizationMembership.organization_id == current_user['organization_id']).all()
+    def load():
+        # Get all memberships for current organization
+        memberships = db.query(OrganizationMembership, User).join(
+            User, OrganizationMembership.user_id == User.id
+        ).filter(OrganizationMembership.organization_id == current_user['organization_id']).all()
+
+        return jsonable_encoder([
+            {
+                "id": user.id,
+                "username": user.username,
+                "email": user.email,
+                "role": membership.role,
+                "created_at": user.created_at
+            }
+            for membership, user in memberships
+        ])
 
-    return [
-        {
-            "id": user.id,
-            "username": user.username,
-            "email": user.email,
-            "role": membership.role,
-            "created_at": user.created_at
-        }
-        for membership, user in memberships
-    ]
+    return get_or_load(members_key(current_user['organization_id']), load)
+
+
+def add_membership(db, user_id, organization_id, role):
+    return insert_unless_exists(db, OrganizationMembership, {
+        "user_id": user_id,
+        "organization_id": organization_id,
+        "role": role,
+        "joined_at": datetime.utcnow()
+    })
 
 
 @app.post("/team/invite")
@@ -536,7 +1002,7 @@ def invite_user_to_team(
             status_code=403, detail="Only admins can invite users")
 
     # Find user by username or email
-    user = db.query(User).filter(
+    user = db.query(User.id, User.username, User.email).filter(
         (User.username == username_or_email) | (
             User.email == username_or_email)
     ).first()
@@ -545,29 +1011,17 @@ def invite_user_to_team(
         raise HTTPException(
             status_code=404, detail="User not found. They need to register first.")
 
-    # Check if already a member
-    existing = db.query(OrganizationMembership).filter(
-        OrganizationMembership.user_id == user.id,
-        OrganizationMembership.organization_id == current_user['organization_id']
-    ).first()
-
-    if existing:
-        raise HTTPException(
-            status_code=400, detail="User is already a member of this organization")
-
     # Validate role
     if role not in ['admin', 'viewer']:
         raise HTTPException(status_code=400, detail="Invalid role")
 
-    # Create membership
-    membership = OrganizationMembership(
-        user_id=user.id,
-        organization_id=current_user['organization_id'],
-        role=role
-    )
+    # Create membership; at most one per user and organization
+    if not add_membership(db, user.id, current_user['organization_id'], role):
+        raise HTTPException(
+            status_code=400, detail="User is already a member of this organization")
 
-    db.add(membership)
     db.commit()
+    invalidate(members_key(current_user['organization_id']), me_key(user.id))
 
     return {
         "message": f"User {user.username} invited successfully",
@@ -593,30 +1047,32 @@ def create_team_member(
         raise HTTPException(
             status_code=403, detail="Only admins can add team members")
 
-    # Check if username/email exists
-    existing = db.query(User).filter(
-        (User.username == username) | (User.email == email)
-    ).first()
+    # Validate role
+    if role not in ['admin', 'viewer']:
+        raise HTTPException(status_code=400, detail="Invalid role")
 
-    if existing:
+    # Create new user without their own organization
+    hashed_pw = hash_password(password)
+    new_user = insert_unless_exists(db, User, {
+        "username": username,
+        "email": email,
+        "password_hash": hashed_pw,
+        "primary_organization_id": current_user['organization_id'],
+        "created_at": datetime.utcnow()
+    })
+
+    if not new_user:
         # User exists, invite them instead
-        existing_membership = db.query(OrganizationMembership).filter(
-            OrganizationMembership.user_id == existing.id,
-            OrganizationMembership.organization_id == current_user['organization_id']
+        existing = db.query(User.id, User.username, User.email).filter(
+            (User.username == username) | (User.email == email)
         ).first()
 
-        if existing_membership:
+        if not add_membership(db, existing.id, current_user['organization_id'], role):
             raise HTTPException(
                 status_code=400, detail="User is already a member of this organization")
 
-        # Add them to the organization
-        membership = OrganizationMembership(
-            user_id=existing.id,
-            organization_id=current_user['organization_id'],
-            role=role
-        )
-        db.add(membership)
         db.commit()
+        invalidate(members_key(current_user['organization_id']), me_key(existing.id))
 
         return {
             "id": existing.id,
@@ -626,22 +1082,6 @@ def create_team_member(
             "message": "Existing user added to organization"
         }
 
-    # Validate role
-    if role not in ['admin', 'viewer']:
-        raise HTTPException(status_code=400, detail="Invalid role")
-
-    # Create new user without their own organization
-    hashed_pw = hash_password(password)
-    new_user = User(
-        username=username,
-        email=email,
-        password_hash=hashed_pw,
-        primary_organization_id=current_user['organization_id']
-    )
-
-    db.add(new_user)
-    db.flush()
-
     # Add to current organization
     membership = OrganizationMembership(
         user_id=new_user.id,
@@ -651,12 +1091,12 @@ def create_team_member(
     db.add(membership)
 
     db.commit()
-    db.refresh(new_user)
+    invalidate(members_key(current_user['organization_id']))
 
     return {
         "id": new_user.id,
-        "username": new_user.username,
-        "email": new_user.email,
+        "username": username,
+        "email": email,
         "role": role
     }
 
@@ -675,10 +1115,8 @@ def remove_team_member(
         raise HTTPException(status_code=400, detail="Cannot remove yourself")
 
     # Remove membership
-    membership = db.query(OrganizationMembership).filter(
-        OrganizationMembership.user_id == user_id,
-        OrganizationMembership.organization_id == current_user['organization_id']
-    ).first()
+    membership = db.scalars(statements.membership, {
+        "user_id": user_id, "organization_id": current_user['organization_id']}).first()
 
     if not membership:
         raise HTTPException(
@@ -686,119 +1124,105 @@ def remove_team_member(
 
     db.delete(membership)
     db.commit()
+    invalidate(members_key(current_user['organization_id']), me_key(user_id))
 
     return {"message": "Team member removed successfully"}
 
 
 # ============= EXPORT ENDPOINTS =============
 
+
+@app.get("/export/bundle")
+def export_bundle(
+    from_week: str = Query(..., alias="from"),
+    to_week: str = Query(..., alias="to"),
+    formats: str = "xlsx,pdf",
+    layout: str = "weekly",
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_tenant_db)
+):
+    requested = [f.strip() for f in formats.split(",") if f.strip()]
+    if not requested or set(requested) - {"xlsx", "pdf"}:
+        raise HTTPException(
+            status_code=400, detail="formats must be a comma-separated list of xlsx, pdf")
+    if layout not in ("weekly", "workbook"):
+        raise HTTPException(
+            status_code=400, detail="layout must be 'weekly' or 'workbook'")
+    if from_week > to_week:
+        raise HTTPException(
+            status_code=400, detail="'from' must not be after 'to'")
+
+    # Counted before any rows are loaded, so a huge range is cheap to refuse
+    week_count = len(report_weeks(db, current_user['organization_id'], from_week, to_week))
+    if not week_count:
+        raise HTTPException(
+            status_code=404, detail=f"No scores found between {from_week} and {to_week}")
+    if week_count > MAX_BUNDLE_WEEKS:
+        raise HTTPException(
+            status_code=400, detail=f"A bundle can hold at most {MAX_BUNDLE_WEEKS} weeks")
+
+    weeks = range_report_rows(
+        db, current_user['organization_id'], from_week, to_week)
+
+    def members():
+        if "xlsx" in requested and layout == "workbook":
+            yield f"weekly_reports_{from_week}_{to_week}.xlsx", lambda: render_workbook(weeks)
+        for week, rows in weeks.items():
+            if "xlsx" in requested and layout == "weekly":
+                yield f"weekly_report_{week}.xlsx", lambda rows=rows, week=week: render_excel(week, rows)
+            if "pdf" in requested:
+                yield f"weekly_report_{week}.pdf", lambda rows=rows, week=week: render_pdf(week, rows)
+
+    return StreamingResponse(
+        stream_zip(members()),
+        media_type="application/zip",
+        headers={
+            "Content-Disposition": f"attachment; filename=weekly_reports_{from_week}_{to_week}.zip"}
+    )
+
+
 @app.get("/export/excel/{week}")
-def export_to_excel(week: str, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    scores = db.query(WeeklyScore).filter(
-        WeeklyScore.week == week,
-        WeeklyScore.organization_id == current_user['organization_id']
-    ).all()
+def export_to_excel(week: str, background: bool = False, current_user: dict = Depends(get_current_user), db: Session = Depends(get_tenant_db)):
+    if background:
+        return job_accepted(enqueue(
+            db, "export_excel", {"week": week},
+            organization_id=current_user['organization_id'],
+            user_id=current_user['user_id']))
 
-    if not scores:
+    rows = weekly_report_rows(db, current_user['organization_id'], week)
+
+    if not rows:
         raise HTTPException(
             status_code=404, detail=f"No scores found for week {week}")
 
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = f"Week {week}"
-
-    ws['A1'] = f'Weekly Productivity Report - {week}'
-    ws['A1'].font = Font(size=16, bold=True)
-    ws.merge_cells('A1:G1')
-
-    headers = ['Employee ID', 'Employee Name', 'Task', 'Speed',
-               'Professional', 'Activity', 'Productivity Score']
-    for col, header in enumerate(headers, start=1):
-        cell = ws.cell(row=3, column=col)
-        cell.value = header
-        cell.font = Font(bold=True)
-        cell.fill = PatternFill(start_color="4472C4",
-                                end_color="4472C4", fill_type="solid")
-        cell.alignment = Alignment(horizontal='center')
-
-    for row, score in enumerate(scores, start=4):
-        employee = db.query(Employee).filter(
-            Employee.id == score.employee_id).first()
-        ws.cell(row=row, column=1).value = score.employee_id
-        ws.cell(row=row, column=2).value = employee.name if employee else 'Unknown'
-        ws.cell(row=row, column=3).value = score.task_completion
-        ws.cell(row=row, column=4).value = score.speed
-        ws.cell(row=row, column=5).value = score.professionalism
-        ws.cell(row=row, column=6).value = score.activity
-        ws.cell(row=row, column=7).value = score.productivity_score
-        ws.cell(row=row, column=7).font = Font(bold=True)
-
-    for col in range(1, 8):
-        ws.column_dimensions[openpyxl.utils.get_column_letter(col)].width = 15
-
-    output = io.BytesIO()
-    wb.save(output)
-    output.seek(0)
+    with span("render.xlsx", rows=len(rows)):
+        output = io.BytesIO(render_excel(week, rows))
 
     return StreamingResponse(
         output,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        media_type=XLSX_MEDIA_TYPE,
         headers={
             "Content-Disposition": f"attachment; filename=weekly_report_{week}.xlsx"}
     )
 
 
 @app.get("/export/pdf/{week}")
-def export_to_pdf(week: str, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
-    scores = db.query(WeeklyScore).filter(
-        WeeklyScore.week == week,
-        WeeklyScore.organization_id == current_user['organization_id']
-    ).all()
+def export_to_pdf(week: str, background: bool = False, current_user: dict = Depends(get_current_user), db: Session = Depends(get_tenant_db)):
+    if background:
+        return job_accepted(enqueue(
+            db, "export_pdf", {"week": week},
+            organization_id=current_user['organization_id'],
+            user_id=current_user['user_id']))
 
-    if not scores:
+    rows = weekly_report_rows(db, current_user['organization_id'], week)
+
+    if not rows:
         raise HTTPException(
             status_code=404, detail=f"No scores found for week {week}")
 
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    elements = []
-    styles = getSampleStyleSheet()
-
-    title = Paragraph(
-        f"<b>Weekly Productivity Report - {week}</b>", styles['Title'])
-    elements.append(title)
-    elements.append(Spacer(1, 0.3*inch))
-
-    data = [['Employee', 'Task', 'Speed', 'Prof.', 'Activity', 'Score']]
-
-    for score in scores:
-        employee = db.query(Employee).filter(
-            Employee.id == score.employee_id).first()
-        data.append([
-            employee.name if employee else 'Unknown',
-            str(score.task_completion),
-            str(score.speed),
-            str(score.professionalism),
-            str(score.activity),
-            str(score.productivity_score)
-        ])
+    with span("render.pdf", rows=len(rows)):
+        buffer = io.BytesIO(render_pdf(week, rows))
 
-    table = Table(data)
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 12),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black)
-    ]))
-
-    elements.append(table)
-    doc.build(elements)
-
-    buffer.seek(0)
     return StreamingResponse(
         buffer,
         media_type="application/pdf",
@@ -815,73 +1239,103 @@ def email_report(
     smtp_port: int = Form(587),
     sender_email: str = Form(...),
     sender_password: str = Form(...),
+    background: bool = Form(False),
     current_user: dict = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_tenant_db)
 ):
+    if background:
+        # Queued sends go through the server's own SMTP account, so the
+        # caller's password is never written to the jobs table
+        if not DIGEST_SENDER_EMAIL:
+            raise HTTPException(
+                status_code=400, detail="Background sending is not configured on this server")
+        return job_accepted(enqueue(
+            db, "email_report",
+            {"week": week, "recipient_email": recipient_email, "reply_to": sender_email},
+            organization_id=current_user['organization_id'],
+            user_id=current_user['user_id']))
+
     try:
-        scores = db.query(WeeklyScore).filter(
-            WeeklyScore.week == week,
-            WeeklyScore.organization_id == current_user['organization_id']
-        ).all()
+        rows = weekly_report_rows(db, current_user['organization_id'], week)
 
-        if not scores:
+        if not rows:
             raise HTTPException(
                 status_code=404, detail=f"No scores for week {week}")
 
-        msg = MIMEMultipart()
-        msg['From'] = sender_email
-        msg['To'] = recipient_email
-        msg['Subject'] = f'Weekly Productivity Report - {week}'
-
-        body = f"""
-        <html>
-        <body>
-        <h2>Weekly Productivity Report - {week}</h2>
-        <p>Please find the weekly productivity report attached.</p>
-        <br>
-        <table border="1" cellpadding="5">
-        <tr style="background-color: #4472C4; color: white;">
-            <th>Employee</th>
-            <th>Task</th>
-            <th>Speed</th>
-            <th>Professional</th>
-            <th>Activity</th>
-            <th>Score</th>
-        </tr>
-        """
-
-        for score in scores:
-            employee = db.query(Employee).filter(
-                Employee.id == score.employee_id).first()
-            body += f"""
-            <tr>
-                <td>{employee.name if employee else 'Unknown'}</td>
-                <td>{score.task_completion}</td>
-                <td>{score.speed}</td>
-                <td>{score.professionalism}</td>
-                <td>{score.activity}</td>
-                <td><b>{score.productivity_score}</b></td>
-            </tr>
-            """
-
-        body += """
-        </table>
-        <br>
-        <p>Best regards,<br>Productivity Tracker System</p>
-        </body>
-        </html>
-        """
-
-        msg.attach(MIMEText(body, 'html'))
-
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(sender_email, sender_password)
-        server.send_message(msg)
-        server.quit()
+        msg = build_report_message(week, rows, sender_email, recipient_email)
+        send_message(msg, smtp_server, smtp_port, sender_email, sender_password)
 
         return {"message": f"Report emailed successfully to {recipient_email}"}
 
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Error sending email: {str(e)}")
+
+
+# ============= BACKGROUND JOBS =============
+
+def get_visible_job(job_id, current_user, db):
+    job = db.query(Job).filter(
+        Job.id == job_id,
+        Job.organization_id == current_user['organization_id']
+    ).first()
+
+    # Admins see every job in their organization, others only their own
+    if not job or (current_user['role'] != 'admin' and job.user_id != current_user['user_id']):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/jobs")
+def get_jobs(limit: int = 50, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
+    query = db.query(Job).filter(
+        Job.organization_id == current_user['organization_id'])
+    if current_user['role'] != 'admin':
+        query = query.filter(Job.user_id == current_user['user_id'])
+
+    jobs = query.order_by(Job.created_at.desc()).limit(min(limit, 200)).all()
+    return [job_to_dict(job) for job in jobs]
+
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
+    job = get_visible_job(job_id, current_user, db)
+    return job_to_dict(job)
+
+
+@app.get("/jobs/{job_id}/result")
+def get_job_result(job_id: str, current_user: dict = Depends(get_current_user), db: Session = Depends(get_db)):
+    job = get_visible_job(job_id, current_user, db)
+
+    if job.status != "succeeded" or job.result is None:
+        raise HTTPException(
+            status_code=409, detail=f"Job has no result yet (status: {job.status})")
+
+    headers = {}
+    if job.result_name:
+        headers["Content-Disposition"] = f"attachment; filename={job.result_name}"
+    return StreamingResponse(
+        io.BytesIO(job.result),
+        media_type=job.result_media_type,
+        headers=headers
+    )
+
+
+# ============= BATCH =============
+
+@app.post("/batch")
+def batch(requests: list[dict] = Body(..., embed=True), current_user: dict = Depends(get_current_user)):
+    if not requests:
+        raise HTTPException(status_code=400, detail="No requests in batch")
+    if len(requests) > MAX_BATCH_ITEMS:
+        raise HTTPException(
+            status_code=400, detail=f"At most {MAX_BATCH_ITEMS} requests per batch")
+
+    # A tenant session also reaches the directory tables, so every item
+    # shares one session and one identity map
+    db = tenant_session(current_user['organization_id'], writable=False)
+    try:
+        responses = run_batch(app.routes, requests, {get_db: db, get_tenant_db: db}, current_user)
+    finally:
+        db.close()
+    return {"responses": responses}
@@ -0,0 +1,361 @@
+from sqlalchemy import select, delete, distinct
+from database import SessionLocal, tenant_session
+from models import Employee, WeeklyScore, Organization
+from tracing import span
+from get_current_week import week_label
+from array import array
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import lru_cache
+import argparse
+import fcntl
+import json
+import math
+import os
+import re
+import shutil
+import struct
+import sys
+import zlib
+
+# Cold storage for old weeks of weekly_scores.
+#   python archive.py run [--org ORG_ID]     (or POST /scores/archive)
+#   python archive.py status
+# Weeks older than ARCHIVE_RETENTION_WEEKS are moved out of the hot table
+# into one file per organization and week, ARCHIVE_DIR/<org>/<week>.wsa.
+# A file is columnar: a small JSON header followed by one zlib-compressed
+# array per column, so reading a week is one sequential read. The score
+# read paths and reports merge archived rows back in; a row present in both
+# places (an archival run that stopped between writing the file and
+# deleting the rows) is read from the hot table. Deleting employees or
+# scores also removes their archived rows (delete_archived).
+#
+# The web process reads the files and worker.py writes them, so ARCHIVE_DIR
+# must be one directory shared by both (a mounted volume), set explicitly.
+# The web app checks it at startup and leaves a marker file in it; an
+# archival run refuses to delete hot rows unless it finds that marker in
+# its own ARCHIVE_DIR, since otherwise it would move weeks somewhere the
+# API never reads.
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+ARCHIVE_DIR_CONFIGURED = "ARCHIVE_DIR" in os.environ
+STORE_MARKER = ".web-store"
+ARCHIVE_RETENTION_WEEKS = int(os.getenv("ARCHIVE_RETENTION_WEEKS", "26"))
+
+MAGIC = b"WSA1"
+NULL_ID = -1
+# (column, array typecode); week and organization_id come from the path
+COLUMNS = [
+    ("id", "q"),
+    ("employee_id", "q"),
+    ("task_completion", "d"),
+    ("speed", "d"),
+    ("professionalism", "d"),
+    ("activity", "d"),
+    ("productivity_score", "d"),
+]
+WEEK_FILE = re.compile(r"^(\d{4}-W\d{2})\.wsa$")
+
+
+class ArchiveNotShared(Exception):
+    pass
+
+
+def open_store():
+    # Called by the web app at startup. A configured ARCHIVE_DIR has to
+    # exist already: creating it would hide a volume that is not mounted.
+    if not ARCHIVE_DIR_CONFIGURED:
+        return
+    if not os.path.isdir(ARCHIVE_DIR) or not os.access(ARCHIVE_DIR, os.W_OK):
+        raise RuntimeError(f"ARCHIVE_DIR {ARCHIVE_DIR} is not a writable directory; "
+                           f"mount the shared archive volume there")
+    marker = os.path.join(ARCHIVE_DIR, STORE_MARKER)
+    if not os.path.exists(marker):
+        with open(marker, "w") as f:
+            f.write(f"{datetime.utcnow().isoformat()}\n")
+
+
+def require_shared_store():
+    if not ARCHIVE_DIR_CONFIGURED:
+        raise ArchiveNotShared(
+            "ARCHIVE_DIR is not set; archiving needs a directory shared by the web and worker processes")
+    if not os.path.exists(os.path.join(ARCHIVE_DIR, STORE_MARKER)):
+        raise ArchiveNotShared(
+            f"ARCHIVE_DIR {ARCHIVE_DIR} has not been opened by the web app ({STORE_MARKER} is "
+            f"missing), so it is not the directory the API reads from")
+
+
+def cutoff_week(retention_weeks=ARCHIVE_RETENTION_WEEKS):
+    # Weeks strictly before this label are archived
+    return week_label(datetime.now() - timedelta(weeks=retention_weeks))
+
+
+def org_dir(organization_id):
+    if not organization_id or "/" in organization_id or organization_id.startswith("."):
+        raise ValueError(f"Bad organization id: {organization_id!r}")
+    return os.path.join(ARCHIVE_DIR, organization_id)
+
+
+def week_path(organization_id, week):
+    return os.path.join(org_dir(organization_id), f"{week}.wsa")
+
+
+def _encode(value, typecode):
+    if value is None:
+        return NULL_ID if typecode == "q" else math.nan
+    return value
+
+
+def _decode(value, typecode):
+    if typecode == "q":
+        return None if value == NULL_ID else value
+    return None if math.isnan(value) else value
+
+
+def write_week(organization_id, week, scores):
+    # Atomic replace, so readers see the old file or the new one
+    blocks = []
+    header = {"week": week, "organization_id": organization_id,
+              "rows": len(scores), "columns": []}
+    for name, typecode in COLUMNS:
+        column = array(typecode, (_encode(getattr(s, name), typecode) for s in scores))
+        block = zlib.compress(column.tobytes(), 6)
+        header["columns"].append({"name": name, "type": typecode, "length": len(block)})
+        blocks.append(block)
+
+    path = week_path(organization_id, week)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    raw_header = json.dumps(header).encode()
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC + struct.pack("<I", len(raw_header)) + raw_header)
+        for block in blocks:
+            f.write(block)
+    os.replace(tmp, path)
+
+
+@lru_cache(maxsize=256)
+def _read_columns(path, mtime_ns, size, only=None):
+    # Keyed on mtime and size so a rewritten file is never served stale
+    with open(path, "rb") as f:
+        if f.read(4) != MAGIC:
+            raise ValueError(f"{path} is not a score archive")
+        (header_length,) = struct.unpack("<I", f.read(4))
+        header = json.loads(f.read(header_length))
+        columns = {}
+        for column in header["columns"]:
+            block = f.read(column["length"])
+            if only and column["name"] not in only:
+                continue
+            values = array(column["type"])
+            values.frombytes(zlib.decompress(block))
+            columns[column["name"]] = [_decode(v, column["type"]) for v in values]
+    return header["rows"], columns
+
+
+def read_columns(path, only=None):
+    stat = os.stat(path)
+    return _read_columns(path, stat.st_mtime_ns, stat.st_size, only)
+
+
+def read_week(organization_id, week):
+    path = week_path(organization_id, week)
+    if not os.path.exists(path):
+        return []
+    with span("archive.read", week=week):
+        rows, columns = read_columns(path)
+    return [_score(organization_id, week, columns, i) for i in range(rows)]
+
+
+def _score(organization_id, week, columns, i):
+    # Detached WeeklyScore objects so callers can treat them like rows
+    # from the hot table
+    return WeeklyScore(week=week, organization_id=organization_id,
+                       **{name: columns[name][i] for name, _ in COLUMNS})
+
+
+def archived_weeks(organization_id, from_week=None, to_week=None):
+    directory = org_dir(organization_id)
+    if not os.path.isdir(directory):
+        return []
+    weeks = []
+    for filename in os.listdir(directory):
+        match = WEEK_FILE.match(filename)
+        if not match:
+            continue
+        week = match.group(1)
+        if (from_week and week < from_week) or (to_week and week > to_week):
+            continue
+        weeks.append(week)
+    return sorted(weeks)
+
+
+def archived_scores(organization_id, from_week=None, to_week=None):
+    scores = []
+    for week in archived_weeks(organization_id, from_week, to_week):
+        scores.extend(read_week(organization_id, week))
+    return scores
+
+
+def archived_scores_of(organization_id, employee_ids):
+    # archived_scores for some employees only; rows are picked on the
+    # decoded employee_id column, so only theirs become objects
+    wanted = set(employee_ids)
+    scores = []
+    for week in archived_weeks(organization_id):
+        with span("archive.read", week=week):
+            _, columns = read_columns(week_path(organization_id, week))
+        scores.extend(_score(organization_id, week, columns, i)
+                      for i, employee_id in enumerate(columns["employee_id"]) if employee_id in wanted)
+    return scores
+
+
+def find_archived_score(organization_id, score_id):
+    # Week holding an archived score id, reading only the id column
+    for week in archived_weeks(organization_id):
+        _, columns = read_columns(week_path(organization_id, week), only=("id",))
+        if score_id in columns["id"]:
+            return week
+    return None
+
+
+def merge_scores(hot_scores, archived):
+    hot_ids = {score.id for score in hot_scores}
+    return list(hot_scores) + [score for score in archived if score.id not in hot_ids]
+
+
+def merge_report_rows(db, hot_rows, archived):
+    # (score, employee_name) rows for reports; archived scores get their
+    # employee names with one lookup
+    hot_ids = {score.id for score, _ in hot_rows}
+    extra = [score for score in archived if score.id not in hot_ids]
+    if not extra:
+        return hot_rows
+    employee_ids = {score.employee_id for score in extra if score.employee_id is not None}
+    names = dict(db.execute(
+        select(Employee.id, Employee.name).where(Employee.id.in_(employee_ids))
+    ).all()) if employee_ids else {}
+    rows = list(hot_rows) + [(score, names.get(score.employee_id)) for score in extra]
+    rows.sort(key=lambda row: (row[0].week, row[0].id))
+    return rows
+
+
+def delete_archived(organization_id, employee_ids=None, from_week=None, to_week=None):
+    # Removes archived scores in the week range, only those of employee_ids
+    # if given, so deleted data is not merged back in by the read paths.
+    # Each affected week file is rewritten; an emptied one is removed.
+    weeks = archived_weeks(organization_id, from_week, to_week)
+    if not weeks:
+        return 0
+    employee_ids = None if employee_ids is None else set(employee_ids)
+    removed = 0
+    with org_lock(organization_id):
+        for week in weeks:
+            scores = read_week(organization_id, week)
+            kept = [] if employee_ids is None else [
+                score for score in scores if score.employee_id not in employee_ids]
+            if len(kept) == len(scores):
+                continue
+            if kept:
+                write_week(organization_id, week, kept)
+            else:
+                os.remove(week_path(organization_id, week))
+            removed += len(scores) - len(kept)
+    return removed
+
+
+def delete_organization(organization_id):
+    shutil.rmtree(org_dir(organization_id), ignore_errors=True)
+
+
+@contextmanager
+def org_lock(organization_id):
+    # One archival run per organization at a time, across processes
+    directory = org_dir(organization_id)
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, ".lock"), "w") as handle:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def archive_organization(db, organization_id, before_week=None, progress=None):
+    # Moves every week before `before_week` out of the hot table. Each week
+    # is written to disk before its rows are deleted, one week per commit.
+    require_shared_store()
+    before_week = before_week or cutoff_week()
+    weeks = sorted(db.execute(select(distinct(WeeklyScore.week)).where(
+        WeeklyScore.organization_id == organization_id,
+        WeeklyScore.week < before_week
+    )).scalars().all())
+
+    moved = 0
+    with org_lock(organization_id):
+        for done, week in enumerate(weeks, start=1):
+            hot = db.query(WeeklyScore).filter(
+                WeeklyScore.organization_id == organization_id,
+                WeeklyScore.week == week
+            ).order_by(WeeklyScore.id).all()
+            merged = sorted(merge_scores(hot, read_week(organization_id, week)),
+                            key=lambda score: score.id)
+            write_week(organization_id, week, merged)
+            db.execute(delete(WeeklyScore).where(
+                WeeklyScore.organization_id == organization_id,
+                WeeklyScore.week == week,
+                WeeklyScore.id.in_([score.id for score in hot])))
+            db.commit()
+            moved += len(hot)
+            if progress:
+                progress(done / len(weeks), f"{week}: {len(hot)} scores archived")
+    return {"weeks": len(weeks), "scores": moved, "before_week": before_week}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score archive")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run_parser = sub.add_parser("run", help="archive weeks past the retention window")
+    run_parser.add_argument("--org", default=None, help="only this organization")
+    run_parser.add_argument("--before", default=None, help="archive weeks before this label")
+    sub.add_parser("status", help="archived weeks and size per organization")
+    args = parser.parse_args()
+
+    if args.command == "status":
+        if not os.path.isdir(ARCHIVE_DIR):
+            print(f"📭 Nothing archived in {ARCHIVE_DIR}")
+            return
+        for organization_id in sorted(os.listdir(ARCHIVE_DIR)):
+            if organization_id.startswith("."):
+                continue
+            weeks = archived_weeks(organization_id)
+            size = sum(os.path.getsize(week_path(organization_id, w)) for w in weeks)
+            span_text = f"{weeks[0]} .. {weeks[-1]}" if weeks else "-"
+            print(f"  {organization_id}  {len(weeks):>4} weeks  {size / 1024:>8.1f} KiB  {span_text}")
+        return
+
+    try:
+        require_shared_store()
+    except ArchiveNotShared as e:
+        sys.exit(f"❌ {e}")
+
+    directory = SessionLocal()
+    try:
+        org_ids = [args.org] if args.org else [
+            org_id for (org_id,) in directory.query(Organization.id)]
+    finally:
+        directory.close()
+
+    print(f"🧊 Archiving weeks before {args.before or cutoff_week()} into {ARCHIVE_DIR}")
+    for organization_id in org_ids:
+        db = tenant_session(organization_id)
+        try:
+            result = archive_organization(db, organization_id, args.before)
+        finally:
+            db.close()
+        if result["scores"]:
+            print(f"  {organization_id}: {result['scores']} scores from {result['weeks']} weeks")
+    print("✅ Done")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+from fastapi import HTTPException, Request, params
+from fastapi.encoders import jsonable_encoder
+from fastapi.params import Depends as DependsParam
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.routing import APIRoute
+from pydantic import TypeAdapter, ValidationError
+from pydantic_core import PydanticUndefined
+from starlette.routing import Match
+from tracing import span
+from functools import lru_cache
+from urllib.parse import urlsplit, parse_qsl
+import inspect
+import json
+
+# POST /batch runs several GET routes for one authenticated user in one
+# request, e.g. everything a dashboard needs for its first paint:
+#   {"requests": [{"id": "me", "path": "/auth/me"},
+#                 {"id": "scores", "path": "/scores?from=2026-W01"}]}
+# The token is verified once and every item reuses the same directory and
+# tenant sessions, so rows loaded by one item are in the identity map for
+# the next. A session cannot be used from two threads at once, so items
+# run one after another, in order. Each item gets its own status code;
+# one failing item does not fail the batch.
+MAX_BATCH_ITEMS = 20
+
+
+class BatchItemError(Exception):
+    def __init__(self, status_code, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+@lru_cache(maxsize=None)
+def adapter(annotation):
+    return TypeAdapter(annotation)
+
+
+def find_route(routes, path):
+    scope = {"type": "http", "path": path, "method": "GET"}
+    allowed = False
+    for route in routes:
+        if not isinstance(route, APIRoute):
+            continue
+        match, child_scope = route.matches(scope)
+        if match == Match.FULL:
+            return route, child_scope["path_params"]
+        allowed = allowed or match == Match.PARTIAL
+    if allowed:
+        raise BatchItemError(405, "Only GET routes can be batched")
+    raise BatchItemError(404, "Not Found")
+
+
+def build_arguments(route, path_params, query, sessions, current_user):
+    # Fills the handler's parameters the way FastAPI would for a GET:
+    # path and query values validated against the annotations, the shared
+    # sessions for database dependencies and the caller for current_user
+    arguments, errors = {}, []
+    for name, parameter in inspect.signature(route.endpoint).parameters.items():
+        default = parameter.default
+        if isinstance(default, DependsParam):
+            if default.dependency not in sessions and name != "current_user":
+                raise BatchItemError(400, f"{route.path} cannot be batched")
+            arguments[name] = current_user if name == "current_user" else sessions[default.dependency]
+            continue
+        if parameter.annotation is Request or isinstance(default, (params.Header, params.Cookie, params.Body)):
+            raise BatchItemError(400, f"{route.path} cannot be batched")
+
+        alias = getattr(default, "alias", None) or name
+        if hasattr(default, "default"):
+            default = default.default
+        location = "path" if name in path_params else "query"
+        if name in path_params:
+            raw = path_params[name]
+        elif alias in query:
+            raw = query[alias]
+        elif default is PydanticUndefined or default is inspect.Parameter.empty or default is Ellipsis:
+            errors.append({"loc": [location, alias], "msg": "Field required"})
+            continue
+        else:
+            arguments[name] = default
+            continue
+
+        annotation = parameter.annotation
+        if annotation is inspect.Parameter.empty:
+            arguments[name] = raw
+            continue
+        try:
+            arguments[name] = adapter(annotation).validate_python(raw)
+        except ValidationError as e:
+            errors.append({"loc": [location, alias], "msg": e.errors()[0]["msg"]})
+    if errors:
+        raise BatchItemError(422, errors)
+    return arguments
+
+
+def run_item(routes, item, sessions, current_user):
+    target = urlsplit(item.get("path") or "")
+    if item.get("method", "GET").upper() != "GET":
+        raise BatchItemError(405, "Only GET routes can be batched")
+    route, path_params = find_route(routes, target.path)
+    query = dict(parse_qsl(target.query))
+    arguments = build_arguments(route, path_params, query, sessions, current_user)
+
+    with span("batch.item", route=route.path):
+        result = route.endpoint(**arguments)
+
+    if isinstance(result, StreamingResponse):
+        raise BatchItemError(400, f"{route.path} streams a file and cannot be batched")
+    if isinstance(result, JSONResponse):
+        return result.status_code, json.loads(result.body)
+    return 200, jsonable_encoder(result)
+
+
+def run_batch(routes, items, sessions, current_user):
+    responses = []
+    for index, item in enumerate(items):
+        item_id = item.get("id", index)
+        try:
+            status, body = run_item(routes, item, sessions, current_user)
+        except (BatchItemError, HTTPException) as e:
+            status, body = e.status_code, {"detail": e.detail}
+        except Exception:
+            # Leave the shared sessions usable for the remaining items
+            for session in sessions.values():
+                session.rollback()
+            status, body = 500, {"detail": "Internal Server Error"}
+        responses.append({"id": item_id, "status": status, "body": body})
+    return responses
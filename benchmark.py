@@ -0,0 +1,452 @@
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from database import Base, insert_unless_exists
+from models import Employee, WeeklyScore, Organization
+import statements
+from scoring import calculate_productivity
+from passwords import hash_password, verify_password, HASH_WORKERS
+from reports import render_excel, render_pdf
+from mailer import render_report_html
+from analytics import OrgScores, METRICS, moving_averages, department_means, week_over_week
+from search import OrgIndex
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import argparse
+import hashlib
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# Micro-benchmarks for the pieces we keep touching. Everything runs on
+# in-memory fixtures, no database or network; only `writes` needs a
+# database (a throwaway SQLite file unless --database-url is given), and
+# so does `lookups`.
+#   python benchmark.py run --output baseline.json
+#   python benchmark.py run --output current.json
+#   python benchmark.py compare baseline.json current.json --threshold 10
+#   python benchmark.py logins --seconds 5
+#   python benchmark.py writes --seconds 5
+#   python benchmark.py lookups --seconds 2
+
+BENCHMARKS = []
+ROW_COUNTS = [10, 100, 1000]
+
+
+def benchmark(name, number=1, repeat=5):
+    # The decorated function does its setup and returns the callable to time
+    def register(setup):
+        BENCHMARKS.append({"name": name, "setup": setup,
+                           "number": number, "repeat": repeat})
+        return setup
+    return register
+
+
+def make_employees(count, seed=1):
+    rng = random.Random(seed)
+    return [
+        Employee(id=i, name=f"Employee {i}", department=rng.choice(["Engineering", "Design", "Sales"]),
+                 role="Developer", organization_id="bench-org")
+        for i in range(1, count + 1)
+    ]
+
+
+def make_scores(count, seed=1):
+    rng = random.Random(seed)
+    scores = []
+    for i in range(1, count + 1):
+        task, speed, prof, activity = (rng.uniform(40, 100) for _ in range(4))
+        scores.append(WeeklyScore(
+            id=i, employee_id=i, week="2026-W01", task_completion=round(task, 1),
+            speed=round(speed, 1), professionalism=round(prof, 1), activity=round(activity, 1),
+            productivity_score=calculate_productivity(task, speed, prof, activity),
+            organization_id="bench-org"))
+    return scores
+
+
+def make_report_rows(count):
+    return [(score, f"Employee {score.employee_id}") for score in make_scores(count)]
+
+
+@benchmark("scoring.calculate_productivity", number=100000)
+def bench_calculate_productivity():
+    return lambda: calculate_productivity(82.5, 71.0, 90.0, 64.5)
+
+
+@benchmark("passwords.hash_password", number=10)
+def bench_hash_password():
+    return lambda: hash_password("correct horse battery staple")
+
+
+@benchmark("passwords.verify_password[legacy]", number=10000)
+def bench_verify_legacy():
+    stored = hashlib.sha256(b"correct horse battery staple").hexdigest()
+    return lambda: verify_password("correct horse battery staple", stored)
+
+
+for _rows in ROW_COUNTS:
+    @benchmark(f"serialize.employees[{_rows}]", number=max(1, 1000 // _rows))
+    def bench_serialize_employees(rows=_rows):
+        employees = make_employees(rows)
+        return lambda: json.dumps(jsonable_encoder(employees))
+
+    @benchmark(f"serialize.weekly_scores[{_rows}]", number=max(1, 1000 // _rows))
+    def bench_serialize_scores(rows=_rows):
+        scores = make_scores(rows)
+        return lambda: json.dumps(jsonable_encoder(scores))
+
+    @benchmark(f"render.xlsx[{_rows}]", number=max(1, 100 // _rows), repeat=3)
+    def bench_render_excel(rows=_rows):
+        report_rows = make_report_rows(rows)
+        return lambda: render_excel("2026-W01", report_rows)
+
+    @benchmark(f"render.pdf[{_rows}]", number=max(1, 100 // _rows), repeat=3)
+    def bench_render_pdf(rows=_rows):
+        report_rows = make_report_rows(rows)
+        return lambda: render_pdf("2026-W01", report_rows)
+
+    @benchmark(f"render.html[{_rows}]", number=max(1, 10000 // _rows))
+    def bench_render_html(rows=_rows):
+        report_rows = make_report_rows(rows)
+        return lambda: render_report_html("Weekly Productivity Report - 2026-W01", "", report_rows)
+
+
+def make_org_scores(employees, weeks, seed=1):
+    rng = random.Random(seed)
+    rows = [(e * weeks + w, e, 202600 + w) for e in range(1, employees + 1) for w in range(weeks)]
+    return OrgScores(
+        ids=[r[0] for r in rows], employee_ids=[r[1] for r in rows], weeks=[r[2] for r in rows],
+        metrics={name: [rng.uniform(40, 100) for _ in rows] for name in METRICS},
+        departments={e: rng.choice(["Engineering", "Design", "Sales"]) for e in range(1, employees + 1)},
+        version="bench")
+
+
+# 500 employees x 52 weeks
+@benchmark("analytics.moving_average[26000]", number=5)
+def bench_moving_average():
+    entry = make_org_scores(500, 52)
+    return lambda: moving_averages(entry, 4)
+
+
+@benchmark("analytics.department_means[26000]", number=20)
+def bench_department_means():
+    entry = make_org_scores(500, 52)
+    return lambda: department_means(entry)
+
+
+@benchmark("analytics.week_over_week[26000]", number=20)
+def bench_week_over_week():
+    entry = make_org_scores(500, 52)
+    return lambda: week_over_week(entry)
+
+
+def make_search_index(count, seed=1):
+    rng = random.Random(seed)
+    first = ["Riya", "Arjun", "Meera", "Kabir", "Anaya", "Vikram", "Sara", "Dev"]
+    last = ["Shah", "Patel", "Iyer", "Khan", "Rao", "Menon", "Das", "Gupta"]
+    roles = ["Backend Developer", "Frontend Developer", "Designer", "Account Executive"]
+    rows = [(i, f"{rng.choice(first)} {rng.choice(last)} {i}",
+             rng.choice(["Engineering", "Design", "Sales"]), rng.choice(roles))
+            for i in range(1, count + 1)]
+    return OrgIndex(rows, "bench")
+
+
+@benchmark("search.build[10000]", number=1, repeat=3)
+def bench_search_build():
+    index = make_search_index(10000)
+    return lambda: OrgIndex(index.employees, "bench")
+
+
+@benchmark("search.prefix[10000]", number=100)
+def bench_search_prefix():
+    index = make_search_index(10000)
+    return lambda: index.search("riya sh", 20)
+
+
+@benchmark("search.fuzzy[10000]", number=20)
+def bench_search_fuzzy():
+    index = make_search_index(10000)
+    return lambda: index.search("devloper", 20)
+
+
+def run_benchmark(spec):
+    fn = spec["setup"]()
+    fn()  # warm-up
+    timings = []
+    for _ in range(spec["repeat"]):
+        start = time.perf_counter()
+        for _ in range(spec["number"]):
+            fn()
+        timings.append((time.perf_counter() - start) / spec["number"])
+    return {
+        "median_s": statistics.median(timings),
+        "min_s": min(timings),
+        "number": spec["number"],
+        "repeat": spec["repeat"],
+    }
+
+
+def format_time(seconds):
+    if seconds < 1e-6:
+        return f"{seconds * 1e9:.0f} ns"
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f} µs"
+    if seconds < 1:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds:.2f} s"
+
+
+def run(args):
+    results = {}
+    for spec in BENCHMARKS:
+        if args.filter and args.filter not in spec["name"]:
+            continue
+        result = run_benchmark(spec)
+        results[spec["name"]] = result
+        print(f"  {spec['name']:<36} {format_time(result['median_s']):>12} "
+              f"(min {format_time(result['min_s'])})")
+
+    output = {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(output, f, indent=2)
+        print(f"\n✅ Results written to {args.output}")
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    with open(args.current) as f:
+        current = json.load(f)["results"]
+
+    regressions = []
+    print(f"{'Benchmark':<36} {'Baseline':>12} {'Current':>12} {'Change':>9}")
+    print("-" * 72)
+    for name, result in current.items():
+        if name not in baseline:
+            print(f"{name:<36} {'-':>12} {format_time(result['min_s']):>12} {'new':>9}")
+            continue
+        # Best-of-N is far less sensitive to machine noise than the median
+        before = baseline[name]["min_s"]
+        after = result["min_s"]
+        change = (after - before) / before * 100 if before else 0.0
+        flag = ""
+        if change > args.threshold:
+            regressions.append(name)
+            flag = "  ⚠️  REGRESSION"
+        print(f"{name:<36} {format_time(before):>12} {format_time(after):>12} "
+              f"{change:>+8.1f}%{flag}")
+
+    if regressions:
+        print(f"\n❌ {len(regressions)} benchmark(s) regressed by more than {args.threshold}%")
+        sys.exit(1)
+    print(f"\n✅ No regressions above {args.threshold}%")
+
+
+def logins(args):
+    # Password verification is the CPU-bound part of a login; drive it from
+    # more threads than the hashing pool has workers so the pool stays busy
+    stored = hash_password("correct horse battery staple")
+    deadline = time.perf_counter() + args.seconds
+    counts = []
+
+    def worker():
+        done = 0
+        while time.perf_counter() < deadline:
+            verify_password("correct horse battery staple", stored)
+            done += 1
+        counts.append(done)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=HASH_WORKERS * 2) as pool:
+        for _ in range(HASH_WORKERS * 2):
+            pool.submit(worker)
+    elapsed = time.perf_counter() - start
+
+    cores = min(HASH_WORKERS, os.cpu_count() or 1)
+    total = sum(counts) / elapsed
+    print(f"  hash workers:        {HASH_WORKERS}")
+    print(f"  logins/s:            {total:.1f}")
+    print(f"  logins/s per core:   {total / cores:.1f}")
+
+
+def select_then_insert(db, organization_id, employee_id, week, values):
+    # How POST /scores used to write: check, insert, read back
+    employee = db.query(Employee).filter(
+        Employee.id == employee_id, Employee.organization_id == organization_id).first()
+    if not employee:
+        return None
+    score = WeeklyScore(employee_id=employee_id, week=week,
+                        organization_id=organization_id, **values)
+    db.add(score)
+    db.commit()
+    db.refresh(score)
+    return score
+
+
+def single_statement(db, organization_id, employee_id, week, values):
+    # What POST /scores does now
+    values = {"employee_id": employee_id, "week": week,
+              "organization_id": organization_id, **values}
+    row = insert_unless_exists(db, WeeklyScore, values, only_if=(
+        Employee, {"id": "employee_id", "organization_id": "organization_id"}))
+    db.commit()
+    return row
+
+
+def writes(args):
+    url = args.database_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "writes.db")
+    bench_engine = create_engine(url)
+    Base.metadata.create_all(bench_engine, tables=[
+        Organization.__table__, Employee.__table__, WeeklyScore.__table__])
+    Session = sessionmaker(bind=bench_engine, autoflush=False)
+    executed = [0]
+    event.listen(bench_engine, "before_cursor_execute",
+                 lambda *a: executed.__setitem__(0, executed[0] + 1))
+
+    organization_id = f"bench-writes-{int(time.time())}"
+    with Session() as db:
+        db.add(Organization(id=organization_id, name="Benchmark"))
+        employees = [Employee(name=f"Employee {i}", department="Engineering", role="Developer",
+                              organization_id=organization_id) for i in range(100)]
+        db.add_all(employees)
+        db.commit()
+        employee_ids = [e.id for e in employees]
+
+    values = {"task_completion": 80.0, "speed": 70.0, "professionalism": 90.0,
+              "activity": 60.0, "productivity_score": 76.0}
+    print(f"  database:            {bench_engine.dialect.name}")
+    for label, write in (("select-then-insert", select_then_insert),
+                         ("single statement", single_statement)):
+        done, executed[0] = 0, 0
+        deadline = time.perf_counter() + args.seconds
+        start = time.perf_counter()
+        with Session() as db:
+            while time.perf_counter() < deadline:
+                week = f"{label[:6]}-{done // len(employee_ids):06d}"
+                write(db, organization_id, employee_ids[done % len(employee_ids)], week, values)
+                done += 1
+        elapsed = time.perf_counter() - start
+        print(f"  {label + ':':<20} {done / elapsed:>8.1f} writes/s  "
+              f"{executed[0] / done:.1f} statements/write")
+
+
+def query_lookup(db, organization_id, employee_id, week):
+    # How the hot lookups used to be written: a Query built per call
+    employee = db.query(Employee).filter(
+        Employee.id == employee_id, Employee.organization_id == organization_id).first()
+    scores = db.query(WeeklyScore, Employee.name).outerjoin(
+        Employee, Employee.id == WeeklyScore.employee_id
+    ).filter(
+        WeeklyScore.week == week, WeeklyScore.organization_id == organization_id
+    ).order_by(WeeklyScore.id).all()
+    return employee, scores
+
+
+def prebuilt_lookup(db, organization_id, employee_id, week):
+    # The same two lookups through statements.py
+    employee = db.scalars(statements.employee, {
+        "employee_id": employee_id, "organization_id": organization_id}).first()
+    scores = db.execute(statements.week_report, {
+        "week": week, "organization_id": organization_id}).all()
+    return employee, scores
+
+
+def lookups(args):
+    url = args.database_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(), "lookups.db")
+    bench_engine = create_engine(url)
+    Base.metadata.create_all(bench_engine, tables=[
+        Organization.__table__, Employee.__table__, WeeklyScore.__table__])
+    Session = sessionmaker(bind=bench_engine, autoflush=False)
+
+    organization_id = f"bench-lookups-{int(time.time())}"
+    with Session() as db:
+        db.add(Organization(id=organization_id, name="Benchmark"))
+        employees = [Employee(name=f"Employee {i}", department="Engineering", role="Developer",
+                              organization_id=organization_id) for i in range(20)]
+        db.add_all(employees)
+        db.flush()
+        db.add_all(WeeklyScore(employee_id=e.id, week="2026-W01", organization_id=organization_id,
+                               task_completion=80, speed=70, professionalism=90, activity=60,
+                               productivity_score=76) for e in employees)
+        db.commit()
+        employee_ids = [e.id for e in employees]
+
+    print(f"  database:            {bench_engine.dialect.name}")
+    results = {}
+    for label, lookup in (("query per call", query_lookup), ("prebuilt", prebuilt_lookup)):
+        done = 0
+        with Session() as db:
+            lookup(db, organization_id, employee_ids[0], "2026-W01")  # warm the compiled cache
+            deadline = time.perf_counter() + args.seconds
+            start = time.perf_counter()
+            while time.perf_counter() < deadline:
+                lookup(db, organization_id, employee_ids[done % len(employee_ids)], "2026-W01")
+                # Keep the identity map from turning later calls into no-ops
+                db.expunge_all()
+                done += 1
+            elapsed = time.perf_counter() - start
+        results[label] = elapsed / done
+        print(f"  {label + ':':<20} {format_time(elapsed / done):>12} per call")
+    saved = results["query per call"] - results["prebuilt"]
+    print(f"  saved:               {format_time(saved):>12} per call "
+          f"({saved / results['query per call'] * 100:.0f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="run benchmarks")
+    run_parser.add_argument("--output", default=None,
+                            help="write machine-readable results to this JSON file")
+    run_parser.add_argument("--filter", default=None,
+                            help="only run benchmarks whose name contains this")
+
+    compare_parser = sub.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=10.0,
+                                help="percent slowdown that counts as a regression")
+
+    logins_parser = sub.add_parser("logins", help="password verifications per second")
+    logins_parser.add_argument("--seconds", type=float, default=5)
+
+    writes_parser = sub.add_parser("writes", help="score writes per second, old and new path")
+    writes_parser.add_argument("--seconds", type=float, default=5)
+    writes_parser.add_argument("--database-url", default=None,
+                               help="scratch database (default: temporary SQLite file)")
+
+    lookups_parser = sub.add_parser("lookups", help="hot lookups, Query per call vs prebuilt")
+    lookups_parser.add_argument("--seconds", type=float, default=2)
+    lookups_parser.add_argument("--database-url", default=None,
+                                help="scratch database (default: temporary SQLite file)")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        run(args)
+    elif args.command == "logins":
+        logins(args)
+    elif args.command == "writes":
+        writes(args)
+    elif args.command == "lookups":
+        lookups(args)
+    else:
+        compare(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+from collections import OrderedDict
+import json
+import os
+import threading
+import time
+
+# Read-path cache for data that changes rarely (/auth/me, /team/members,
+# /employees). Keys are always scoped by organization or user, and every
+# write endpoint that touches the underlying rows deletes the exact keys
+# it affects. Values must be JSON-compatible so the shared backend can
+# hold them too.
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "300"))
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")
+
+MISSING = object()
+
+
+def me_key(user_id):
+    return f"user:{user_id}:me"
+
+
+def members_key(organization_id):
+    return f"org:{organization_id}:members"
+
+
+def employees_key(organization_id):
+    return f"org:{organization_id}:employees"
+
+
+class TTLCache:
+    # In-process LRU with a per-entry expiry
+    def __init__(self, maxsize=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def add(self, key, value, ttl=None):
+        # Set only if absent; True if this call stored the value
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] >= time.monotonic():
+                return False
+            self.set(key, value, ttl)
+            return True
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                if self._data.pop(key, None) is not None:
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "memory",
+                "entries": len(self._data),
+                "max_entries": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+class RedisCache:
+    # Shared backend so every worker sees the same entries and the same
+    # invalidations. Eviction is left to Redis' own maxmemory policy.
+    def __init__(self, url, ttl=CACHE_TTL_SECONDS, prefix="cache:"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("CACHE_REDIS_URL is set but the redis package is not installed; "
+                               "pip install -r requirements.txt") from None
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        with self._lock:
+            if raw is None:
+                self.misses += 1
+                return MISSING
+            self.hits += 1
+        return json.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, json.dumps(value),
+                        px=int((ttl or self.ttl) * 1000))
+
+    def add(self, key, value, ttl=None):
+        return bool(self.client.set(self.prefix + key, json.dumps(value),
+                                    px=int((ttl or self.ttl) * 1000), nx=True))
+
+    def delete(self, *keys):
+        if keys:
+            deleted = self.client.delete(*(self.prefix + key for key in keys))
+            with self._lock:
+                self.invalidations += deleted
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + "*"):
+            self.client.delete(key)
+
+    def stats(self):
+        info = self.client.info("stats")
+        with self._lock:
+            return {
+                "backend": "redis",
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": info.get("evicted_keys", 0),
+                "invalidations": self.invalidations,
+            }
+
+
+def get_or_load(key, loader):
+    value = cache.get(key)
+    if value is MISSING:
+        value = loader()
+        if value is not None:
+            cache.set(key, value)
+    return value
+
+
+def invalidate(*keys):
+    cache.delete(*keys)
+
+
+cache = RedisCache(CACHE_REDIS_URL) if CACHE_REDIS_URL else TTLCache()
@@ -0,0 +1,179 @@
+from sqlalchemy import select
+from database import SessionLocal, shard_engines, shard_for, tenant_sessionmaker, insert_unless_exists
+from models import Employee, WeeklyScore, User, Organization, OrganizationMembership, Job
+from reports import render_excel, render_pdf, XLSX_MEDIA_TYPE
+from mailer import build_report_message, send_message
+from jobs import job_handler, JobFailed
+from get_current_week import closed_weeks
+from tracing import span
+from datetime import datetime
+from email import message_from_bytes
+from itertools import groupby
+import json
+import os
+import time
+
+# Week-close digest: every organization's admins get last week's report,
+# with the xlsx and PDF attached, without anyone calling /email/report.
+#   1. worker.py calls schedule_week_close() every minute. The first call
+#      after the week rolls over (get_current_week.py) queues one
+#      week_digest job per label of the closed week; its id is derived from
+#      the week, so however many workers race, a week is queued once. The
+#      days before a year's first Monday (YYYY-W00) get a digest only when
+#      someone scored them.
+#   2. week_digest reads the closed week's scores of every organization in
+#      one pass per shard (one partition on a partitioned table), renders
+#      each org's message once and stores it on a deliver_digest job.
+#   3. deliver_digest jobs send the stored message, with the usual retries.
+# Digests are off unless DIGEST_SENDER_EMAIL is set. The same account sends
+# background POST /email/report sends.
+DIGEST_SMTP_SERVER = os.getenv("DIGEST_SMTP_SERVER", "smtp.gmail.com")
+DIGEST_SMTP_PORT = int(os.getenv("DIGEST_SMTP_PORT", "587"))
+DIGEST_SENDER_EMAIL = os.getenv("DIGEST_SENDER_EMAIL")
+DIGEST_SENDER_PASSWORD = os.getenv("DIGEST_SENDER_PASSWORD")
+STREAM_ROWS = 5000
+
+
+def digest_job_id(week):
+    return f"week-digest-{week}"
+
+
+def delivery_job_id(week, organization_id):
+    return f"digest-{week}-{organization_id}"
+
+
+def queue_job(db, job_id, kind, payload, organization_id=None, result=None):
+    # Returns False if a job with this id already exists
+    now = datetime.utcnow()
+    values = {"id": job_id, "kind": kind, "status": "queued", "organization_id": organization_id,
+              "payload": json.dumps(payload), "progress": 0, "attempts": 0, "max_attempts": 3,
+              "run_after": now, "created_at": now}
+    if result is not None:
+        values.update(result=result, result_name=f"{job_id}.eml", result_media_type="message/rfc822")
+    return insert_unless_exists(db, Job, values) is not None
+
+
+def has_scores(week):
+    for shard in shard_engines:
+        db = tenant_sessionmaker(shard)()
+        try:
+            if db.execute(select(WeeklyScore.id).where(WeeklyScore.week == week).limit(1)).first():
+                return True
+        finally:
+            db.close()
+    return False
+
+
+def schedule_week_close(now=None):
+    # Returns the weeks whose digests were queued by this call
+    if not DIGEST_SENDER_EMAIL:
+        return []
+    queued = []
+    db = SessionLocal()
+    try:
+        for week in closed_weeks(now):
+            job_id = digest_job_id(week)
+            if db.get(Job, job_id) is not None:
+                continue
+            if week.endswith("-W00") and not has_scores(week):
+                continue
+            if queue_job(db, job_id, "week_digest", {"week": week}):
+                queued.append(week)
+        db.commit()
+    finally:
+        db.close()
+    return queued
+
+
+def load_recipients(db):
+    # {organization_id: [admin emails]} and {organization_id: name}, for
+    # every organization at once
+    recipients = {}
+    for organization_id, email in db.execute(
+            select(OrganizationMembership.organization_id, User.email)
+            .join(User, User.id == OrganizationMembership.user_id)
+            .where(OrganizationMembership.role == "admin")):
+        recipients.setdefault(organization_id, []).append(email)
+    names = dict(db.execute(select(Organization.id, Organization.name)).all())
+    return recipients, names
+
+
+def week_rows(shard, week):
+    # (organization_id, rows) per organization on the shard, rows being the
+    # (WeeklyScore, employee_name) pairs the report renderers take
+    db = tenant_sessionmaker(shard)()
+    try:
+        rows = db.execute(
+            select(WeeklyScore, Employee.name)
+            .outerjoin(Employee, Employee.id == WeeklyScore.employee_id)
+            .where(WeeklyScore.week == week)
+            .order_by(WeeklyScore.organization_id, WeeklyScore.id)
+            .execution_options(yield_per=STREAM_ROWS)
+        )
+        for organization_id, org_rows in groupby(rows, key=lambda row: row[0].organization_id):
+            yield organization_id, [tuple(row) for row in org_rows]
+    finally:
+        db.close()
+
+
+def render_digest(week, name, rows, recipients):
+    msg = build_report_message(week, rows, DIGEST_SENDER_EMAIL, ", ".join(recipients), attachments=[
+        (f"weekly_report_{week}.xlsx", render_excel(week, rows), XLSX_MEDIA_TYPE),
+        (f"weekly_report_{week}.pdf", render_pdf(week, rows), "application/pdf"),
+    ])
+    msg.replace_header("Subject", f"{msg['Subject']} - {name}")
+    return msg.as_bytes()
+
+
+@job_handler("week_digest")
+def week_digest_job(ctx):
+    week = ctx.payload["week"]
+    started = time.perf_counter()
+    directory = SessionLocal()
+    try:
+        recipients, names = load_recipients(directory)
+        organizations = queued = scores = 0
+        for shard in shard_engines:
+            for organization_id, rows in week_rows(shard, week):
+                # Rows left behind on a shard the org has moved away from
+                if organization_id not in names or shard_for(organization_id)[0] != shard:
+                    continue
+                organizations += 1
+                scores += len(rows)
+                if not recipients.get(organization_id):
+                    continue
+                with span("digest.render", rows=len(rows)):
+                    message = render_digest(week, names[organization_id], rows,
+                                            recipients[organization_id])
+                # Already queued if this job is a retry
+                queued += queue_job(directory, delivery_job_id(week, organization_id),
+                                    "deliver_digest", {"week": week}, organization_id, message)
+                directory.commit()
+                if organizations % 100 == 0:
+                    ctx.progress(0.5, f"{organizations} organizations rendered")
+    finally:
+        directory.close()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "week": week,
+        "organizations": organizations,
+        "scores": scores,
+        "queued": queued,
+        "seconds": round(elapsed, 2),
+        "seconds_per_1000_orgs": round(elapsed / organizations * 1000, 2) if organizations else None,
+    }
+
+
+@job_handler("deliver_digest")
+def deliver_digest_job(ctx):
+    db = SessionLocal()
+    try:
+        stored = db.get(Job, ctx.job_id).result
+    finally:
+        db.close()
+    if not stored:
+        raise JobFailed("Digest message is missing")
+    msg = message_from_bytes(stored)
+    send_message(msg, DIGEST_SMTP_SERVER, DIGEST_SMTP_PORT, DIGEST_SENDER_EMAIL, DIGEST_SENDER_PASSWORD)
+    return {"week": ctx.payload["week"], "sent_to": msg["To"]}
@@ -0,0 +1,204 @@
+from sqlalchemy import insert
+from database import Base, engine
+from models import User, Organization, OrganizationMembership, Employee, WeeklyScore
+from scoring import calculate_productivity
+from passwords import hash_password
+from datetime import datetime, timedelta
+import argparse
+import json
+import random
+import time
+import uuid
+
+# Bulk synthetic dataset for scaling and load tests:
+#   python generate_data.py --orgs 200 --employees 50 --weeks 52
+# Org sizes follow a Zipf-like curve so a few tenants are much larger than
+# the rest, the way production looks. Rows go in through executemany
+# batches on one connection rather than one ORM object at a time.
+
+DEPARTMENTS = [
+    ("Engineering", ["Backend Developer", "Frontend Developer", "SRE", "QA Engineer"]),
+    ("Product", ["Product Manager", "Product Analyst"]),
+    ("Design", ["UI/UX Designer", "Researcher"]),
+    ("Marketing", ["Growth Analyst", "Content Writer"]),
+    ("Sales", ["Account Executive", "Sales Engineer"]),
+    ("Support", ["Support Specialist", "Support Lead"]),
+]
+FIRST_NAMES = ["Aarav", "Riya", "Kabir", "Ananya", "Rahul", "Maya", "Leo", "Sara",
+               "Omar", "Nina", "Jonas", "Priya", "Chen", "Lucia", "Ivan", "Zoe"]
+LAST_NAMES = ["Sharma", "Patel", "Singh", "Gupta", "Verma", "Müller", "Rossi",
+              "Kim", "Silva", "Novak", "Okafor", "Larsen", "Haddad", "Tanaka"]
+
+
+def org_sizes(orgs, mean_employees, skew, rng):
+    weights = [1 / (rank ** skew) for rank in range(1, orgs + 1)]
+    scale = orgs * mean_employees / sum(weights)
+    sizes = [max(1, int(w * scale)) for w in weights]
+    rng.shuffle(sizes)
+    return sizes
+
+
+def week_labels(weeks):
+    # Same "%Y-W%W" labels get_current_week.py produces, oldest first
+    today = datetime.now()
+    labels = []
+    for i in range(weeks):
+        label = (today - timedelta(weeks=i)).strftime("%Y-W%W")
+        if label not in labels:
+            labels.append(label)
+    return list(reversed(labels))
+
+
+def clamp(value):
+    return round(min(100.0, max(0.0, value)), 1)
+
+
+def insert_batches(conn, table, rows, batch_size, returning=None):
+    ids = []
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        if returning is not None:
+            stmt = insert(table).returning(returning, sort_by_parameter_order=True)
+            ids.extend(conn.execute(stmt, batch).scalars().all())
+        else:
+            conn.execute(insert(table), batch)
+    return ids
+
+
+def generate(orgs, employees, weeks, viewers, skew, batch_size, password, prefix, seed):
+    rng = random.Random(seed)
+    password_hash = hash_password(password)
+    labels = week_labels(weeks)
+    sizes = org_sizes(orgs, employees, skew, rng)
+    run_id = uuid.uuid4().hex[:6]
+    credentials = []
+    counts = {"organizations": 0, "users": 0, "memberships": 0,
+              "employees": 0, "weekly_scores": 0}
+    started = time.perf_counter()
+
+    Base.metadata.create_all(bind=engine)
+
+    for org_index, size in enumerate(sizes):
+        with engine.begin() as conn:
+            org_id = str(uuid.uuid4())
+            user_rows = []
+            for v in range(viewers + 1):
+                suffix = "admin" if v == 0 else f"viewer{v}"
+                username = f"{prefix}_{run_id}_{org_index}_{suffix}"
+                user_rows.append({
+                    "username": username,
+                    "email": f"{username}@loadtest.local",
+                    "password_hash": password_hash,
+                    "primary_organization_id": org_id,
+                    "created_at": datetime.utcnow(),
+                })
+            user_ids = insert_batches(
+                conn, User.__table__, user_rows, batch_size, returning=User.__table__.c.id)
+
+            conn.execute(insert(Organization.__table__), {
+                "id": org_id,
+                "name": f"Load Test Org {org_index}",
+                "owner_id": user_ids[0],
+                "created_at": datetime.utcnow(),
+            })
+            insert_batches(conn, OrganizationMembership.__table__, [
+                {"user_id": user_id, "organization_id": org_id,
+                 "role": "admin" if i == 0 else "viewer", "joined_at": datetime.utcnow()}
+                for i, user_id in enumerate(user_ids)
+            ], batch_size)
+
+            employee_rows = []
+            for _ in range(size):
+                department, roles = rng.choice(DEPARTMENTS)
+                employee_rows.append({
+                    "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+                    "department": department,
+                    "role": rng.choice(roles),
+                    "organization_id": org_id,
+                })
+            employee_ids = insert_batches(
+                conn, Employee.__table__, employee_rows, batch_size, returning=Employee.__table__.c.id)
+
+            score_rows = []
+            for employee_id in employee_ids:
+                # Some employees join partway through the history
+                first_week = rng.randrange(len(labels)) if rng.random() < 0.2 else 0
+                baseline = rng.gauss(75, 10)
+                for week in labels[first_week:]:
+                    task = clamp(baseline + rng.gauss(0, 8))
+                    speed = clamp(baseline + rng.gauss(0, 12))
+                    professionalism = clamp(baseline + rng.gauss(5, 6))
+                    activity = clamp(baseline + rng.gauss(0, 15))
+                    score_rows.append({
+                        "employee_id": employee_id,
+                        "week": week,
+                        "task_completion": task,
+                        "speed": speed,
+                        "professionalism": professionalism,
+                        "activity": activity,
+                        "productivity_score": calculate_productivity(
+                            task, speed, professionalism, activity),
+                        "organization_id": org_id,
+                    })
+                if len(score_rows) >= batch_size:
+                    insert_batches(conn, WeeklyScore.__table__, score_rows, batch_size)
+                    counts["weekly_scores"] += len(score_rows)
+                    score_rows = []
+            insert_batches(conn, WeeklyScore.__table__, score_rows, batch_size)
+
+        counts["organizations"] += 1
+        counts["users"] += len(user_ids)
+        counts["memberships"] += len(user_ids)
+        counts["employees"] += len(employee_ids)
+        counts["weekly_scores"] += len(score_rows)
+        credentials.append({
+            "username": user_rows[0]["username"],
+            "password": password,
+            "organization_id": org_id,
+            "employees": len(employee_ids),
+        })
+
+        if (org_index + 1) % 10 == 0 or org_index + 1 == len(sizes):
+            elapsed = time.perf_counter() - started
+            total = sum(counts.values())
+            print(f"  {org_index + 1}/{len(sizes)} orgs, {total} rows, "
+                  f"{total / elapsed:,.0f} rows/s")
+
+    return counts, credentials, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-generate a synthetic dataset")
+    parser.add_argument("--orgs", type=int, default=50)
+    parser.add_argument("--employees", type=int, default=40,
+                        help="mean employees per organization")
+    parser.add_argument("--weeks", type=int, default=26)
+    parser.add_argument("--viewers", type=int, default=2,
+                        help="viewer accounts per organization")
+    parser.add_argument("--skew", type=float, default=1.1,
+                        help="Zipf exponent for org sizes (0 = uniform)")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--password", default="loadtest")
+    parser.add_argument("--prefix", default="lt")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--users-file", default="loadtest_users.json",
+                        help="where to write admin credentials for load_test.py")
+    args = parser.parse_args()
+
+    print(f"🏗️  Generating {args.orgs} orgs x ~{args.employees} employees x {args.weeks} weeks...")
+    counts, credentials, elapsed = generate(
+        args.orgs, args.employees, args.weeks, args.viewers, args.skew,
+        args.batch_size, args.password, args.prefix, args.seed)
+
+    with open(args.users_file, "w") as f:
+        json.dump(credentials, f, indent=2)
+
+    total = sum(counts.values())
+    print(f"\n✅ Inserted {total:,} rows in {elapsed:.1f}s ({total / elapsed:,.0f} rows/s)")
+    for table, count in counts.items():
+        print(f"   {table:<15} {count:,}")
+    print(f"📋 Admin credentials written to {args.users_file}")
+
+
+if __name__ == "__main__":
+    main()
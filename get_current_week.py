@@ -1,5 +1,38 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 
-# Get current week in ISO format
-current_week = datetime.now().strftime("%Y-W%W")
-print(f"📅 Current week: {current_week}")
+# Week labels used everywhere: "%Y-W%W", the Monday-based week of the
+# year, so weeks roll over at local midnight between Sunday and Monday
+# and the days before a year's first Monday are week 00.
+
+
+def week_label(when):
+    return when.strftime("%Y-W%W")
+
+
+def current_week(now=None):
+    return week_label(now or datetime.now())
+
+
+def week_start(now=None):
+    # Midnight on the Monday the current week began
+    now = now or datetime.now()
+    return datetime(now.year, now.month, now.day) - timedelta(days=now.weekday())
+
+
+def previous_week(now=None):
+    # The week that closed most recently, taken from its last day: a week
+    # counted back from `now` could land on either side of a year boundary
+    return week_label(week_start(now) - timedelta(days=1))
+
+
+def closed_weeks(now=None):
+    # Every label on the days of the week that closed most recently, oldest
+    # first. One label, except across New Year, where the Monday-Sunday week
+    # is split between e.g. 2025-W52 and 2026-W00.
+    monday = week_start(now) - timedelta(weeks=1)
+    labels = [week_label(monday + timedelta(days=day)) for day in range(7)]
+    return list(dict.fromkeys(labels))
+
+
+if __name__ == "__main__":
+    print(f"📅 Current week: {current_week()}")
@@ -0,0 +1,123 @@
+from sqlalchemy import select, func, case, bindparam, type_coerce, Boolean
+from models import WeeklyScore
+from analytics import METRICS
+from archive import archived_weeks, archived_scores_of, merge_scores
+from functools import lru_cache
+
+# Week-by-week history of single employees for /employees/{id}/history and
+# /employees/history. Everything is computed by the database in one query
+# with window functions over each employee's weeks, read through
+# uq_weekly_scores_employee_id_week (employee_id, week), which also hands
+# the rows to the windows already in order:
+#   - rolling averages of the metric over the employee's last 4 and 12
+#     scored weeks (rows, not calendar weeks, so a gap does not empty them)
+#   - the change since the previous scored week
+#   - whether the week beat every earlier week (the first week does)
+# Windows run over all of an employee's weeks before from/to are applied,
+# so a week's averages are the same whatever range is asked for. Once an
+# organization has weeks in cold storage (archive.py), the windows need
+# those weeks too; its history is then read from both places and the same
+# figures are computed in Python instead (windowed()).
+MAX_HISTORY_EMPLOYEES = 100
+ROLLING_WEEKS = (4, 12)
+
+
+@lru_cache(maxsize=None)
+def history_statement(metric, from_week, to_week):
+    # One statement per (metric, bounds given), built once
+    value = getattr(WeeklyScore, metric)
+    weeks = {"partition_by": WeeklyScore.employee_id, "order_by": WeeklyScore.week}
+    previous_best = func.max(value).over(rows=(None, -1), **weeks)
+    windowed = select(
+        WeeklyScore.employee_id,
+        WeeklyScore.week,
+        *(getattr(WeeklyScore, name) for name in METRICS),
+        *(func.avg(value).over(rows=(1 - n, 0), **weeks).label(f"rolling_{n}w")
+          for n in ROLLING_WEEKS),
+        (value - func.lag(value).over(**weeks)).label("delta"),
+        type_coerce(case(
+            (value.is_(None), False),
+            (previous_best.is_(None), True),
+            else_=value > previous_best
+        ), Boolean).label("personal_best"),
+    ).where(
+        WeeklyScore.organization_id == bindparam("organization_id"),
+        WeeklyScore.employee_id.in_(bindparam("employee_ids", expanding=True))
+    ).subquery()
+
+    statement = select(windowed).order_by(windowed.c.employee_id, windowed.c.week)
+    if from_week:
+        statement = statement.where(windowed.c.week >= bindparam("from_week"))
+    if to_week:
+        statement = statement.where(windowed.c.week <= bindparam("to_week"))
+    return statement
+
+
+def rounded(value):
+    return None if value is None else round(value, 2)
+
+
+def history_entry(score, rolling, delta, personal_best):
+    return {
+        "week": score.week,
+        **{name: getattr(score, name) for name in METRICS},
+        **{f"rolling_{n}w": rounded(average) for n, average in zip(ROLLING_WEEKS, rolling)},
+        "delta": rounded(delta),
+        "personal_best": bool(personal_best),
+    }
+
+
+# Hot scores of some employees, for organizations with an archive
+hot_scores = select(WeeklyScore).where(
+    WeeklyScore.organization_id == bindparam("organization_id"),
+    WeeklyScore.employee_id.in_(bindparam("employee_ids", expanding=True)))
+
+
+def windowed(scores, metric):
+    # (score, rolling averages, delta, personal best) for one employee's
+    # scores in week order: what history_statement's windows compute
+    values = [getattr(score, metric) for score in scores]
+    best = None
+    for i, (score, value) in enumerate(zip(scores, values)):
+        rolling = []
+        for n in ROLLING_WEEKS:
+            window = [v for v in values[max(0, i + 1 - n):i + 1] if v is not None]
+            rolling.append(sum(window) / len(window) if window else None)
+        previous = values[i - 1] if i else None
+        delta = None if value is None or previous is None else value - previous
+        yield score, rolling, delta, value is not None and (best is None or value > best)
+        if value is not None:
+            best = value if best is None else max(best, value)
+
+
+def merged_history(db, organization_id, employee_ids, metric, from_week, to_week):
+    # Windows over hot and archived weeks together, before from/to
+    hot = db.scalars(hot_scores, {"organization_id": organization_id,
+                                  "employee_ids": list(employee_ids)}).all()
+    archived = archived_scores_of(organization_id, employee_ids)
+    weeks = {employee_id: [] for employee_id in employee_ids}
+    for score in sorted(merge_scores(hot, archived), key=lambda score: score.week):
+        weeks[score.employee_id].append(score)
+    return {
+        employee_id: [
+            history_entry(*row) for row in windowed(scores, metric)
+            if (not from_week or row[0].week >= from_week) and (not to_week or row[0].week <= to_week)
+        ]
+        for employee_id, scores in weeks.items()
+    }
+
+
+def employee_history(db, organization_id, employee_ids, metric="productivity_score",
+                     from_week=None, to_week=None):
+    # {employee_id: [week, ...]} in the order of employee_ids; employees
+    # without scores get an empty list
+    if archived_weeks(organization_id):
+        return merged_history(db, organization_id, employee_ids, metric, from_week, to_week)
+    rows = db.execute(history_statement(metric, bool(from_week), bool(to_week)), {
+        "organization_id": organization_id, "employee_ids": list(employee_ids),
+        "from_week": from_week, "to_week": to_week})
+    history = {employee_id: [] for employee_id in employee_ids}
+    for row in rows:
+        history[row.employee_id].append(history_entry(
+            row, [getattr(row, f"rolling_{n}w") for n in ROLLING_WEEKS], row.delta, row.personal_best))
+    return history
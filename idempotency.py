@@ -0,0 +1,200 @@
+from cache import TTLCache, RedisCache, MISSING, CACHE_REDIS_URL
+import anyio
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import time
+
+# Idempotency-Key support for write requests. A client that retries a
+# POST/PUT/PATCH/DELETE with the same Idempotency-Key header gets the first
+# response replayed (marked Idempotent-Replayed: true) and the handler does
+# not run again. Keys are scoped by organization and user, so only
+# authenticated requests take part and one user never gets another's
+# response replayed.
+#   - A retry that arrives while the first request is still running waits
+#     for it, up to IDEMPOTENCY_WAIT_SECONDS, then gets a 409.
+#   - Reusing a key for a different request (method, path, query or body)
+#     is a 422.
+#   - 5xx and 429 responses are not kept, so a retry runs again; neither
+#     are responses over IDEMPOTENCY_MAX_RESPONSE_BYTES.
+# Entries live IDEMPOTENCY_TTL_SECONDS, in process memory or in Redis when
+# CACHE_REDIS_URL is set so replays work across workers.
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+IDEMPOTENCY_MAX_ENTRIES = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+IDEMPOTENCY_WAIT = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))
+IDEMPOTENCY_MAX_RESPONSE_BYTES = int(os.getenv("IDEMPOTENCY_MAX_RESPONSE_BYTES", str(1024 * 1024)))
+# A running request re-arms its in-flight marker every IN_FLIGHT_REFRESH
+# seconds, however long the handler takes; the TTL only frees the key of a
+# worker that died mid-request, this long after its last refresh
+IN_FLIGHT_TTL = IDEMPOTENCY_WAIT * 2
+IN_FLIGHT_REFRESH = IN_FLIGHT_TTL / 3
+POLL_INTERVAL = 0.05
+MAX_KEY_LENGTH = 255
+
+HEADER = b"idempotency-key"
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+# Per-request headers that must not be replayed
+UNREPLAYED_HEADERS = {b"set-cookie", b"x-trace-id", b"x-profile-id", b"content-length"}
+
+if CACHE_REDIS_URL:
+    store = RedisCache(CACHE_REDIS_URL, ttl=IDEMPOTENCY_TTL, prefix="idempotency:")
+else:
+    store = TTLCache(maxsize=IDEMPOTENCY_MAX_ENTRIES, ttl=IDEMPOTENCY_TTL)
+
+# Requests running in this process, so local duplicates wait on an event
+# instead of polling the store
+_in_flight = {}
+
+
+async def call_store(method, *args):
+    if isinstance(store, RedisCache):
+        return await anyio.to_thread.run_sync(method, *args)
+    return method(*args)
+
+
+def fingerprint(scope, body):
+    digest = hashlib.sha256()
+    for part in (scope["method"], scope["path"], scope.get("query_string", b"").decode()):
+        digest.update(part.encode() + b"\0")
+    digest.update(body)
+    return digest.hexdigest()
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message["type"] != "http.request":
+            break
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    return b"".join(chunks)
+
+
+def replay_receive(body, receive):
+    sent = False
+
+    async def replayed():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        return await receive()
+    return replayed
+
+
+async def send_json(send, status, detail):
+    body = json.dumps({"detail": detail}).encode()
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"),
+                            (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def replay(send, entry):
+    body = base64.b64decode(entry["body"])
+    headers = [(name.encode(), value.encode()) for name, value in entry["headers"]]
+    headers += [(b"content-length", str(len(body)).encode()),
+                (b"idempotent-replayed", b"true")]
+    await send({"type": "http.response.start", "status": entry["status"], "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def keep_claimed(store_key, marker):
+    while True:
+        await asyncio.sleep(IN_FLIGHT_REFRESH)
+        await call_store(store.set, store_key, marker, IN_FLIGHT_TTL)
+
+
+class IdempotencyMiddleware:
+    def __init__(self, app, verify_session):
+        self.app = app
+        self.verify_session = verify_session
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in WRITE_METHODS:
+            return await self.app(scope, receive, send)
+        headers = dict(scope["headers"])
+        key = headers.get(HEADER, b"").decode().strip()
+        authorization = headers.get(b"authorization", b"").decode()
+        session = self.verify_session(authorization.replace("Bearer ", "")) if authorization else None
+        if not key or not session:
+            return await self.app(scope, receive, send)
+        if len(key) > MAX_KEY_LENGTH:
+            return await send_json(send, 400, f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters")
+
+        body = await read_body(receive)
+        request_fingerprint = fingerprint(scope, body)
+        store_key = f"{session['organization_id']}:{session['user_id']}:{key}"
+
+        marker = {"state": "in_flight", "fingerprint": request_fingerprint}
+        deadline = time.monotonic() + IDEMPOTENCY_WAIT
+        while True:
+            entry = await call_store(store.get, store_key)
+            if entry is MISSING:
+                claimed = await call_store(store.add, store_key, marker, IN_FLIGHT_TTL)
+                if claimed:
+                    break
+                continue
+            if entry["fingerprint"] != request_fingerprint:
+                return await send_json(
+                    send, 422, "Idempotency-Key was already used for a different request")
+            if entry["state"] == "done":
+                return await replay(send, entry)
+            if time.monotonic() >= deadline:
+                return await send_json(
+                    send, 409, "A request with this Idempotency-Key is still in progress")
+            event = _in_flight.get(store_key)
+            if event is not None:
+                try:
+                    await asyncio.wait_for(event.wait(), max(0.0, deadline - time.monotonic()))
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                # Running in another worker
+                await asyncio.sleep(POLL_INTERVAL)
+
+        _in_flight[store_key] = asyncio.Event()
+        response = {"status": None, "headers": [], "chunks": [], "size": 0}
+
+        async def recording_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = [
+                    (name.decode(), value.decode()) for name, value in message.get("headers", [])
+                    if name.lower() not in UNREPLAYED_HEADERS]
+            elif message["type"] == "http.response.body" and response["size"] <= IDEMPOTENCY_MAX_RESPONSE_BYTES:
+                chunk = message.get("body", b"")
+                response["chunks"].append(chunk)
+                response["size"] += len(chunk)
+            await send(message)
+
+        keep = False
+        refresher = asyncio.create_task(keep_claimed(store_key, marker))
+        try:
+            try:
+                await self.app(scope, replay_receive(body, receive), recording_send)
+            finally:
+                # Stopped before the entry is written or freed, so a late
+                # refresh cannot put the marker back over it
+                refresher.cancel()
+                await asyncio.gather(refresher, return_exceptions=True)
+            status = response["status"]
+            keep = (status is not None and status < 500 and status != 429
+                    and response["size"] <= IDEMPOTENCY_MAX_RESPONSE_BYTES)
+            if keep:
+                await call_store(store.set, store_key, {
+                    "state": "done",
+                    "fingerprint": request_fingerprint,
+                    "status": status,
+                    "headers": response["headers"],
+                    "body": base64.b64encode(b"".join(response["chunks"])).decode(),
+                })
+        finally:
+            if not keep:
+                # Free the key so the client's retry runs the request again
+                await call_store(store.delete, store_key)
+            _in_flight.pop(store_key).set()
@@ -0,0 +1,246 @@
+from sqlalchemy import select, update
+from sqlalchemy.exc import SQLAlchemyError
+from database import SessionLocal, tenant_session
+from models import Job
+from datetime import datetime, timedelta
+import json
+import os
+import socket
+import threading
+import traceback
+import uuid
+
+# DB-backed background jobs. The web process enqueues a row in `jobs`;
+# worker.py processes (see Procfile) claim rows one at a time, run the
+# registered handler and store its result, progress and errors on the row.
+# Claiming uses SELECT ... FOR UPDATE SKIP LOCKED on Postgres so workers
+# never block each other; other databases fall back to a compare-and-set
+# UPDATE on the status column.
+JOB_STALE_SECONDS = int(os.getenv("JOB_STALE_SECONDS", "300"))
+JOB_RETRY_BASE_SECONDS = int(os.getenv("JOB_RETRY_BASE_SECONDS", "10"))
+# A running job's heartbeat is refreshed this often by a thread next to the
+# handler, so a long handler that never reports progress is not taken for a
+# dead one
+JOB_HEARTBEAT_SECONDS = max(1, JOB_STALE_SECONDS // 5)
+
+HANDLERS = {}
+
+TERMINAL = ("succeeded", "failed")
+
+
+def job_handler(kind, secrets=()):
+    # `secrets` are payload fields (e.g. SMTP passwords) that are wiped once
+    # the job can no longer be retried
+    def register(fn):
+        HANDLERS[kind] = {"fn": fn, "secrets": secrets}
+        return fn
+    return register
+
+
+class JobFailed(Exception):
+    # Raised by handlers for errors that a retry cannot fix
+    pass
+
+
+class JobResult:
+    def __init__(self, content, filename=None, media_type="application/octet-stream"):
+        self.content = content
+        self.filename = filename
+        self.media_type = media_type
+
+
+class JobContext:
+    def __init__(self, job_id, kind, organization_id, user_id, payload, attempt):
+        self.job_id = job_id
+        self.kind = kind
+        self.organization_id = organization_id
+        self.user_id = user_id
+        self.payload = payload
+        self.attempt = attempt
+
+    def session(self):
+        # Raises OrganizationFrozen while the org is being moved between
+        # shards, which puts the job back in the queue to retry later
+        return tenant_session(self.organization_id)
+
+    def progress(self, fraction, message=None):
+        # Written on its own short transaction so it is visible while the
+        # handler's own transaction is still open
+        db = SessionLocal()
+        try:
+            db.execute(update(Job).where(Job.id == self.job_id).values(
+                progress=min(1.0, max(0.0, fraction)),
+                progress_message=message,
+                heartbeat_at=datetime.utcnow()
+            ))
+            db.commit()
+        finally:
+            db.close()
+
+
+def enqueue(db, kind, payload, organization_id=None, user_id=None, max_attempts=3):
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job = Job(
+        id=uuid.uuid4().hex,
+        kind=kind,
+        status="queued",
+        organization_id=organization_id,
+        user_id=user_id,
+        payload=json.dumps(payload),
+        max_attempts=max_attempts,
+        run_after=datetime.utcnow()
+    )
+    db.add(job)
+    db.commit()
+    return job
+
+
+def job_to_dict(job):
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "progress": job.progress,
+        "progress_message": job.progress_message,
+        "attempts": job.attempts,
+        "max_attempts": job.max_attempts,
+        "error": job.error,
+        "has_result": job.result is not None,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+def claim_next(db, worker):
+    now = datetime.utcnow()
+    candidates = select(Job.id).where(
+        Job.status == "queued", Job.run_after <= now
+    ).order_by(Job.created_at).limit(1)
+
+    if db.get_bind().dialect.name == "postgresql":
+        # SKIP LOCKED has to apply to the row scan that picks the job, so a
+        # row another worker holds is passed over for the next one
+        job = db.execute(
+            select(Job).where(Job.status == "queued", Job.run_after <= now)
+            .order_by(Job.created_at).limit(1)
+            .with_for_update(skip_locked=True)
+        ).scalar_one_or_none()
+        if job is None:
+            db.rollback()
+            return None
+        job.status = "running"
+        job.locked_by = worker
+        job.attempts = (job.attempts or 0) + 1
+        job.started_at = job.heartbeat_at = now
+        db.commit()
+        return job
+
+    # Compare-and-set fallback: only one worker's UPDATE can flip a given
+    # row from queued to running
+    for _ in range(5):
+        job_id = db.execute(candidates).scalar_one_or_none()
+        if job_id is None:
+            return None
+        claimed = db.execute(update(Job).where(
+            Job.id == job_id, Job.status == "queued"
+        ).values(
+            status="running", locked_by=worker, attempts=Job.attempts + 1,
+            started_at=now, heartbeat_at=now
+        )).rowcount
+        db.commit()
+        if claimed:
+            return db.get(Job, job_id)
+    return None
+
+
+def requeue_stale(db):
+    # Jobs whose worker died mid-run go back to the queue, unless they have
+    # used up their attempts: a job that kills its worker would otherwise
+    # loop forever. Returns (requeued, failed).
+    now = datetime.utcnow()
+    stale = (Job.status == "running", Job.heartbeat_at < now - timedelta(seconds=JOB_STALE_SECONDS))
+    exhausted = db.execute(select(Job.id, Job.kind, Job.payload).where(
+        *stale, Job.attempts >= Job.max_attempts)).all()
+    for job_id, kind, payload in exhausted:
+        db.execute(update(Job).where(Job.id == job_id, *stale).values(
+            status="failed", locked_by=None, finished_at=now,
+            error="Worker stopped responding on the last attempt",
+            payload=json.dumps(_redact(json.loads(payload or "{}"), HANDLERS.get(kind)))))
+    requeued = db.execute(update(Job).where(*stale).values(status="queued", locked_by=None)).rowcount
+    db.commit()
+    return requeued, len(exhausted)
+
+
+def heartbeat(job_id, stop):
+    while not stop.wait(JOB_HEARTBEAT_SECONDS):
+        db = SessionLocal()
+        try:
+            db.execute(update(Job).where(Job.id == job_id, Job.status == "running")
+                       .values(heartbeat_at=datetime.utcnow()))
+            db.commit()
+        except SQLAlchemyError:
+            # The next beat tries again; only JOB_STALE_SECONDS of missed
+            # beats get the job re-queued
+            db.rollback()
+        finally:
+            db.close()
+
+
+def run_job(db, job):
+    handler = HANDLERS.get(job.kind)
+    payload = json.loads(job.payload or "{}")
+    ctx = JobContext(job.id, job.kind, job.organization_id, job.user_id,
+                     payload, job.attempts)
+    stop = threading.Event()
+    beat = threading.Thread(target=heartbeat, args=(job.id, stop), daemon=True)
+    beat.start()
+    try:
+        if handler is None:
+            raise ValueError(f"No handler registered for {job.kind}")
+        result = handler["fn"](ctx)
+    except Exception as e:
+        db.rollback()
+        job = db.get(Job, ctx.job_id)
+        job.error = str(e) if isinstance(e, JobFailed) else traceback.format_exc(limit=5)
+        if job.attempts < job.max_attempts and not isinstance(e, JobFailed):
+            job.status = "queued"
+            job.locked_by = None
+            job.run_after = datetime.utcnow() + timedelta(
+                seconds=JOB_RETRY_BASE_SECONDS * 2 ** (job.attempts - 1))
+        else:
+            job.status = "failed"
+            job.finished_at = datetime.utcnow()
+            job.payload = json.dumps(_redact(payload, handler))
+        db.commit()
+        return job
+    finally:
+        stop.set()
+        beat.join()
+
+    job = db.get(Job, ctx.job_id)
+    if isinstance(result, JobResult):
+        job.result = result.content
+        job.result_name = result.filename
+        job.result_media_type = result.media_type
+    elif result is not None:
+        job.result = json.dumps(result, default=str).encode()
+        job.result_media_type = "application/json"
+    job.status = "succeeded"
+    job.progress = 1.0
+    job.error = None
+    job.finished_at = datetime.utcnow()
+    job.payload = json.dumps(_redact(payload, handler))
+    db.commit()
+    return job
+
+
+def _redact(payload, handler):
+    if not handler:
+        return payload
+    return {k: (None if k in handler["secrets"] else v) for k, v in payload.items()}
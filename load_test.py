@@ -0,0 +1,217 @@
+from concurrent.futures import ThreadPoolExecutor
+from urllib import request as urlrequest
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from datetime import datetime, timedelta
+from get_current_week import week_label
+import argparse
+import json
+import random
+import threading
+import time
+
+# HTTP load test against a running server, using the credentials written
+# by generate_data.py:
+#   uvicorn app:app --port 8000
+#   python load_test.py --concurrency 32 --duration 60
+# Each worker logs in as one org admin and then runs a weighted mix of
+# reads, score writes and exports. Latency is reported per route.
+# Score writes go to an employee each worker creates when it starts, one
+# week further back per write from the current week, so every write is a
+# new (employee, week) pair rather than a duplicate-score 400.
+# Every worker shares one client IP, so raise RATE_LIMIT_LOGIN and
+# RATE_LIMIT_IP on the server unless throttling is what you are measuring.
+
+MIX = [
+    ("GET /employees", 30),
+    ("GET /scores", 25),
+    ("GET /auth/me", 15),
+    ("POST /scores", 15),
+    ("POST /auth/login", 5),
+    ("GET /export/excel/{week}", 5),
+    ("GET /export/pdf/{week}", 5),
+]
+
+
+class Client:
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.token = None
+
+    def call(self, method, path, params=None, form=None):
+        url = self.base_url + path
+        if params:
+            url += "?" + urlencode(params)
+        data = urlencode(form).encode() if form else None
+        req = urlrequest.Request(url, data=data, method=method)
+        if self.token:
+            req.add_header("Authorization", f"Bearer {self.token}")
+        with urlrequest.urlopen(req, timeout=self.timeout) as resp:
+            return resp.status, resp.read()
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = {}
+        self.rejected = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, route, seconds, status):
+        # 4xx (e.g. a duplicate score) is a valid answer, 5xx and
+        # connection failures are errors
+        with self._lock:
+            self.latencies.setdefault(route, []).append(seconds)
+            if status is None or status >= 500:
+                self.errors[route] = self.errors.get(route, 0) + 1
+            elif status >= 400:
+                self.rejected[route] = self.rejected.get(route, 0) + 1
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = max(0, int(round(pct / 100 * len(sorted_values))) - 1)
+    return sorted_values[index]
+
+
+def timed_call(client, stats, route, method, path, params=None, form=None):
+    # Records the call under `route`; returns the body, or None on failure
+    start = time.perf_counter()
+    status, body = None, None
+    try:
+        status, body = client.call(method, path, params=params, form=form)
+    except HTTPError as e:
+        status = e.code
+    except (URLError, OSError):
+        pass
+    stats.record(route, time.perf_counter() - start, status)
+    return body if status is not None and status < 400 else None
+
+
+def run_worker(args, credentials, stats, deadline, remaining):
+    rng = random.Random()
+    client = Client(args.base_url, args.timeout)
+    creds = rng.choice(credentials)
+    login = {"username": creds["username"], "password": creds["password"]}
+
+    # A worker that cannot log in or load its org shows up as errors on
+    # those routes instead of stopping the run
+    body = timed_call(client, stats, "POST /auth/login", "POST", "/auth/login", form=login)
+    if body is None:
+        return
+    client.token = json.loads(body)["token"]
+    scores = timed_call(client, stats, "GET /scores", "GET", "/scores")
+    if scores is None:
+        return
+    weeks = sorted({s["week"] for s in json.loads(scores)})
+    employee = timed_call(client, stats, "POST /employees", "POST", "/employees", params={
+        "name": f"Load Test {rng.getrandbits(32):08x}", "department": "Load Test", "role": "Worker"})
+    if not weeks or employee is None:
+        return
+    employee_id = json.loads(employee)["id"]
+    now = datetime.now()
+    writes = 0
+
+    routes, weights = zip(*MIX)
+    while time.perf_counter() < deadline:
+        if remaining is not None:
+            with remaining["lock"]:
+                if remaining["count"] <= 0:
+                    return
+                remaining["count"] -= 1
+
+        route = rng.choices(routes, weights)[0]
+        week = rng.choice(weeks)
+        if route == "POST /scores":
+            timed_call(client, stats, route, "POST", "/scores", params={
+                "employee_id": employee_id,
+                "week": week_label(now - timedelta(weeks=writes)),
+                "task_completion": rng.randint(50, 100),
+                "speed": rng.randint(50, 100),
+                "professionalism": rng.randint(50, 100),
+                "activity": rng.randint(50, 100),
+            })
+            writes += 1
+        elif route == "POST /auth/login":
+            timed_call(client, stats, route, "POST", "/auth/login", form=login)
+        else:
+            method, path = route.split(" ", 1)
+            timed_call(client, stats, route, method, path.format(week=week))
+
+
+def report(stats, elapsed):
+    total = sum(len(v) for v in stats.latencies.values())
+    print(f"\n{'Route':<26} {'Count':>7} {'4xx':>5} {'Err':>5} {'RPS':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    print("-" * 92)
+    mixed = [route for route, _ in MIX]
+    for route in mixed + sorted(set(stats.latencies) - set(mixed)):
+        values = sorted(stats.latencies.get(route, []))
+        if not values:
+            continue
+        print(f"{route:<26} {len(values):>7} {stats.rejected.get(route, 0):>5} "
+              f"{stats.errors.get(route, 0):>5} "
+              f"{len(values) / elapsed:>8.1f} "
+              f"{percentile(values, 50) * 1000:>8.1f} "
+              f"{percentile(values, 95) * 1000:>8.1f} "
+              f"{percentile(values, 99) * 1000:>8.1f} "
+              f"{values[-1] * 1000:>8.1f}")
+    print("-" * 92)
+    print(f"{'TOTAL':<26} {total:>7} {sum(stats.rejected.values()):>5} "
+          f"{sum(stats.errors.values()):>5} {total / elapsed:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="HTTP load test")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--users-file", default="loadtest_users.json")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30,
+                        help="seconds to run")
+    parser.add_argument("--requests", type=int, default=None,
+                        help="stop after this many requests instead")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--json", dest="json_out", default=None,
+                        help="also write raw per-route percentiles to this file")
+    args = parser.parse_args()
+
+    with open(args.users_file) as f:
+        credentials = json.load(f)
+
+    stats = Stats()
+    remaining = {"count": args.requests, "lock": threading.Lock()} if args.requests else None
+    print(f"🚀 {args.concurrency} workers against {args.base_url} "
+          f"for {args.requests or f'{args.duration:.0f}s'}")
+
+    start = time.perf_counter()
+    deadline = start + (args.duration if not args.requests else float("inf"))
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        futures = [pool.submit(run_worker, args, credentials, stats, deadline, remaining)
+                   for _ in range(args.concurrency)]
+        for future in futures:
+            future.result()
+    elapsed = time.perf_counter() - start
+
+    report(stats, elapsed)
+
+    if args.json_out:
+        summary = {}
+        for route, values in stats.latencies.items():
+            values = sorted(values)
+            summary[route] = {
+                "count": len(values),
+                "rejected": stats.rejected.get(route, 0),
+                "errors": stats.errors.get(route, 0),
+                "rps": len(values) / elapsed,
+                "p50_ms": percentile(values, 50) * 1000,
+                "p95_ms": percentile(values, 95) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+            }
+        with open(args.json_out, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+from email.mime.application import MIMEApplication
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from tracing import span
+from html import escape
+import smtplib
+
+# The report email body. The template is split once, at import, into the
+# part before the rows, a bound str.format per row and the part after, and
+# a body is rendered with a single join: linear in the number of rows.
+REPORT_HEAD = """
+<html>
+<body>
+<h2>{title}</h2>
+<p>{intro}</p>
+<br>
+<table border="1" cellpadding="5">
+<tr style="background-color: #4472C4; color: white;">
+    <th>Employee</th>
+    <th>Task</th>
+    <th>Speed</th>
+    <th>Professional</th>
+    <th>Activity</th>
+    <th>Score</th>
+</tr>
+""".format
+REPORT_ROW = """<tr>
+    <td>{}</td>
+    <td>{}</td>
+    <td>{}</td>
+    <td>{}</td>
+    <td>{}</td>
+    <td><b>{}</b></td>
+</tr>
+""".format
+REPORT_TAIL = """</table>
+<br>
+<p>Best regards,<br>Productivity Tracker System</p>
+</body>
+</html>
+"""
+
+
+def render_report_html(title, intro, rows):
+    return "".join([
+        REPORT_HEAD(title=escape(title), intro=escape(intro)),
+        *(REPORT_ROW(escape(employee_name or "Unknown"), score.task_completion, score.speed,
+                     score.professionalism, score.activity, score.productivity_score)
+          for score, employee_name in rows),
+        REPORT_TAIL,
+    ])
+
+
+def build_report_message(week, rows, sender_email, recipient_email, attachments=()):
+    # attachments are (filename, content, media type) triples
+    title = f'Weekly Productivity Report - {week}'
+    with span("render.html", rows=len(rows)):
+        msg = MIMEMultipart()
+        msg['From'] = sender_email
+        msg['To'] = recipient_email
+        msg['Subject'] = title
+        msg.attach(MIMEText(render_report_html(
+            title, "Please find the weekly productivity report attached.", rows), 'html'))
+        for filename, content, media_type in attachments:
+            part = MIMEApplication(content, _subtype=media_type.split("/", 1)[1])
+            part.add_header("Content-Disposition", "attachment", filename=filename)
+            msg.attach(part)
+    return msg
+
+
+def send_message(msg, smtp_server, smtp_port, sender_email, sender_password):
+    with span("smtp.connect", host=smtp_server, port=smtp_port):
+        server = smtplib.SMTP(smtp_server, smtp_port)
+        server.starttls()
+    with span("smtp.login"):
+        server.login(sender_email, sender_password)
+    with span("smtp.send"):
+        server.send_message(msg)
+        server.quit()
@@ -2,6 +2,9 @@ from database import SessionLocal
 from models import WeeklyScore, Employee
 from datetime import datetime
 
+# Interactive menu for local poking around. For scripted or org-scoped work
+# use admin.py, which streams and batches.
+
 
 def show_menu():
     print("\n" + "="*60)
@@ -18,10 +21,11 @@ def show_menu():
 
 def view_scores_by_week(db):
     week = input("Enter week (or press Enter for all): ")
+    query = db.query(WeeklyScore, Employee.name).outerjoin(
+        Employee, Employee.id == WeeklyScore.employee_id)
     if week:
-        scores = db.query(WeeklyScore).filter(WeeklyScore.week == week).all()
-    else:
-        scores = db.query(WeeklyScore).all()
+        query = query.filter(WeeklyScore.week == week)
+    scores = query.all()
 
     if not scores:
         print("\n❌ No scores found.")
@@ -29,11 +33,9 @@ def view_scores_by_week(db):
 
     print(f"\n📊 SCORES:")
     print("-" * 80)
-    for score in scores:
-        emp = db.query(Employee).filter(
-            Employee.id == score.employee_id).first()
+    for score, name in scores:
         print(
-            f"Week: {score.week} | Employee: {emp.name if emp else 'Unknown'} | Score: {score.productivity_score}")
+            f"Week: {score.week} | Employee: {name or 'Unknown'} | Score: {score.productivity_score}")
     print("-" * 80)
 
 
@@ -65,7 +67,9 @@ def weekly_report(db):
     current_week = datetime.now().strftime("%Y-W%W")
     week = input(f"Week (Enter for current {current_week}): ") or current_week
 
-    scores = db.query(WeeklyScore).filter(WeeklyScore.week == week).all()
+    scores = db.query(WeeklyScore, Employee.name).outerjoin(
+        Employee, Employee.id == WeeklyScore.employee_id
+    ).filter(WeeklyScore.week == week).all()
 
     if not scores:
         print(f"\n❌ No scores for {week}")
@@ -74,12 +78,10 @@ def weekly_report(db):
     print(f"\n📈 REPORT - {week}")
     print("=" * 60)
 
-    for score in scores:
-        emp = db.query(Employee).filter(
-            Employee.id == score.employee_id).first()
-        print(f"{emp.name if emp else 'Unknown'}: {score.productivity_score}")
+    for score, name in scores:
+        print(f"{name or 'Unknown'}: {score.productivity_score}")
 
-    avg = sum(s.productivity_score for s in scores) / len(scores)
+    avg = sum(s.productivity_score for s, _ in scores) / len(scores)
     print(f"\nAverage: {avg:.2f}")
     print("=" * 60)
 
@@ -0,0 +1,47 @@
+from sqlalchemy import inspect, text
+from database import shard_engines
+
+# Makes weekly_scores.employee_id ON DELETE CASCADE on every shard, so a
+# deleted employee can never leave scores behind.
+#   python migrate_delete_cascade.py
+# Postgres only; SQLite cannot alter a foreign key in place, and purge.py
+# and DELETE /employees/{id} delete the scores explicitly anyway. Lookups
+# and cascades by employee_id use uq_weekly_scores_employee_id_week
+# (migrate_unique_writes.py).
+CONSTRAINT = "weekly_scores_employee_id_fkey"
+INDEX = "uq_weekly_scores_employee_id_week"
+
+for shard, shard_engine in shard_engines.items():
+    with shard_engine.begin() as conn:
+        inspector = inspect(conn)
+        if not inspector.has_table("weekly_scores"):
+            print(f"⏭️  {shard}: no weekly_scores table")
+            continue
+        if INDEX not in {index["name"] for index in inspector.get_indexes("weekly_scores")}:
+            print(f"⚠️  {shard}: {INDEX} missing, run migrate_unique_writes.py first")
+            continue
+
+        foreign_keys = [fk for fk in inspector.get_foreign_keys("weekly_scores")
+                        if fk["constrained_columns"] == ["employee_id"]]
+        if any(fk["options"].get("ondelete", "").upper() == "CASCADE" for fk in foreign_keys):
+            print(f"⏭️  {shard}: {CONSTRAINT} already cascades")
+            continue
+        if conn.dialect.name != "postgresql":
+            print(f"⏭️  {shard}: {conn.dialect.name} cannot alter foreign keys, skipped")
+            continue
+
+        for fk in foreign_keys:
+            conn.execute(text(f'ALTER TABLE weekly_scores DROP CONSTRAINT "{fk["name"]}"'))
+        # NOT VALID adds the constraint without scanning the table under an
+        # exclusive lock; VALIDATE then checks existing rows with a weaker
+        # lock. Partitioned tables do not support NOT VALID.
+        partitioned = conn.execute(text(
+            "SELECT relkind = 'p' FROM pg_class WHERE oid = 'weekly_scores'::regclass")).scalar()
+        conn.execute(text(
+            f"ALTER TABLE weekly_scores ADD CONSTRAINT {CONSTRAINT} FOREIGN KEY (employee_id) "
+            f"REFERENCES employees (id) ON DELETE CASCADE{'' if partitioned else ' NOT VALID'}"))
+        if not partitioned:
+            conn.execute(text(f"ALTER TABLE weekly_scores VALIDATE CONSTRAINT {CONSTRAINT}"))
+        print(f"✅ {shard}: {CONSTRAINT} now ON DELETE CASCADE")
+
+print("\n🎉 Migration complete!")
@@ -0,0 +1,26 @@
+from sqlalchemy import inspect, text
+from database import shard_engines
+from models import Employee
+
+# Adds employees.external_id, the HR-system key bulk imports match on, and
+# its unique (organization_id, external_id) index on every shard.
+#   python migrate_employee_external_id.py
+# Existing employees keep a NULL external_id; exports list them as
+# "id:<id>" until an import or an update gives them one.
+INDEX = "uq_employees_organization_id_external_id"
+
+for shard, shard_engine in shard_engines.items():
+    with shard_engine.begin() as conn:
+        inspector = inspect(conn)
+        if not inspector.has_table("employees"):
+            print(f"⏭️  {shard}: no employees table")
+            continue
+        columns = {column["name"] for column in inspector.get_columns("employees")}
+        if "external_id" not in columns:
+            conn.execute(text("ALTER TABLE employees ADD COLUMN external_id VARCHAR"))
+        indexes = {index["name"] for index in inspector.get_indexes("employees")}
+        if INDEX not in indexes:
+            next(i for i in Employee.__table__.indexes if i.name == INDEX).create(conn)
+        print(f"✅ {shard}: employees.external_id ready")
+
+print("\n🎉 Migration complete!")
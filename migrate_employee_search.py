@@ -0,0 +1,28 @@
+from sqlalchemy import text
+from database import shard_engines
+
+# Trigram index behind /employees/search on Postgres. Needs the pg_trgm
+# extension (CREATE EXTENSION usually needs a superuser or a trusted
+# extension setup). Without it the API falls back to the in-process index.
+#   python migrate_employee_search.py
+# The indexed expression must match search.search_text().
+INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS ix_employees_search_trgm ON employees
+USING gin (lower(name || ' ' || department || ' ' || role) gin_trgm_ops)
+"""
+
+for shard, shard_engine in shard_engines.items():
+    if shard_engine.dialect.name != "postgresql":
+        print(f"⏭️  {shard}: not Postgres, search uses the in-process index")
+        continue
+    with shard_engine.begin() as conn:
+        try:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        except Exception as e:
+            print(f"❌ {shard}: could not enable pg_trgm: {e}")
+            continue
+    with shard_engine.begin() as conn:
+        conn.execute(text(INDEX_SQL))
+        print(f"✅ {shard}: ix_employees_search_trgm ready")
+
+print("\n🎉 Migration complete!")
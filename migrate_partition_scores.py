@@ -0,0 +1,89 @@
+from sqlalchemy import inspect, text
+from database import shard_engines
+from partitioning import (PARENT, WEEK_LABEL, is_partitioned, create_default_partition,
+                          create_partition, ensure_partitions)
+import sys
+
+# Converts weekly_scores into a table range-partitioned by week on every
+# Postgres shard, and swaps the organization_id index for a composite
+# (organization_id, week) index, which Postgres creates on every partition.
+# On other databases only the index swap is done.
+#   python migrate_partition_scores.py [--keep-old]
+# Rewrites the whole table under an exclusive lock, so run it in a
+# maintenance window. --keep-old leaves the original table behind as
+# weekly_scores_unpartitioned.
+OLD_INDEX = "ix_weekly_scores_organization_id"
+NEW_INDEX = "ix_weekly_scores_organization_id_week"
+OLD_TABLE = "weekly_scores_unpartitioned"
+# From migrate_unique_writes.py; the write paths' ON CONFLICT relies on it
+UNIQUE_INDEX = "uq_weekly_scores_employee_id_week"
+
+keep_old = "--keep-old" in sys.argv
+
+
+def swap_index(conn):
+    indexes = {index["name"] for index in inspect(conn).get_indexes(PARENT)}
+    if NEW_INDEX not in indexes:
+        conn.execute(text(f"CREATE INDEX {NEW_INDEX} ON {PARENT} (organization_id, week)"))
+    if OLD_INDEX in indexes:
+        conn.execute(text(f"DROP INDEX {OLD_INDEX}"))
+
+
+def partition(conn):
+    inspector = inspect(conn)
+    has_organizations = inspector.has_table("organizations")
+    # Without the unique index the old table may hold duplicates, which
+    # migrate_unique_writes.py removes before creating it on the new table
+    has_unique = UNIQUE_INDEX in {index["name"] for index in inspector.get_indexes(PARENT)}
+
+    conn.execute(text(f"LOCK TABLE {PARENT} IN ACCESS EXCLUSIVE MODE"))
+    conn.execute(text(f"ALTER TABLE {PARENT} RENAME TO {OLD_TABLE}"))
+    # Free up names the new table needs
+    conn.execute(text(f"ALTER TABLE {OLD_TABLE} RENAME CONSTRAINT {PARENT}_pkey TO {OLD_TABLE}_pkey"))
+    conn.execute(text(
+        f"DROP INDEX IF EXISTS ix_weekly_scores_id, {OLD_INDEX}, {NEW_INDEX}, {UNIQUE_INDEX}"))
+
+    # The partition key has to be part of the primary key
+    conn.execute(text(
+        f"CREATE TABLE {PARENT} (LIKE {OLD_TABLE} INCLUDING DEFAULTS, PRIMARY KEY (id, week)) "
+        f"PARTITION BY RANGE (week)"))
+    conn.execute(text(f"ALTER SEQUENCE {PARENT}_id_seq OWNED BY {PARENT}.id"))
+    # ON DELETE CASCADE as in models.py and migrate_delete_cascade.py
+    conn.execute(text(
+        f"ALTER TABLE {PARENT} ADD CONSTRAINT {PARENT}_employee_id_fkey FOREIGN KEY (employee_id) "
+        f"REFERENCES employees (id) ON DELETE CASCADE"))
+    if has_organizations:
+        conn.execute(text(
+            f"ALTER TABLE {PARENT} ADD FOREIGN KEY (organization_id) REFERENCES organizations (id)"))
+    conn.execute(text(f"CREATE INDEX ix_weekly_scores_id ON {PARENT} (id)"))
+    conn.execute(text(f"CREATE INDEX {NEW_INDEX} ON {PARENT} (organization_id, week)"))
+    if has_unique:
+        # Allowed on a partitioned table because it includes the partition key
+        conn.execute(text(f"CREATE UNIQUE INDEX {UNIQUE_INDEX} ON {PARENT} (employee_id, week)"))
+
+    weeks = [week for (week,) in conn.execute(text(f"SELECT DISTINCT week FROM {OLD_TABLE}"))]
+    created = [create_partition(conn, week) for week in weeks if WEEK_LABEL.match(week)]
+    created += ensure_partitions(conn)
+    create_default_partition(conn)
+
+    moved = conn.execute(text(f"INSERT INTO {PARENT} SELECT * FROM {OLD_TABLE}")).rowcount
+    if not keep_old:
+        conn.execute(text(f"DROP TABLE {OLD_TABLE}"))
+    return moved, len([name for name in created if name]), has_unique
+
+
+for shard, shard_engine in shard_engines.items():
+    with shard_engine.begin() as conn:
+        if conn.dialect.name != "postgresql":
+            swap_index(conn)
+            print(f"✅ {shard}: {NEW_INDEX} created (partitioning needs Postgres)")
+        elif is_partitioned(conn):
+            swap_index(conn)
+            print(f"⏭️  {shard}: already partitioned")
+        else:
+            moved, partitions, has_unique = partition(conn)
+            print(f"✅ {shard}: moved {moved} rows into {partitions} partitions")
+            if not has_unique:
+                print(f"⚠️  {shard}: {UNIQUE_INDEX} missing, run migrate_unique_writes.py next")
+
+print("\n🎉 Migration complete!")
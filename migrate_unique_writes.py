@@ -0,0 +1,80 @@
+from sqlalchemy import inspect, text, delete
+from database import engine, shard_engines
+from models import WeeklyScore, OrganizationMembership
+from analytics import analytics
+
+# Adds the unique indexes the single-statement write paths rely on:
+#   organization_memberships (user_id, organization_id)   directory database
+#   weekly_scores (employee_id, week)                    every shard
+#   python migrate_unique_writes.py
+# Existing duplicates are removed first. A user keeps one membership per
+# organization (the admin one if any, else the oldest); an employee keeps
+# the most recent score per week.
+
+
+def index_for(model, name):
+    return next(index for index in model.__table__.indexes if index.name == name)
+
+
+def has_index(conn, table, name):
+    return name in {index["name"] for index in inspect(conn).get_indexes(table)}
+
+
+def delete_ids(conn, model, ids):
+    table = model.__table__
+    for start in range(0, len(ids), 1000):
+        conn.execute(delete(table).where(table.c.id.in_(ids[start:start + 1000])))
+    return len(ids)
+
+
+def dedupe_memberships(conn):
+    groups = conn.execute(text("""
+        SELECT user_id, organization_id FROM organization_memberships
+        GROUP BY user_id, organization_id HAVING COUNT(*) > 1
+    """)).all()
+    removed = 0
+    for user_id, organization_id in groups:
+        ids = conn.execute(text("""
+            SELECT id FROM organization_memberships
+            WHERE user_id = :user AND organization_id = :org
+            ORDER BY CASE WHEN role = 'admin' THEN 0 ELSE 1 END, id
+        """), {"user": user_id, "org": organization_id}).scalars().all()
+        removed += delete_ids(conn, OrganizationMembership, ids[1:])
+    return removed
+
+
+def dedupe_scores(conn):
+    rows = conn.execute(text("""
+        SELECT s.id, s.organization_id FROM weekly_scores s
+        JOIN weekly_scores newer ON newer.employee_id = s.employee_id
+            AND newer.week = s.week AND newer.id > s.id
+    """)).all()
+    ids = sorted({score_id for score_id, _ in rows})
+    delete_ids(conn, WeeklyScore, ids)
+    for organization_id in {org for _, org in rows}:
+        analytics.invalidate(organization_id)
+    return len(ids)
+
+
+with engine.begin() as conn:
+    name = "uq_organization_memberships_user_id_organization_id"
+    if not has_index(conn, "organization_memberships", name):
+        removed = dedupe_memberships(conn)
+        index_for(OrganizationMembership, name).create(conn)
+        print(f"✅ directory: {name} created ({removed} duplicate memberships removed)")
+    else:
+        print(f"⏭️  directory: {name} already exists")
+
+for shard, shard_engine in shard_engines.items():
+    with shard_engine.begin() as conn:
+        name = "uq_weekly_scores_employee_id_week"
+        if not inspect(conn).has_table("weekly_scores"):
+            print(f"⏭️  {shard}: no weekly_scores table")
+        elif has_index(conn, "weekly_scores", name):
+            print(f"⏭️  {shard}: {name} already exists")
+        else:
+            removed = dedupe_scores(conn)
+            index_for(WeeklyScore, name).create(conn)
+            print(f"✅ {shard}: {name} created ({removed} duplicate scores removed)")
+
+print("\n🎉 Migration complete!")
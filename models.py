@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey, DateTime, Text, LargeBinary, Index
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
@@ -34,6 +34,22 @@ class OrganizationMembership(Base):
     role = Column(String, default='viewer')
     joined_at = Column(DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        Index("uq_organization_memberships_user_id_organization_id",
+              "user_id", "organization_id", unique=True),
+    )
+
+
+class OrganizationShard(Base):
+    # Directory entry for organizations whose tenant data lives on a shard
+    # other than the default one (see database.py)
+    __tablename__ = "organization_shards"
+
+    organization_id = Column(String, primary_key=True)
+    shard = Column(String, nullable=False)
+    frozen = Column(Boolean, nullable=False, default=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
 
 class Employee(Base):
     __tablename__ = "employees"
@@ -44,13 +60,21 @@ class Employee(Base):
     role = Column(String, nullable=False)
     organization_id = Column(String, ForeignKey(
         'organizations.id'), nullable=False, index=True)
+    # Key from the customer's HR system, used by bulk imports (roster.py)
+    external_id = Column(String, nullable=True)
+
+    __table_args__ = (
+        Index("uq_employees_organization_id_external_id",
+              "organization_id", "external_id", unique=True),
+    )
 
 
 class WeeklyScore(Base):
     __tablename__ = "weekly_scores"
 
     id = Column(Integer, primary_key=True, index=True)
-    employee_id = Column(Integer, ForeignKey("employees.id"))
+    # A deleted employee takes their scores along (migrate_delete_cascade.py)
+    employee_id = Column(Integer, ForeignKey("employees.id", ondelete="CASCADE"))
     week = Column(String, nullable=False)
     task_completion = Column(Float)
     speed = Column(Float)
@@ -58,4 +82,38 @@ class WeeklyScore(Base):
     activity = Column(Float)
     productivity_score = Column(Float)
     organization_id = Column(String, ForeignKey(
-        'organizations.id'), nullable=False, index=True)
+        'organizations.id'), nullable=False)
+
+    # Every score query filters by organization and usually by week; on a
+    # partitioned table (see partitioning.py) these are created per
+    # partition. One score per employee and week, which also serves lookups
+    # by employee_id; it includes the partition key, as Postgres requires.
+    __table_args__ = (
+        Index("ix_weekly_scores_organization_id_week", "organization_id", "week"),
+        Index("uq_weekly_scores_employee_id_week", "employee_id", "week", unique=True),
+    )
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(String, primary_key=True, index=True)
+    kind = Column(String, nullable=False)
+    status = Column(String, nullable=False, default='queued', index=True)
+    organization_id = Column(String, nullable=True, index=True)
+    user_id = Column(Integer, nullable=True)
+    payload = Column(Text)
+    progress = Column(Float, default=0)
+    progress_message = Column(String)
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    locked_by = Column(String)
+    result = Column(LargeBinary)
+    result_name = Column(String)
+    result_media_type = Column(String)
+    error = Column(Text)
+    run_after = Column(DateTime, default=datetime.utcnow, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    heartbeat_at = Column(DateTime)
+    finished_at = Column(DateTime)
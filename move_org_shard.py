@@ -0,0 +1,192 @@
+from sqlalchemy import select, delete, insert, func, text
+from database import (engine, shard_engines, create_shard_schemas, lookup_shard,
+                      SHARD_MAP_TTL, DEFAULT_SHARD)
+from models import Employee, WeeklyScore, OrganizationShard
+from generate_data import insert_batches
+from datetime import datetime
+import argparse
+import sys
+import time
+
+# Move one organization's employees and scores to another shard while the
+# app keeps serving it:
+#   python move_org_shard.py <organization_id> <target_shard>
+#   1. bulk copy   - copy every row while the org stays writable
+#   2. freeze      - mark the org frozen; writes get a 503 and jobs retry
+#   3. delta copy  - re-read the source and apply what changed since step 1
+#   4. flip        - point the directory at the target and unfreeze
+#   5. clean up    - delete the rows from the old shard
+# Every directory change is followed by a pause of SHARD_MAP_TTL_SECONDS so
+# that every web and worker process has dropped its cached route.
+# Ids are copied as-is, so the move stops before copying anything if the
+# target already has rows with the same ids.
+
+TABLES = (Employee, WeeklyScore)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Move an organization between shards")
+    parser.add_argument("organization_id")
+    parser.add_argument("target_shard")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--dry-run", action="store_true",
+                        help="only report row counts and id conflicts")
+    return parser.parse_args()
+
+
+def load_rows(conn, model, organization_id):
+    table = model.__table__
+    rows = conn.execute(select(table).where(
+        table.c.organization_id == organization_id).order_by(table.c.id)).mappings()
+    return {row["id"]: dict(row) for row in rows}
+
+
+def id_conflicts(source, target, organization_id):
+    conflicts = {}
+    with source.connect() as src, target.connect() as dst:
+        for model in TABLES:
+            table = model.__table__
+            ids = list(load_rows(src, model, organization_id))
+            clashing = 0
+            for start in range(0, len(ids), 1000):
+                clashing += dst.execute(select(func.count()).select_from(table).where(
+                    table.c.id.in_(ids[start:start + 1000]),
+                    table.c.organization_id != organization_id)).scalar()
+            if clashing:
+                conflicts[table.name] = clashing
+    return conflicts
+
+
+def sync(source, target, organization_id, batch_size):
+    # Makes the target's rows for the org identical to the source's.
+    # Employees go in before the scores that reference them and scores are
+    # removed before the employees they reference.
+    changes = {}
+    with source.connect() as src, target.begin() as dst:
+        wanted = {model: load_rows(src, model, organization_id) for model in TABLES}
+        present = {model: load_rows(dst, model, organization_id) for model in TABLES}
+
+        for model in reversed(TABLES):
+            table = model.__table__
+            gone = [row_id for row_id in present[model] if row_id not in wanted[model]]
+            for start in range(0, len(gone), batch_size):
+                dst.execute(delete(table).where(table.c.id.in_(gone[start:start + batch_size])))
+            changes[f"{table.name}_deleted"] = len(gone)
+
+        for model in TABLES:
+            table = model.__table__
+            new = [row for row_id, row in wanted[model].items() if row_id not in present[model]]
+            changed = [row for row_id, row in wanted[model].items()
+                       if row_id in present[model] and present[model][row_id] != row]
+            insert_batches(dst, table, new, batch_size)
+            for row in changed:
+                dst.execute(table.update().where(table.c.id == row["id"]).values(**row))
+            changes[f"{table.name}_copied"] = len(new)
+            changes[f"{table.name}_updated"] = len(changed)
+
+        if dst.dialect.name == "postgresql":
+            # Explicit ids do not advance the sequence
+            for model in TABLES:
+                name = model.__tablename__
+                sequence = dst.execute(text(
+                    f"SELECT pg_get_serial_sequence('{name}', 'id')")).scalar()
+                last_value = dst.execute(text(f"SELECT last_value FROM {sequence}")).scalar()
+                max_id = dst.execute(select(func.max(model.__table__.c.id))).scalar()
+                if max_id and max_id >= last_value:
+                    dst.execute(text("SELECT setval(:sequence, :value)"),
+                                {"sequence": sequence, "value": max_id})
+    return changes
+
+
+def purge(shard_engine, organization_id, batch_size):
+    deleted = 0
+    with shard_engine.connect() as conn:
+        for model in reversed(TABLES):
+            table = model.__table__
+            while True:
+                ids = conn.execute(select(table.c.id).where(
+                    table.c.organization_id == organization_id).limit(batch_size)).scalars().all()
+                if not ids:
+                    break
+                conn.execute(delete(table).where(table.c.id.in_(ids)))
+                conn.commit()
+                deleted += len(ids)
+    return deleted
+
+
+def set_route(organization_id, shard, frozen):
+    with engine.begin() as conn:
+        table = OrganizationShard.__table__
+        updated = conn.execute(table.update().where(
+            table.c.organization_id == organization_id
+        ).values(shard=shard, frozen=frozen, updated_at=datetime.utcnow())).rowcount
+        if not updated:
+            conn.execute(insert(table).values(
+                organization_id=organization_id, shard=shard, frozen=frozen,
+                updated_at=datetime.utcnow()))
+
+
+def wait_for_routes():
+    time.sleep(SHARD_MAP_TTL + 1)
+
+
+def main():
+    args = parse_args()
+    org = args.organization_id
+
+    if args.target_shard not in shard_engines:
+        print(f"❌ Unknown shard '{args.target_shard}'. Known: {', '.join(shard_engines)}")
+        sys.exit(1)
+
+    create_shard_schemas()
+    source_shard, frozen = lookup_shard(org)
+    if frozen:
+        print(f"❌ {org} is frozen; another move may be running (or crashed mid-move)")
+        sys.exit(1)
+    if source_shard == args.target_shard:
+        print(f"✅ {org} already lives on '{source_shard}'")
+        return
+
+    source = shard_engines[source_shard]
+    target = shard_engines[args.target_shard]
+    print(f"📦 Moving {org}: {source_shard} -> {args.target_shard}")
+
+    conflicts = id_conflicts(source, target, org)
+    if conflicts:
+        print(f"❌ Target already has rows with these ids: {conflicts}")
+        sys.exit(1)
+
+    if args.dry_run:
+        with source.connect() as conn:
+            for model in TABLES:
+                print(f"  {model.__tablename__}: {len(load_rows(conn, model, org))} rows")
+        print("✅ No id conflicts")
+        return
+
+    started = time.perf_counter()
+    print(f"  1/5 bulk copy: {sync(source, target, org, args.batch_size)}")
+
+    set_route(org, source_shard, frozen=True)
+    wait_for_routes()
+    frozen_at = time.perf_counter()
+    try:
+        print(f"  2/5 frozen, 3/5 delta copy: {sync(source, target, org, args.batch_size)}")
+    except Exception:
+        set_route(org, source_shard, frozen=False)
+        print("❌ Delta copy failed; the org was unfrozen on its old shard")
+        raise
+
+    set_route(org, args.target_shard, frozen=False)
+    print(f"  4/5 flipped (writes paused {time.perf_counter() - frozen_at:.1f}s)")
+    wait_for_routes()
+
+    print(f"  5/5 removed {purge(source, org, args.batch_size)} rows from '{source_shard}'")
+    if args.target_shard == DEFAULT_SHARD:
+        with engine.begin() as conn:
+            conn.execute(delete(OrganizationShard.__table__).where(
+                OrganizationShard.__table__.c.organization_id == org))
+    print(f"🎉 Done in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
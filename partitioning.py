@@ -0,0 +1,187 @@
+from sqlalchemy import text
+from database import shard_engines
+from get_current_week import current_week
+import argparse
+import os
+import re
+
+# Postgres range partitioning of weekly_scores by week label.
+#   python migrate_partition_scores.py          (one-off conversion)
+#   python partitioning.py status
+#   python partitioning.py ensure               (create upcoming partitions)
+#   python partitioning.py drop-before 2024-W00 [--keep]
+# Week labels are zero-padded ("2026-W05") so they range-partition as
+# strings. Each partition covers SCORE_PARTITION_WEEKS weeks of one year
+# (quarters by default); labels that match no partition land in
+# weekly_scores_default. The worker calls ensure_partitions() on every
+# shard so the next SCORE_PARTITIONS_AHEAD partitions always exist.
+# Queries prune partitions as long as they filter on `week` with literals
+# or bound parameters (=, BETWEEN, <, >).
+PARTITION_WEEKS = int(os.getenv("SCORE_PARTITION_WEEKS", "13"))
+PARTITIONS_AHEAD = int(os.getenv("SCORE_PARTITIONS_AHEAD", "2"))
+PARENT = "weekly_scores"
+DEFAULT_PARTITION = "weekly_scores_default"
+WEEK_LABEL = re.compile(r"^(\d{4})-W(\d{2})$")
+PARTITION_NAME = re.compile(r"^weekly_scores_(\d{4})_w(\d{2})$")
+
+
+def year_starts():
+    # First week number of every partition in a year; a short tail at the
+    # end of the year is folded into the last partition
+    starts = list(range(0, 54, PARTITION_WEEKS))
+    if len(starts) > 1 and 54 - starts[-1] < PARTITION_WEEKS:
+        starts.pop()
+    return starts
+
+
+def partition_for(week):
+    # (name, lower bound, upper bound) of the partition holding `week`
+    match = WEEK_LABEL.match(week)
+    if not match:
+        raise ValueError(f"Not a week label: {week}")
+    year, number = int(match.group(1)), int(match.group(2))
+    starts = year_starts()
+    index = max(i for i, start in enumerate(starts) if start <= number)
+    lower = f"{year}-W{starts[index]:02d}"
+    if index + 1 < len(starts):
+        upper = f"{year}-W{starts[index + 1]:02d}"
+    else:
+        upper = f"{year + 1}-W00"
+    return f"{PARENT}_{year}_w{starts[index]:02d}", lower, upper
+
+
+def is_partitioned(conn):
+    if conn.dialect.name != "postgresql":
+        return False
+    return conn.execute(text(
+        "SELECT relkind FROM pg_class WHERE relname = :name AND relkind = 'p'"
+    ), {"name": PARENT}).first() is not None
+
+
+def list_partitions(conn):
+    rows = conn.execute(text("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid), c.reltuples::bigint
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = :name
+        ORDER BY c.relname
+    """), {"name": PARENT})
+    return [{"name": name, "bounds": bounds, "estimated_rows": max(0, rows)}
+            for name, bounds, rows in rows]
+
+
+def create_default_partition(conn):
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {PARENT} DEFAULT"))
+
+
+def create_partition(conn, week):
+    # Returns the partition name if it had to be created, else None
+    name, lower, upper = partition_for(week)
+    exists = conn.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar()
+    if exists:
+        return None
+
+    has_default = conn.execute(text(
+        "SELECT to_regclass(:name)"), {"name": DEFAULT_PARTITION}).scalar()
+    in_default = has_default and conn.execute(text(
+        f"SELECT 1 FROM {DEFAULT_PARTITION} WHERE week >= :lower AND week < :upper LIMIT 1"
+    ), {"lower": lower, "upper": upper}).first()
+
+    if in_default:
+        # Postgres refuses a new partition while the default partition holds
+        # rows for its range, so move those rows over before attaching it
+        conn.execute(text(
+            f"CREATE TABLE {name} (LIKE {PARENT} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+        conn.execute(text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+            f"WHERE week >= :lower AND week < :upper RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        ), {"lower": lower, "upper": upper})
+        conn.execute(text(
+            f"ALTER TABLE {PARENT} ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ('{lower}') TO ('{upper}')"))
+    else:
+        conn.execute(text(
+            f"CREATE TABLE {name} PARTITION OF {PARENT} "
+            f"FOR VALUES FROM ('{lower}') TO ('{upper}')"))
+    return name
+
+
+def ensure_partitions(conn, ahead=PARTITIONS_AHEAD):
+    # The current partition and the next `ahead` ones
+    created = []
+    week = current_week()
+    for _ in range(ahead + 1):
+        name = create_partition(conn, week)
+        if name:
+            created.append(name)
+        week = partition_for(week)[2]
+    return created
+
+
+def drop_partitions_before(conn, week, keep=False):
+    # Detaches every partition that ends on or before `week`; unless `keep`
+    # is set the detached tables are dropped too
+    removed = []
+    for partition in list_partitions(conn):
+        match = PARTITION_NAME.match(partition["name"])
+        if not match:
+            continue
+        _, _, upper = partition_for(f"{match.group(1)}-W{match.group(2)}")
+        if upper <= week:
+            conn.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {partition['name']}"))
+            if not keep:
+                conn.execute(text(f"DROP TABLE {partition['name']}"))
+            removed.append(partition["name"])
+    return removed
+
+
+def maintain():
+    # Called periodically by worker.py
+    created = []
+    for shard, shard_engine in shard_engines.items():
+        if shard_engine.dialect.name != "postgresql":
+            continue
+        with shard_engine.begin() as conn:
+            if is_partitioned(conn):
+                created += [f"{shard}:{name}" for name in ensure_partitions(conn)]
+    return created
+
+
+def main():
+    parser = argparse.ArgumentParser(description="weekly_scores partition maintenance")
+    parser.add_argument("--shard", default=None, help="only this shard (default: all)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="list partitions")
+    ensure_parser = sub.add_parser("ensure", help="create upcoming partitions")
+    ensure_parser.add_argument("--ahead", type=int, default=PARTITIONS_AHEAD)
+    drop_parser = sub.add_parser("drop-before", help="detach and drop old partitions")
+    drop_parser.add_argument("week", help="partitions ending on or before this week label")
+    drop_parser.add_argument("--keep", action="store_true",
+                             help="detach only, keep the tables")
+    args = parser.parse_args()
+
+    for shard, shard_engine in shard_engines.items():
+        if args.shard and shard != args.shard:
+            continue
+        with shard_engine.begin() as conn:
+            if not is_partitioned(conn):
+                print(f"⏭️  {shard}: weekly_scores is not partitioned")
+                continue
+            if args.command == "status":
+                print(f"📊 {shard}:")
+                for partition in list_partitions(conn):
+                    print(f"  {partition['name']:<32} {partition['estimated_rows']:>10}  {partition['bounds']}")
+            elif args.command == "ensure":
+                created = ensure_partitions(conn, args.ahead)
+                print(f"✅ {shard}: created {', '.join(created) or 'nothing'}")
+            elif args.command == "drop-before":
+                removed = drop_partitions_before(conn, args.week, args.keep)
+                action = "detached" if args.keep else "dropped"
+                print(f"🗑️  {shard}: {action} {', '.join(removed) or 'nothing'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+from concurrent.futures import ThreadPoolExecutor
+import base64
+import hashlib
+import hmac
+import os
+import threading
+
+# Password hashing with scrypt, a memory-hard KDF. The KDF runs in its own
+# small pool so a burst of logins only ever occupies PASSWORD_HASH_WORKERS
+# cores, and at most PASSWORD_HASH_MAX_PENDING jobs may be queued or running
+# at once. Callers beyond that get HashingBusy straight away, which the API
+# turns into a 503: a caller waiting for a slot would hold one of the
+# request threadpool's threads, and a login burst could stall every other
+# endpoint that way.
+#
+# Stored format: scrypt$<n>$<r>$<p>$<salt b64>$<hash b64>
+# Hashes from before the switch are bare SHA-256 hex digests; they still
+# verify, and needs_rehash() reports them so login can upgrade them.
+SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", "1"))
+SALT_BYTES = 16
+HASH_BYTES = 32
+
+HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", str(HASH_WORKERS * 4)))
+
+_pool = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="password-hash")
+_slots = threading.BoundedSemaphore(HASH_MAX_PENDING)
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def _b64(data):
+    return base64.b64encode(data).decode()
+
+
+def _scrypt(password, salt, n, r, p):
+    # hashlib.scrypt releases the GIL while OpenSSL does the work
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * r * n, dklen=HASH_BYTES)
+
+
+def _is_legacy(stored):
+    return len(stored) == 64 and "$" not in stored
+
+
+def _hash(password):
+    salt = os.urandom(SALT_BYTES)
+    digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(digest)}"
+
+
+def _verify(password, stored):
+    if _is_legacy(stored):
+        return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+    try:
+        algorithm, n, r, p, salt, digest = stored.split("$")
+        if algorithm != "scrypt":
+            return False
+        expected = base64.b64decode(digest)
+        actual = _scrypt(password, base64.b64decode(salt), int(n), int(r), int(p))
+    except ValueError:
+        return False
+    return hmac.compare_digest(actual, expected)
+
+
+def _run(fn, *args):
+    if not _slots.acquire(blocking=False):
+        raise HashingBusy()
+    try:
+        return _pool.submit(fn, *args).result()
+    finally:
+        _slots.release()
+
+
+def hash_password(password: str) -> str:
+    return _run(_hash, password)
+
+
+def verify_password(password: str, stored: str) -> bool:
+    return _run(_verify, password, stored)
+
+
+def needs_rehash(stored: str) -> bool:
+    if _is_legacy(stored):
+        return True
+    parts = stored.split("$")
+    return parts[:4] != ["scrypt", str(SCRYPT_N), str(SCRYPT_R), str(SCRYPT_P)]
+
+
+# Verified against when the username does not exist, so unknown and known
+# usernames take the same time to reject
+DUMMY_HASH = _hash(os.urandom(16).hex())
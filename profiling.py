@@ -0,0 +1,169 @@
+from fastapi.routing import APIRoute
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime
+import functools
+import inspect
+import json
+import os
+import random
+import sys
+import threading
+import uuid
+
+# Opt-in request profiler. A profile is taken when an admin sends the
+# X-Profile header or when a request falls inside PROFILE_SAMPLE_RATE.
+# Stacks are sampled from the thread running the handler and stored in
+# the "folded" format read by flamegraph.pl, speedscope and inferno.
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+PROFILE_HEADER = "x-profile"
+
+current_profile = ContextVar("current_profile", default=None)
+
+
+class Profile:
+    def __init__(self, reason):
+        self.id = uuid.uuid4().hex
+        self.reason = reason
+        self.stacks = Counter()
+        self.samples = 0
+
+
+def should_sample():
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler(threading.Thread):
+    def __init__(self, profile, thread_id, interval=PROFILE_INTERVAL):
+        super().__init__(daemon=True)
+        self.profile = profile
+        self.thread_id = thread_id
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            self.profile.stacks[";".join(reversed(stack))] += 1
+            self.profile.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _profiled(endpoint):
+    # Sampling happens in the thread that actually runs the handler, which
+    # for sync endpoints is a threadpool worker rather than the event loop.
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            profile = current_profile.get()
+            if profile is None:
+                return await endpoint(*args, **kwargs)
+            sampler = StackSampler(profile, threading.get_ident())
+            sampler.start()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                sampler.stop()
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            profile = current_profile.get()
+            if profile is None:
+                return endpoint(*args, **kwargs)
+            sampler = StackSampler(profile, threading.get_ident())
+            sampler.start()
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                sampler.stop()
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, _profiled(endpoint), **kwargs)
+
+
+def save_profile(profile, route, method, organization_id, status_code, duration_ms):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    meta = {
+        "id": profile.id,
+        "route": route,
+        "method": method,
+        "organization_id": organization_id,
+        "status_code": status_code,
+        "duration_ms": round(duration_ms, 2),
+        "samples": profile.samples,
+        "interval_ms": PROFILE_INTERVAL * 1000,
+        "reason": profile.reason,
+        "created_at": datetime.utcnow().isoformat(),
+    }
+    with open(os.path.join(PROFILE_DIR, f"{profile.id}.folded"), "w") as f:
+        for stack, count in profile.stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    with open(os.path.join(PROFILE_DIR, f"{profile.id}.json"), "w") as f:
+        json.dump(meta, f)
+    _prune()
+    return meta
+
+
+def _prune():
+    metas = sorted(
+        (os.path.join(PROFILE_DIR, name) for name in os.listdir(PROFILE_DIR)
+         if name.endswith(".json")),
+        key=os.path.getmtime
+    )
+    for path in metas[:max(0, len(metas) - PROFILE_MAX_FILES)]:
+        for ext in (".json", ".folded"):
+            try:
+                os.remove(path[:-len(".json")] + ext)
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(organization_id=None):
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in os.listdir(PROFILE_DIR):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(PROFILE_DIR, name)) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if organization_id is None or meta.get("organization_id") == organization_id:
+            profiles.append(meta)
+    return sorted(profiles, key=lambda m: m["created_at"], reverse=True)
+
+
+def load_profile(profile_id):
+    # Profile ids are uuid hex strings; anything else never touches the disk
+    if len(profile_id) != 32 or any(c not in "0123456789abcdef" for c in profile_id):
+        return None, None
+    try:
+        with open(os.path.join(PROFILE_DIR, f"{profile_id}.json")) as f:
+            meta = json.load(f)
+        with open(os.path.join(PROFILE_DIR, f"{profile_id}.folded")) as f:
+            folded = f.read()
+    except (OSError, ValueError):
+        return None, None
+    return meta, folded
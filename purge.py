@@ -0,0 +1,148 @@
+from sqlalchemy import select, delete, func, tuple_
+from database import SessionLocal, tenant_session
+from models import Employee, WeeklyScore, Organization, OrganizationShard, OrganizationMembership
+from analytics import analytics
+from search import indexes as search_indexes
+from cache import invalidate, employees_key, members_key, me_key
+import archive
+import argparse
+import os
+import sys
+import time
+
+# Deletes an organization's data without one huge transaction.
+#   python purge.py ORG_ID            (shows what would be deleted)
+#   python purge.py ORG_ID --yes
+# Also used by DELETE /auth/account and the purge_organization job.
+# Children go before parents (scores, then employees, then the directory
+# rows), each table in batches of PURGE_BATCH_SIZE rows with a commit after
+# every batch, so locks are held for one batch at a time and a purge that
+# stops half way can simply be run again. Batches walk an index with a
+# keyset instead of OFFSET, so later batches do not rescan deleted rows.
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "1000"))
+
+
+def count_rows(db, organization_id):
+    scores = db.scalar(select(func.count()).select_from(WeeklyScore).where(
+        WeeklyScore.organization_id == organization_id))
+    employees = db.scalar(select(func.count()).select_from(Employee).where(
+        Employee.organization_id == organization_id))
+    return scores, employees
+
+
+def delete_scores(db, organization_id, batch_size, done):
+    # Walks ix_weekly_scores_organization_id_week in (week, id) order; the
+    # week range on the DELETE lets a partitioned table prune partitions
+    deleted, last = 0, None
+    while True:
+        statement = select(WeeklyScore.week, WeeklyScore.id).where(
+            WeeklyScore.organization_id == organization_id)
+        if last:
+            statement = statement.where(WeeklyScore.week >= last[0],
+                                        tuple_(WeeklyScore.week, WeeklyScore.id) > last)
+        rows = db.execute(statement.order_by(WeeklyScore.week, WeeklyScore.id)
+                          .limit(batch_size)).all()
+        if not rows:
+            return deleted
+        db.execute(delete(WeeklyScore).where(
+            WeeklyScore.organization_id == organization_id,
+            WeeklyScore.week.between(rows[0].week, rows[-1].week),
+            WeeklyScore.id.in_([row.id for row in rows])))
+        db.commit()
+        deleted += len(rows)
+        last = tuple(rows[-1])
+        done(len(rows))
+
+
+def delete_employees(db, organization_id, batch_size, done):
+    deleted, last_id = 0, 0
+    while True:
+        ids = db.execute(select(Employee.id).where(
+            Employee.organization_id == organization_id, Employee.id > last_id
+        ).order_by(Employee.id).limit(batch_size)).scalars().all()
+        if not ids:
+            return deleted
+        # Scores written since delete_scores ran go with their employee
+        # (ON DELETE CASCADE where the database enforces it)
+        db.execute(delete(WeeklyScore).where(WeeklyScore.employee_id.in_(ids)))
+        db.execute(delete(Employee).where(Employee.id.in_(ids)))
+        db.commit()
+        deleted += len(ids)
+        last_id = ids[-1]
+        done(len(ids))
+
+
+def purge_tenant_data(db, organization_id, batch_size=PURGE_BATCH_SIZE, progress=None):
+    # Scores and employees only; `db` is a session on the org's shard.
+    # progress(fraction, message) is called after every batch; the rows are
+    # only counted up front when someone is watching.
+    total = sum(count_rows(db, organization_id)) if progress else 0
+    started = time.monotonic()
+    deleted = 0
+
+    def done(rows):
+        nonlocal deleted
+        deleted += rows
+        if progress:
+            rate = deleted / max(time.monotonic() - started, 1e-6)
+            progress(deleted / total if total else 1.0,
+                     f"{deleted}/{total} rows deleted ({rate:,.0f} rows/s)")
+
+    result = {
+        "scores": delete_scores(db, organization_id, batch_size, done),
+        "employees": delete_employees(db, organization_id, batch_size, done),
+    }
+    analytics.invalidate(organization_id)
+    search_indexes.invalidate(organization_id)
+    invalidate(employees_key(organization_id))
+    return result
+
+
+def purge_organization(db, organization_id, batch_size=PURGE_BATCH_SIZE, progress=None):
+    # Tenant data, then the organization's directory rows and archive files
+    result = purge_tenant_data(db, organization_id, batch_size, progress)
+    member_ids = db.execute(select(OrganizationMembership.user_id).where(
+        OrganizationMembership.organization_id == organization_id)).scalars().all()
+    db.execute(delete(OrganizationMembership).where(
+        OrganizationMembership.organization_id == organization_id))
+    db.execute(delete(OrganizationShard).where(
+        OrganizationShard.organization_id == organization_id))
+    db.execute(delete(Organization).where(Organization.id == organization_id))
+    db.commit()
+    archive.delete_organization(organization_id)
+    invalidate(members_key(organization_id), *(me_key(user_id) for user_id in member_ids))
+    return {**result, "organization_id": organization_id}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Delete an organization and all its data")
+    parser.add_argument("organization_id")
+    parser.add_argument("--batch-size", type=int, default=PURGE_BATCH_SIZE)
+    parser.add_argument("--yes", action="store_true", help="without it only the counts are shown")
+    args = parser.parse_args()
+
+    directory = SessionLocal()
+    try:
+        org = directory.get(Organization, args.organization_id)
+    finally:
+        directory.close()
+    if not org:
+        sys.exit(f"❌ No organization {args.organization_id}")
+
+    db = tenant_session(args.organization_id)
+    try:
+        scores, employees = count_rows(db, args.organization_id)
+        if not args.yes:
+            print(f"🔍 {org.name}: {employees} employees and {scores} scores would be deleted; "
+                  f"pass --yes to delete them")
+            return
+        result = purge_organization(
+            db, args.organization_id, args.batch_size,
+            progress=lambda fraction, message: print(f"  {fraction:6.1%}  {message}", file=sys.stderr))
+    finally:
+        db.close()
+    print(f"✅ Deleted {org.name}: {result['employees']} employees, {result['scores']} scores")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+from contextlib import contextmanager
+import argparse
+import asyncio
+import io
+import os
+import sys
+import tempfile
+
+# Query-count and query-plan regression check for every endpoint in app.py.
+#   python query_budget.py                          (throwaway SQLite file)
+#   python query_budget.py --database-url postgresql://.../scratch_db
+# Seeds a dataset with generate_data.py, calls each endpoint handler with a
+# fresh session and fails when a route issues more SQL statements than its
+# budget. Budgets must not depend on row counts, so an N+1 loop fails here.
+# On Postgres every statement touching a hot table is also EXPLAINed with
+# enable_seqscan off; a Seq Scan that survives means no index can serve it.
+# Point this at a scratch database: it creates and modifies data.
+
+HOT_TABLES = {"weekly_scores", "employees"}
+
+# Statements that are allowed to scan a hot table, with the reason
+KNOWN_SEQ_SCANS = {}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Per-endpoint SQL budget check")
+    parser.add_argument("--database-url", default=None,
+                        help="scratch database to seed (default: temporary SQLite file)")
+    parser.add_argument("--employees", type=int, default=25)
+    parser.add_argument("--weeks", type=int, default=6)
+    parser.add_argument("--verbose", action="store_true",
+                        help="print every captured statement")
+    return parser.parse_args()
+
+
+args = parse_args()
+os.environ.setdefault("ARCHIVE_DIR", tempfile.mkdtemp())
+if args.database_url:
+    os.environ["DATABASE_URL"] = args.database_url
+else:
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(
+        tempfile.mkdtemp(), "query_budget.db")
+
+# Imported after DATABASE_URL is set so the app binds to the scratch database
+from sqlalchemy import event  # noqa: E402
+from database import engine, SessionLocal  # noqa: E402
+from models import Employee, WeeklyScore, OrganizationMembership, Job  # noqa: E402
+from jobs import run_job  # noqa: E402
+import generate_data  # noqa: E402
+from cache import cache  # noqa: E402
+from analytics import analytics  # noqa: E402
+from search import indexes as search_indexes  # noqa: E402
+import smtplib  # noqa: E402
+import app  # noqa: E402
+
+
+class StatementRecorder:
+    def __init__(self):
+        self.active = False
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if self.active:
+            self.statements.append((statement, parameters, executemany))
+
+    @contextmanager
+    def paused(self):
+        active, self.active = self.active, False
+        try:
+            yield
+        finally:
+            self.active = active
+
+
+recorder = StatementRecorder()
+
+
+class FakeSMTP:
+    def __init__(self, *a, **kw):
+        pass
+
+    def starttls(self):
+        pass
+
+    def login(self, *a):
+        pass
+
+    def send_message(self, msg):
+        pass
+
+    def quit(self):
+        pass
+
+
+def drain(response):
+    # Streams are lazy; reading the body runs their queries
+    async def read():
+        return [chunk async for chunk in response.body_iterator]
+    return asyncio.run(read())
+
+
+def touches_hot_table(statement):
+    lowered = statement.lower()
+    return any(table in lowered for table in HOT_TABLES)
+
+
+def seq_scans(plan, found=None):
+    found = [] if found is None else found
+    relation = plan.get("Relation Name") or ""
+    # Partitions of a hot table (weekly_scores_2026_w13) count as the table
+    hot = [table for table in HOT_TABLES if relation == table or relation.startswith(table + "_")]
+    if plan.get("Node Type") == "Seq Scan" and hot:
+        found.append(hot[0])
+    for child in plan.get("Plans", []):
+        seq_scans(child, found)
+    return found
+
+
+def explain_seq_scans(statements):
+    scans = []
+    with engine.connect() as conn:
+        conn.exec_driver_sql("SET enable_seqscan = off")
+        for statement, parameters, executemany in statements:
+            first_word = statement.lstrip().split(None, 1)[0].upper()
+            if executemany or first_word not in ("SELECT", "UPDATE", "DELETE"):
+                continue
+            if not touches_hot_table(statement):
+                continue
+            result = conn.exec_driver_sql(
+                "EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+            for table in seq_scans(result[0]["Plan"]):
+                scans.append((table, statement))
+        conn.rollback()
+    return scans
+
+
+def build_cases(ctx):
+    org = ctx["organization_id"]
+    admin = {"user_id": ctx["admin_id"], "organization_id": org, "role": "admin"}
+    employee_id = ctx["employee_id"]
+    week = ctx["week"]
+    password = ctx["password"]
+
+    def email(db):
+        smtplib.SMTP, real = FakeSMTP, smtplib.SMTP
+        try:
+            return app.email_report(
+                week=week, recipient_email="qa@example.com", smtp_server="localhost",
+                smtp_port=25, sender_email="noreply@example.com", sender_password="x",
+                background=False, current_user=admin, db=db)
+        finally:
+            smtplib.SMTP = real
+
+    def switch(db):
+        app.create_session(admin["user_id"], org, "admin")
+        return app.switch_organization(organization_id=org, current_user=admin, db=db)
+
+    def new_member(db):
+        return app.create_team_member(
+            username="qb_member", email="qb_member@example.com", password=password,
+            role="viewer", current_user=admin, db=db)
+
+    def import_roster(dry_run):
+        roster = (f"external_id,name,department,role\n"
+                  f"id:{employee_id},Renamed Again,QA,Tester\n"
+                  f"qb-1,Imported One,QA,Tester\n"
+                  f"qb-2,Imported Two,QA,Tester\n").encode()
+        return lambda db: app.import_employees(
+            file=app.UploadFile(io.BytesIO(roster), filename="roster.csv"),
+            dry_run=dry_run, current_user=admin, db=db)
+
+    def last_job(db):
+        # The job the previous case queued, run to completion outside the
+        # count so the job endpoints have a finished job with a result
+        with recorder.paused():
+            job = db.query(Job).filter(Job.organization_id == org).order_by(
+                Job.created_at.desc()).first()
+            if job.status == "queued":
+                job = run_job(db, job)
+            db.expire_all()
+            return job.id
+
+    def new_score(db):
+        return app.add_weekly_score(
+            employee_id=employee_id, week="2099-W01", task_completion=80, speed=70,
+            professionalism=90, activity=60, current_user=admin, db=db)
+
+    # (name, statement budget, call) -- order matters, later cases use
+    # rows created by earlier ones
+    return [
+        ("register", 3, lambda db: app.register(
+            username="qb_owner", email="qb_owner@example.com", password=password, db=db)),
+        ("login", 2, lambda db: app.login(
+            username=ctx["admin_username"], password=password, db=db)),
+        ("get_current_user_info", 2, lambda db: app.get_current_user_info(
+            current_user=admin, db=db)),
+        ("switch_organization", 1, switch),
+        ("get_employees", 1, lambda db: app.get_employees(current_user=admin, db=db)),
+        ("search_employees", 1, lambda db: app.search_employees_endpoint(
+            q="eng", limit=20, current_user=admin, db=db)),
+        ("get_employee", 1, lambda db: app.get_employee(
+            employee_id=employee_id, current_user=admin, db=db)),
+        ("get_employee_history", 2, lambda db: app.get_employee_history(
+            employee_id=employee_id, metric="productivity_score", from_week=None,
+            to_week=None, current_user=admin, db=db)),
+        ("get_employee_histories", 2, lambda db: app.get_employee_histories(
+            ids=",".join(map(str, ctx["employee_ids"])), metric="productivity_score",
+            from_week=week, to_week=None, current_user=admin, db=db)),
+        ("create_employee", 2, lambda db: app.create_employee(
+            name="QB Employee", department="QA", role="Tester", current_user=admin, db=db)),
+        ("update_employee", 3, lambda db: app.update_employee(
+            employee_id=employee_id, name="Renamed", department=None, role=None,
+            current_user=admin, db=db)),
+        ("export_employees[csv]", 1, lambda db: drain(app.export_employees(
+            format="csv", current_user=admin, db=db))),
+        ("export_employees[xlsx]", 1, lambda db: app.export_employees(
+            format="xlsx", current_user=admin, db=db)),
+        ("import_employees[dry]", 1, import_roster(True)),
+        ("import_employees", 3, import_roster(False)),
+        ("get_scores", 1, lambda db: app.get_scores(
+            from_week=None, to_week=None, current_user=admin, db=db)),
+        ("get_scores[range]", 1, lambda db: app.get_scores(
+            from_week=week, to_week=week, current_user=admin, db=db)),
+        ("get_moving_averages", 2, lambda db: app.get_moving_averages(
+            window=4, metric="productivity_score", employee_id=None, from_week=None,
+            to_week=None, current_user=admin, db=db)),
+        ("get_department_means", 2, lambda db: app.get_department_means(
+            metric="productivity_score", from_week=None, to_week=None,
+            current_user=admin, db=db)),
+        ("get_week_over_week", 2, lambda db: app.get_week_over_week(
+            metric="productivity_score", from_week=None, to_week=None,
+            current_user=admin, db=db)),
+        ("add_weekly_score", 1, new_score),
+        ("delete_score", 2, lambda db: app.delete_score(
+            score_id=ctx["score_id"], current_user=admin, db=db)),
+        ("recompute_scores", 2, lambda db: app.recompute_scores(current_user=admin, db=db)),
+        ("get_jobs", 1, lambda db: app.get_jobs(limit=50, current_user=admin, db=db)),
+        ("get_job", 1, lambda db: app.get_job(
+            job_id=last_job(db), current_user=admin, db=db)),
+        ("get_job_result", 1, lambda db: app.get_job_result(
+            job_id=last_job(db), current_user=admin, db=db)),
+        ("archive_scores", 2, lambda db: app.archive_scores(
+            before_week=week, current_user=admin, db=db)),
+        ("get_profiles", 0, lambda db: app.get_profiles(current_user=admin)),
+        ("get_cache_stats", 0, lambda db: app.get_cache_stats(current_user=admin)),
+        ("get_team_members", 1, lambda db: app.get_team_members(current_user=admin, db=db)),
+        ("batch", 5, lambda db: app.batch(requests=[
+            {"id": "me", "path": "/auth/me"}, {"id": "employees", "path": "/employees"},
+            {"id": "scores", "path": f"/scores?from={week}"},
+            {"id": "members", "path": "/team/members"}], current_user=admin)),
+        ("create_team_member", 2, new_member),
+        ("remove_team_member", 2, lambda db: app.remove_team_member(
+            user_id=ctx["user_id"]("qb_member"), current_user=admin, db=db)),
+        ("invite_user_to_team", 2, lambda db: app.invite_user_to_team(
+            username_or_email="qb_member", role="viewer", current_user=admin, db=db)),
+        ("export_to_excel", 1, lambda db: app.export_to_excel(
+            week=week, current_user=admin, db=db)),
+        ("export_to_pdf", 1, lambda db: app.export_to_pdf(
+            week=week, current_user=admin, db=db)),
+        ("export_bundle", 2, lambda db: app.export_bundle(
+            from_week=week, to_week=week, formats="xlsx,pdf", layout="weekly",
+            current_user=admin, db=db)),
+        ("email_report", 1, email),
+        ("delete_employee", 3, lambda db: app.delete_employee(
+            employee_id=employee_id, current_user=admin, db=db)),
+        ("delete_account", 11, lambda db: app.delete_account(
+            current_user={**admin, "user_id": ctx["user_id"]("qb_owner")}, db=db)),
+        ("delete_account[background]", 11, lambda db: app.delete_account(
+            background=True, current_user={**admin, "user_id": ctx["owner_id"]()}, db=db)),
+    ]
+
+
+def seed():
+    counts, credentials, _ = generate_data.generate(
+        orgs=2, employees=args.employees, weeks=args.weeks, viewers=1, skew=0,
+        batch_size=1000, password="budget", prefix="qb", seed=7)
+    creds = credentials[0]
+    db = SessionLocal()
+    try:
+        score = db.query(WeeklyScore).filter(
+            WeeklyScore.organization_id == creds["organization_id"]).first()
+        admin_membership = db.query(OrganizationMembership).filter(
+            OrganizationMembership.organization_id == creds["organization_id"],
+            OrganizationMembership.role == "admin").first()
+        employee_count = db.query(Employee).filter(
+            Employee.organization_id == creds["organization_id"]).count()
+        employee_ids = [employee_id for (employee_id,) in db.query(Employee.id).filter(
+            Employee.organization_id == creds["organization_id"]).limit(20)]
+    finally:
+        db.close()
+
+    def user_id(username):
+        # Fixture lookup, not counted against the endpoint being checked
+        with recorder.paused(), engine.connect() as conn:
+            return conn.execute(
+                app.User.__table__.select().where(app.User.username == username)
+            ).first().id
+
+    def owner_id():
+        # A second owner with an organization of their own, for the
+        # background delete_account case
+        with recorder.paused():
+            db = SessionLocal()
+            try:
+                app.register(username="qb_owner2", email="qb_owner2@example.com",
+                             password="budget", db=db)
+            finally:
+                db.close()
+        return user_id("qb_owner2")
+
+    print(f"🌱 Seeded {sum(counts.values())} rows "
+          f"({employee_count} employees in the checked org)")
+    return {
+        "organization_id": creds["organization_id"],
+        "admin_username": creds["username"],
+        "admin_id": admin_membership.user_id,
+        "password": "budget",
+        "employee_id": score.employee_id,
+        "employee_ids": employee_ids,
+        "score_id": score.id,
+        "week": score.week,
+        "user_id": user_id,
+        "owner_id": owner_id,
+    }
+
+
+def main():
+    ctx = seed()
+    event.listen(engine, "before_cursor_execute", recorder)
+    postgres = engine.dialect.name == "postgresql"
+    failures = []
+
+    print(f"\n{'Endpoint':<24} {'Queries':>7} {'Budget':>7}  Plan")
+    print("-" * 60)
+    for name, budget, call in build_cases(ctx):
+        # Budgets are for the uncached path
+        cache.clear()
+        analytics.clear()
+        search_indexes.clear()
+        db = SessionLocal()
+        recorder.statements = []
+        recorder.active = True
+        try:
+            call(db)
+        except Exception as e:
+            failures.append(f"{name}: raised {e!r}")
+        finally:
+            recorder.active = False
+            db.close()
+
+        statements = recorder.statements
+        count = len(statements)
+        plan_note = "-"
+        if postgres:
+            scans = explain_seq_scans(statements)
+            if scans and name not in KNOWN_SEQ_SCANS:
+                plan_note = "SEQ SCAN " + ", ".join(sorted({t for t, _ in scans}))
+                for table, statement in scans:
+                    failures.append(f"{name}: sequential scan on {table}: {statement}")
+            else:
+                plan_note = "ok" if not scans else "known seq scan"
+
+        status = "✅" if count <= budget else "❌"
+        print(f"{status} {name:<22} {count:>7} {budget:>7}  {plan_note}")
+        if count > budget:
+            failures.append(f"{name}: {count} statements, budget is {budget}")
+        if args.verbose:
+            for statement, _, _ in statements:
+                print("      " + " ".join(statement.split())[:160])
+
+    event.remove(engine, "before_cursor_execute", recorder)
+    if failures:
+        print(f"\n❌ {len(failures)} failure(s):")
+        for failure in failures:
+            print("   " + failure)
+        sys.exit(1)
+    print("\n✅ All endpoints within budget")
+
+
+if __name__ == "__main__":
+    main()
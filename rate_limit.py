@@ -0,0 +1,241 @@
+from collections import OrderedDict
+import anyio
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+
+# Admission control in front of the app:
+#   1. token buckets per IP, per user and per organization, with separate
+#      budgets for sign-in, expensive routes (exports, email, bulk writes),
+#      other writes and reads
+#   2. a global cap on in-flight requests with a short queue; once the
+#      queue is full new requests are shed immediately with a 503
+# Buckets live in process memory, or in Redis when RATE_LIMIT_REDIS_URL is
+# set so that the limits hold across every worker. A request takes a token
+# from each of its buckets only if all of them have one, so a client held
+# back by its own bucket does not also drain its organization's or IP's.
+#
+# Limits are "<requests>/<seconds>" and can be overridden per class with
+# RATE_LIMIT_<CLASS>, e.g. RATE_LIMIT_LOGIN=5/60.
+DEFAULT_LIMITS = {
+    "login": "10/60",
+    "expensive": "20/60",
+    "write": "300/60",
+    "read": "1200/60",
+    "ip": "3000/60",
+}
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "64"))
+MAX_QUEUED_REQUESTS = int(os.getenv("MAX_QUEUED_REQUESTS", "128"))
+QUEUE_TIMEOUT = float(os.getenv("QUEUE_TIMEOUT_SECONDS", "5"))
+TRUSTED_PROXIES = int(os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "0"))
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL")
+
+EXEMPT_PATHS = {"/"}
+EXPENSIVE_PREFIXES = ("/export", "/email", "/employees/bulk", "/batch")
+
+
+def parse_limit(value):
+    requests, seconds = value.split("/")
+    capacity = float(requests)
+    return capacity, capacity / float(seconds)
+
+
+LIMITS = {
+    name: parse_limit(os.getenv(f"RATE_LIMIT_{name.upper()}", default))
+    for name, default in DEFAULT_LIMITS.items()
+}
+
+
+def classify(method, path):
+    if method == "POST" and path in ("/auth/login", "/auth/register"):
+        return "login"
+    if path.startswith(EXPENSIVE_PREFIXES):
+        return "expensive"
+    if method in ("POST", "PUT", "PATCH", "DELETE"):
+        return "write"
+    return "read"
+
+
+class MemoryBuckets:
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, limits):
+        # limits are (key, capacity, rate). Returns 0 when allowed, otherwise
+        # seconds until every bucket has a token free
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            for key, capacity, rate in limits:
+                tokens, last = self._buckets.pop(key, (capacity, now))
+                levels.append((key, min(capacity, tokens + (now - last) * rate), rate))
+            retry_after = max(((1 - tokens) / rate for _, tokens, rate in levels if tokens < 1),
+                              default=0.0)
+            for key, tokens, _ in levels:
+                self._buckets[key] = (tokens if retry_after else tokens - 1, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return retry_after
+
+
+class RedisBuckets:
+    # ARGV is now, then capacity and rate for each key in KEYS
+    SCRIPT = """
+    local now = tonumber(ARGV[1])
+    local levels = {}
+    local retry_after = 0
+    for i, key in ipairs(KEYS) do
+        local capacity = tonumber(ARGV[i * 2])
+        local rate = tonumber(ARGV[i * 2 + 1])
+        local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+        local tokens = tonumber(bucket[1]) or capacity
+        local ts = tonumber(bucket[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+        if tokens < 1 then
+            retry_after = math.max(retry_after, (1 - tokens) / rate)
+        end
+        levels[i] = tokens
+    end
+    for i, key in ipairs(KEYS) do
+        local capacity = tonumber(ARGV[i * 2])
+        local rate = tonumber(ARGV[i * 2 + 1])
+        local tokens = levels[i]
+        if retry_after == 0 then
+            tokens = tokens - 1
+        end
+        redis.call('HSET', key, 'tokens', tokens, 'ts', now)
+        redis.call('PEXPIRE', key, math.ceil(capacity / rate * 1000) + 1000)
+    end
+    return tostring(retry_after)
+    """
+
+    def __init__(self, url, prefix="ratelimit:"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("RATE_LIMIT_REDIS_URL is set but the redis package is not installed; "
+                               "pip install -r requirements.txt") from None
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._take = self.client.register_script(self.SCRIPT)
+
+    def take(self, limits):
+        args = [time.time()]
+        for _, capacity, rate in limits:
+            args += [capacity, rate]
+        return float(self._take(keys=[self.prefix + key for key, _, _ in limits], args=args))
+
+
+class ConcurrencyLimiter:
+    def __init__(self, max_inflight=MAX_CONCURRENT_REQUESTS, max_queued=MAX_QUEUED_REQUESTS,
+                 timeout=QUEUE_TIMEOUT):
+        self.max_inflight = max_inflight
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.inflight = 0
+        self.queued = 0
+        self.shed = 0
+        self._semaphore = asyncio.Semaphore(max_inflight)
+
+    async def acquire(self):
+        if self._semaphore.locked() and self.queued >= self.max_queued:
+            self.shed += 1
+            return False
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.shed += 1
+            return False
+        finally:
+            self.queued -= 1
+        self.inflight += 1
+        return True
+
+    def release(self):
+        self.inflight -= 1
+        self._semaphore.release()
+
+    def stats(self):
+        return {
+            "inflight": self.inflight,
+            "queued": self.queued,
+            "shed": self.shed,
+            "max_inflight": self.max_inflight,
+            "max_queued": self.max_queued,
+        }
+
+
+buckets = RedisBuckets(RATE_LIMIT_REDIS_URL) if RATE_LIMIT_REDIS_URL else MemoryBuckets()
+concurrency = ConcurrencyLimiter()
+
+
+def client_ip(scope, headers):
+    forwarded = headers.get(b"x-forwarded-for")
+    if TRUSTED_PROXIES and forwarded:
+        hops = [h.strip() for h in forwarded.decode().split(",")]
+        return hops[max(0, len(hops) - TRUSTED_PROXIES)]
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def check_limits(method, path, ip, session):
+    route_class = classify(method, path)
+    capacity, rate = LIMITS[route_class]
+    limits = [(f"ip:{ip}", *LIMITS["ip"])]
+    if route_class == "login" or not session:
+        limits.append((f"{route_class}:ip:{ip}", capacity, rate))
+    else:
+        limits.append((f"{route_class}:user:{session['user_id']}", capacity, rate))
+        # An org shares a budget several times a single user's
+        limits.append((f"{route_class}:org:{session['organization_id']}", capacity * 5, rate * 5))
+    return buckets.take(limits)
+
+
+async def send_json(send, status, detail, retry_after):
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionControl:
+    def __init__(self, app, verify_session):
+        self.app = app
+        self.verify_session = verify_session
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] == "OPTIONS" or scope["path"] in EXEMPT_PATHS:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        authorization = headers.get(b"authorization", b"").decode()
+        session = self.verify_session(authorization.replace("Bearer ", "")) if authorization else None
+        ip = client_ip(scope, headers)
+
+        if isinstance(buckets, RedisBuckets):
+            retry_after = await anyio.to_thread.run_sync(
+                check_limits, scope["method"], scope["path"], ip, session)
+        else:
+            retry_after = check_limits(scope["method"], scope["path"], ip, session)
+        if retry_after:
+            return await send_json(send, 429, "Rate limit exceeded", retry_after)
+
+        if not await concurrency.acquire():
+            return await send_json(send, 503, "Server is busy, please retry", 1)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            concurrency.release()
@@ -0,0 +1,175 @@
+import openpyxl
+from openpyxl.styles import Font, PatternFill, Alignment
+from reportlab.lib.pagesizes import letter
+from reportlab.lib import colors
+from reportlab.lib.units import inch
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.lib.styles import getSampleStyleSheet
+from sqlalchemy import select
+from models import Employee, WeeklyScore
+from archive import archived_scores, archived_weeks, merge_report_rows
+import statements
+from itertools import groupby
+import io
+import zipfile
+
+# Report loading and rendering shared by the export and email endpoints
+# and the background jobs. Each renderer takes the week label and a list
+# of (WeeklyScore, employee_name) rows.
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+def weekly_report_rows(db, organization_id, week):
+    # One joined query instead of an employee lookup per score, plus the
+    # week's archive file if it has been moved to cold storage
+    rows = db.execute(statements.week_report, {
+        "week": week, "organization_id": organization_id}).all()
+    return merge_report_rows(db, rows, archived_scores(organization_id, week, week))
+
+
+def report_weeks(db, organization_id, from_week, to_week):
+    # Weeks in [from_week, to_week] that have scores, hot or archived,
+    # without loading any rows (served by the (organization_id, week) index)
+    hot = db.scalars(select(WeeklyScore.week).distinct().where(
+        WeeklyScore.organization_id == organization_id,
+        WeeklyScore.week.between(from_week, to_week)))
+    return sorted(set(hot) | set(archived_weeks(organization_id, from_week, to_week)))
+
+
+def range_report_rows(db, organization_id, from_week, to_week):
+    # Every week in [from_week, to_week] in one query, as {week: rows}.
+    # Week labels are zero-padded ("2026-W05") so they sort as strings.
+    rows = db.query(WeeklyScore, Employee.name).outerjoin(
+        Employee, Employee.id == WeeklyScore.employee_id
+    ).filter(
+        WeeklyScore.organization_id == organization_id,
+        WeeklyScore.week.between(from_week, to_week)
+    ).order_by(WeeklyScore.week, WeeklyScore.id).all()
+    rows = merge_report_rows(db, rows, archived_scores(organization_id, from_week, to_week))
+    return {week: list(week_rows) for week, week_rows in groupby(rows, key=lambda r: r[0].week)}
+
+
+def fill_worksheet(ws, week, rows):
+    ws.title = f"Week {week}"
+
+    ws['A1'] = f'Weekly Productivity Report - {week}'
+    ws['A1'].font = Font(size=16, bold=True)
+    ws.merge_cells('A1:G1')
+
+    headers = ['Employee ID', 'Employee Name', 'Task', 'Speed',
+               'Professional', 'Activity', 'Productivity Score']
+    for col, header in enumerate(headers, start=1):
+        cell = ws.cell(row=3, column=col)
+        cell.value = header
+        cell.font = Font(bold=True)
+        cell.fill = PatternFill(start_color="4472C4",
+                                end_color="4472C4", fill_type="solid")
+        cell.alignment = Alignment(horizontal='center')
+
+    for row, (score, employee_name) in enumerate(rows, start=4):
+        ws.cell(row=row, column=1).value = score.employee_id
+        ws.cell(row=row, column=2).value = employee_name or 'Unknown'
+        ws.cell(row=row, column=3).value = score.task_completion
+        ws.cell(row=row, column=4).value = score.speed
+        ws.cell(row=row, column=5).value = score.professionalism
+        ws.cell(row=row, column=6).value = score.activity
+        ws.cell(row=row, column=7).value = score.productivity_score
+        ws.cell(row=row, column=7).font = Font(bold=True)
+
+    for col in range(1, 8):
+        ws.column_dimensions[openpyxl.utils.get_column_letter(col)].width = 15
+
+
+def render_excel(week, rows):
+    wb = openpyxl.Workbook()
+    fill_worksheet(wb.active, week, rows)
+
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+
+def render_workbook(weeks):
+    # One workbook with a sheet per week; `weeks` is {week: rows}
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    for week, rows in weeks.items():
+        fill_worksheet(wb.create_sheet(), week, rows)
+
+    output = io.BytesIO()
+    wb.save(output)
+    return output.getvalue()
+
+
+def render_pdf(week, rows):
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    elements = []
+    styles = getSampleStyleSheet()
+
+    title = Paragraph(
+        f"<b>Weekly Productivity Report - {week}</b>", styles['Title'])
+    elements.append(title)
+    elements.append(Spacer(1, 0.3*inch))
+
+    data = [['Employee', 'Task', 'Speed', 'Prof.', 'Activity', 'Score']]
+
+    for score, employee_name in rows:
+        data.append([
+            employee_name or 'Unknown',
+            str(score.task_completion),
+            str(score.speed),
+            str(score.professionalism),
+            str(score.activity),
+            str(score.productivity_score)
+        ])
+
+    table = Table(data)
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+
+    elements.append(table)
+    doc.build(elements)
+    return buffer.getvalue()
+
+
+class _ChunkSink(io.RawIOBase):
+    # Write-only, non-seekable target for ZipFile; zipfile then writes data
+    # descriptors after each member instead of seeking back to patch headers
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        # Everything written since the last drain, as at most one chunk
+        chunks, self.chunks = self.chunks, []
+        return [b"".join(chunks)] if chunks else []
+
+
+def stream_zip(members):
+    # `members` yields (filename, render) pairs; each member is rendered,
+    # compressed and handed to the client before the next one starts, so
+    # only one rendered report is held in memory at a time
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w") as archive:
+        for filename, render in members:
+            # xlsx files are zip archives already
+            compression = zipfile.ZIP_STORED if filename.endswith(".xlsx") else zipfile.ZIP_DEFLATED
+            archive.writestr(filename, render(), compress_type=compression)
+            yield from sink.drain()
+    yield from sink.drain()
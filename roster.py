@@ -0,0 +1,182 @@
+from sqlalchemy import select, insert, update
+from models import Employee
+import openpyxl
+import codecs
+import csv
+import io
+import os
+import zipfile
+
+# Bulk employee import and export for /employees/bulk.
+# A roster file is CSV or xlsx with a header row naming the columns below
+# (any order, case-insensitive). Rows are matched to existing employees by
+# external_id, the key from the customer's HR system, so re-uploading the
+# same extract is a no-op. An upload is compared against the organization's
+# whole roster with one query, then applied as a handful of executemany
+# INSERT and UPDATE statements in a single transaction.
+MAX_IMPORT_ROWS = int(os.getenv("MAX_IMPORT_ROWS", "50000"))
+BATCH_SIZE = 1000
+# Changed rows listed in an import response; the counts are always complete
+DIFF_PREVIEW_LIMIT = 500
+
+COLUMNS = ("external_id", "name", "department", "role")
+FIELDS = COLUMNS[1:]
+FORMATS = {
+    "csv": "text/csv",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+class RosterError(ValueError):
+    def __init__(self, errors):
+        super().__init__(f"{len(errors)} invalid rows")
+        self.errors = errors
+
+
+def file_format(filename):
+    extension = (filename or "").rsplit(".", 1)[-1].lower()
+    if extension not in FORMATS:
+        raise RosterError([{"row": None, "error": "Upload a .csv or .xlsx file"}])
+    return extension
+
+
+def csv_records(stream):
+    # utf-8-sig drops the BOM Excel puts in front of CSV exports
+    return csv.reader(codecs.iterdecode(stream, "utf-8-sig"))
+
+
+def xlsx_records(stream):
+    try:
+        workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, KeyError, OSError):
+        raise RosterError([{"row": None, "error": "Not a readable .xlsx workbook"}])
+    try:
+        for values in workbook.active.iter_rows(values_only=True):
+            yield ["" if value is None else str(value) for value in values]
+    finally:
+        workbook.close()
+
+
+def read_roster(stream, fmt):
+    # {external_id: {name, department, role}} in file order; every problem
+    # is collected so the whole file can be fixed in one go
+    records = csv_records(stream) if fmt == "csv" else xlsx_records(stream)
+    header = [column.strip().lower() for column in next(records, [])]
+    missing = [column for column in COLUMNS if column not in header]
+    if missing:
+        raise RosterError([{"row": 1, "error": f"Missing columns: {', '.join(missing)}"}])
+    positions = [header.index(column) for column in COLUMNS]
+
+    roster, errors = {}, []
+    for line, values in enumerate(records, start=2):
+        if not any(value.strip() for value in values):
+            continue
+        row = {column: values[position].strip() if position < len(values) else ""
+               for column, position in zip(COLUMNS, positions)}
+        empty = [column for column in COLUMNS if not row[column]]
+        if empty:
+            errors.append({"row": line, "error": f"Empty {', '.join(empty)}"})
+        elif row["external_id"] in roster:
+            errors.append({"row": line, "error": f"Duplicate external_id {row['external_id']}"})
+        else:
+            roster[row.pop("external_id")] = row
+        if len(roster) > MAX_IMPORT_ROWS:
+            raise RosterError([{"row": line, "error": f"More than {MAX_IMPORT_ROWS} rows"}])
+    if errors:
+        raise RosterError(errors)
+    return roster
+
+
+def roster_key(external_id, employee_id):
+    # Employees created one at a time have no external_id; exports list them
+    # as "id:<id>" so an exported file can be edited and imported back
+    return external_id or f"id:{employee_id}"
+
+
+def diff_roster(db, organization_id, roster):
+    current = {
+        roster_key(row.external_id, row.id): row for row in db.execute(
+            select(Employee.id, Employee.external_id, *(getattr(Employee, f) for f in FIELDS))
+            .where(Employee.organization_id == organization_id)
+        )
+    }
+    inserts, updates, unchanged, errors = [], [], 0, []
+    for external_id, row in roster.items():
+        existing = current.get(external_id)
+        if existing is None:
+            if external_id.startswith("id:"):
+                errors.append({"row": None, "error": f"No employee {external_id}"})
+            inserts.append({"external_id": external_id, **row})
+            continue
+        changes = {field: row[field] for field in FIELDS if getattr(existing, field) != row[field]}
+        if changes:
+            updates.append({"id": existing.id, "external_id": external_id, **changes,
+                            "previous": {field: getattr(existing, field) for field in changes}})
+        else:
+            unchanged += 1
+    if errors:
+        raise RosterError(errors)
+    return {"inserts": inserts, "updates": updates, "unchanged": unchanged}
+
+
+def apply_diff(db, organization_id, diff):
+    for start in range(0, len(diff["inserts"]), BATCH_SIZE):
+        db.execute(insert(Employee), [
+            {**row, "organization_id": organization_id}
+            for row in diff["inserts"][start:start + BATCH_SIZE]])
+    # Rows grouped by changed columns so each group is one executemany
+    groups = {}
+    for row in diff["updates"]:
+        changed = tuple(field for field in FIELDS if field in row)
+        groups.setdefault(changed, []).append(
+            {"id": row["id"], **{field: row[field] for field in changed}})
+    for rows in groups.values():
+        for start in range(0, len(rows), BATCH_SIZE):
+            db.execute(update(Employee), rows[start:start + BATCH_SIZE])
+    db.commit()
+
+
+def summarize(diff, dry_run):
+    return {
+        "dry_run": dry_run,
+        "inserted": len(diff["inserts"]),
+        "updated": len(diff["updates"]),
+        "unchanged": diff["unchanged"],
+        "inserts": diff["inserts"][:DIFF_PREVIEW_LIMIT],
+        "updates": diff["updates"][:DIFF_PREVIEW_LIMIT],
+    }
+
+
+def roster_rows(db, organization_id):
+    rows = db.execute(
+        select(Employee.external_id, *(getattr(Employee, f) for f in FIELDS), Employee.id)
+        .where(Employee.organization_id == organization_id)
+        .order_by(Employee.id)
+        .execution_options(yield_per=BATCH_SIZE)
+    )
+    for row in rows:
+        yield [roster_key(row.external_id, row.id), *row[1:4]]
+
+
+def stream_csv(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for count, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if count % BATCH_SIZE == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+def render_roster_xlsx(rows):
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet("Employees")
+    sheet.append(COLUMNS)
+    for row in rows:
+        sheet.append(row)
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
@@ -0,0 +1,408 @@
+from sqlalchemy import select, func, literal, literal_column, text
+from models import Employee
+from cache import cache, MISSING
+from bisect import bisect_left, insort
+from collections import OrderedDict
+import heapq
+import os
+import re
+import threading
+import uuid
+
+# Employee search over name, department and role for /employees/search.
+# Matches word prefixes ("eng" -> "Engineering") and tolerates typos
+# ("enginer" -> "Engineer"); every query word has to match something, on
+# both backends below.
+# Trigrams miss slips in short words, where one swapped letter changes most
+# of them ("alcie" and "alice" share 2 of 10), so query words of 4 to 6
+# letters also match words one edit away, a swap of two adjacent letters
+# counting as one edit.
+#
+# On Postgres with pg_trgm (python migrate_employee_search.py) the search
+# runs in SQL against a GIN trigram index: one condition per query word, a
+# word-start regex for prefixes and one-edit typos and word_similarity for
+# the rest. Otherwise each process builds an in-memory index per
+# organization on first use: sorted word list for prefixes, word trigrams
+# for typos, single-letter deletions of short words for short typos, and
+# postings from words to employees.
+# Employee writes add a link to a chain of changes in the shared cache,
+# from the org's previous version stamp to a new one, naming the employees
+# written. A process whose index is behind follows the chain and re-reads
+# just those employees; a missing link, or a bulk write that names no
+# employees, means a full rebuild instead.
+SEARCH_MAX_ORGS = int(os.getenv("SEARCH_INDEX_MAX_ORGS", "200"))
+SEARCH_FUZZY_THRESHOLD = float(os.getenv("SEARCH_FUZZY_THRESHOLD", "0.4"))
+MAX_RESULTS = 100
+# Version stamps and change links outlive ordinary cache entries: an
+# expired stamp costs a full rebuild
+SEARCH_VERSION_TTL = float(os.getenv("SEARCH_VERSION_TTL_SECONDS", "86400"))
+# Past this many links behind, or this many changed employees, rebuilding
+# is cheaper than patching
+MAX_CHANGE_LINKS = 100
+MAX_PATCH_EMPLOYEES = 1000
+
+# Indexed rows are (id, name, department, role). Name matches rank above
+# role matches, role above department.
+FIELD_WEIGHTS = ((1, 1.0), (3, 0.6), (2, 0.5))
+EXACT, PREFIX, FUZZY, TYPO = 1.0, 0.9, 0.8, 0.6
+MIN_TYPO_LENGTH, MAX_TYPO_LENGTH = 4, 6
+WORD = re.compile(r"\w+")
+
+
+def words(value):
+    return WORD.findall((value or "").lower())
+
+
+def trigrams(word):
+    # Padded like pg_trgm, so short words and word starts still count
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def deletions(word):
+    # The word and every string one deleted letter away from it. Two words
+    # within one edit of each other always share one of these.
+    return {word} | {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+def edit_distance(a, b):
+    # Optimal string alignment distance: inserting, deleting or replacing a
+    # letter, or swapping two adjacent ones, each cost one
+    before, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1,
+                             previous[j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        before, previous = previous, current
+    return previous[-1]
+
+
+def one_edit_pattern(term):
+    # Regex alternatives for every word one edit away from `term`, matching
+    # edit_distance() == 1: a replaced, inserted or deleted letter, or two
+    # adjacent letters swapped
+    variants = set()
+    for i in range(len(term) + 1):
+        variants.add(term[:i] + r"\w" + term[i:])
+        if i < len(term):
+            variants.add(term[:i] + r"\w" + term[i + 1:])
+            variants.add(term[:i] + term[i + 1:])
+        if i < len(term) - 1:
+            variants.add(term[:i] + term[i + 1] + term[i] + term[i + 2:])
+    return "|".join(sorted(variants))
+
+
+def version_key(organization_id):
+    return f"org:{organization_id}:search_version"
+
+
+def change_key(organization_id, version):
+    # The link from `version` to the version written after it
+    return f"org:{organization_id}:search_change:{version}"
+
+
+def employee_dict(employee, score):
+    return {"id": employee[0], "name": employee[1], "department": employee[2],
+            "role": employee[3], "score": round(score, 3)}
+
+
+class OrgIndex:
+    def __init__(self, employees, version):
+        self.version = version
+        self.employees = []
+        self.positions = {}
+        self.word_ids = {}
+        self.words = []
+        self.postings = []
+        self.word_trigrams = []
+        self.trigram_words = {}
+        self.deletion_words = {}
+        # Sorted once after the build, kept sorted by later inserts
+        self.sorted_words = None
+        self.lock = threading.Lock()
+        for employee in employees:
+            self.positions[employee[0]] = len(self.employees)
+            self.employees.append(employee)
+            self._index(len(self.employees) - 1)
+        self.sorted_words = sorted(self.word_ids)
+
+    def _add_word(self, word):
+        word_id = self.word_ids[word] = len(self.postings)
+        self.words.append(word)
+        self.postings.append({})
+        grams = trigrams(word)
+        self.word_trigrams.append(len(grams))
+        for gram in grams:
+            self.trigram_words.setdefault(gram, []).append(word_id)
+        if MIN_TYPO_LENGTH - 1 <= len(word) <= MAX_TYPO_LENGTH + 1:
+            for variant in deletions(word):
+                self.deletion_words.setdefault(variant, []).append(word_id)
+        if self.sorted_words is not None:
+            insort(self.sorted_words, word)
+        return word_id
+
+    def _index(self, position):
+        employee = self.employees[position]
+        for field, weight in FIELD_WEIGHTS:
+            for word in words(employee[field]):
+                word_id = self.word_ids.get(word)
+                if word_id is None:
+                    word_id = self._add_word(word)
+                postings = self.postings[word_id]
+                if postings.get(position, 0) < weight:
+                    postings[position] = weight
+
+    def _unindex(self, position):
+        # Words stay in the vocabulary with one posting fewer
+        for field, _ in FIELD_WEIGHTS:
+            for word in words(self.employees[position][field]):
+                self.postings[self.word_ids[word]].pop(position, None)
+
+    def apply(self, base, version, employee_ids, rows):
+        # Brings a copy at version `base` up to `version`: `rows` are the
+        # current (id, name, department, role) of the changed employees,
+        # ids without a row were deleted. Returns False if another thread
+        # moved the copy on first.
+        current = {row[0]: row for row in rows}
+        with self.lock:
+            if self.version != base:
+                return False
+            for employee_id in employee_ids:
+                position = self.positions.get(employee_id)
+                if position is not None:
+                    self._unindex(position)
+                employee = current.get(employee_id)
+                if employee is None:
+                    if position is not None:
+                        self.employees[position] = None
+                        del self.positions[employee_id]
+                    continue
+                if position is None:
+                    position = self.positions[employee_id] = len(self.employees)
+                    self.employees.append(employee)
+                else:
+                    self.employees[position] = employee
+                self._index(position)
+            self.version = version
+        return True
+
+    def match_words(self, term):
+        # {word_id: match strength} for one query word
+        matches = {}
+        start = bisect_left(self.sorted_words, term)
+        for word in self.sorted_words[start:]:
+            if not word.startswith(term):
+                break
+            matches[self.word_ids[word]] = EXACT if word == term else PREFIX
+
+        if len(term) >= 3:
+            grams = trigrams(term)
+            shared = {}
+            for gram in grams:
+                for word_id in self.trigram_words.get(gram, ()):
+                    shared[word_id] = shared.get(word_id, 0) + 1
+            for word_id, count in shared.items():
+                similarity = count / (len(grams) + self.word_trigrams[word_id] - count)
+                if similarity >= SEARCH_FUZZY_THRESHOLD:
+                    matches[word_id] = max(matches.get(word_id, 0), FUZZY * similarity)
+
+        if MIN_TYPO_LENGTH <= len(term) <= MAX_TYPO_LENGTH:
+            candidates = {word_id for variant in deletions(term)
+                          for word_id in self.deletion_words.get(variant, ())}
+            for word_id in candidates:
+                if matches.get(word_id, 0) < TYPO and edit_distance(term, self.words[word_id]) == 1:
+                    matches[word_id] = TYPO
+        return matches
+
+    def search(self, query, limit):
+        # Searches and patches of one org's copy take turns
+        with self.lock:
+            return self._search(query, limit)
+
+    def _search(self, query, limit):
+        totals = None
+        for term in dict.fromkeys(words(query)):
+            best = {}
+            for word_id, strength in self.match_words(term).items():
+                for position, weight in self.postings[word_id].items():
+                    score = strength * weight
+                    if score > best.get(position, 0):
+                        best[position] = score
+            if totals is None:
+                totals = best
+            else:
+                totals = {position: totals[position] + score
+                          for position, score in best.items() if position in totals}
+            if not totals:
+                return []
+
+        ranked = heapq.nsmallest(limit, (totals or {}).items(),
+                                 key=lambda item: (-item[1], self.employees[item[0]][1]))
+        return [employee_dict(self.employees[position], score) for position, score in ranked]
+
+
+class SearchIndexes:
+    def __init__(self, max_orgs=SEARCH_MAX_ORGS):
+        self.max_orgs = max_orgs
+        self._orgs = OrderedDict()
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.patches = 0
+
+    def get(self, db, organization_id):
+        version = cache.get(version_key(organization_id))
+        with self._lock:
+            index = self._orgs.get(organization_id)
+            if index is not None:
+                self._orgs.move_to_end(organization_id)
+
+        if index is not None and version is not MISSING:
+            base = index.version
+            if base == version:
+                return index
+            employee_ids = self.changes(organization_id, base, version)
+            if employee_ids is not None:
+                rows = db.execute(
+                    select(Employee.id, Employee.name, Employee.department, Employee.role)
+                    .where(Employee.organization_id == organization_id,
+                           Employee.id.in_(employee_ids))
+                ).all() if employee_ids else []
+                if index.apply(base, version, employee_ids, [tuple(e) for e in rows]):
+                    with self._lock:
+                        self.patches += 1
+                return index
+
+        if version is MISSING:
+            version = uuid.uuid4().hex
+            cache.set(version_key(organization_id), version, SEARCH_VERSION_TTL)
+        employees = db.execute(
+            select(Employee.id, Employee.name, Employee.department, Employee.role)
+            .where(Employee.organization_id == organization_id)
+        ).all()
+        index = OrgIndex([tuple(e) for e in employees], version)
+        with self._lock:
+            self.builds += 1
+            self._orgs[organization_id] = index
+            self._orgs.move_to_end(organization_id)
+            while len(self._orgs) > self.max_orgs:
+                self._orgs.popitem(last=False)
+        return index
+
+    def changes(self, organization_id, base, version):
+        # Employee ids written between two versions, or None if the chain
+        # from `base` does not lead to `version` in MAX_CHANGE_LINKS links
+        employee_ids = set()
+        for _ in range(MAX_CHANGE_LINKS):
+            link = cache.get(change_key(organization_id, base))
+            if link is MISSING or link["employee_ids"] is None:
+                return None
+            employee_ids.update(link["employee_ids"])
+            if len(employee_ids) > MAX_PATCH_EMPLOYEES:
+                return None
+            base = link["version"]
+            if base == version:
+                return sorted(employee_ids)
+        return None
+
+    def changed(self, organization_id, employee_ids=None):
+        # Called after a write to the org's employees; `employee_ids=None`
+        # (bulk writes) makes every process rebuild
+        if employee_ids is not None and len(employee_ids) > MAX_PATCH_EMPLOYEES:
+            employee_ids = None
+        head = cache.get(version_key(organization_id))
+        for _ in range(MAX_CHANGE_LINKS):
+            if head is MISSING:
+                break
+            version = uuid.uuid4().hex
+            link = {"version": version,
+                    "employee_ids": None if employee_ids is None else list(employee_ids)}
+            # Only one writer gets to extend the chain from a given version;
+            # the others move along to the version it wrote and try again
+            if cache.add(change_key(organization_id, head), link, SEARCH_VERSION_TTL):
+                cache.set(version_key(organization_id), version, SEARCH_VERSION_TTL)
+                # A writer that linked past `version` before the stamp above
+                # was stored would otherwise be hidden behind it
+                newer = cache.get(change_key(organization_id, version))
+                if newer is not MISSING:
+                    cache.set(version_key(organization_id), self.head(organization_id, newer["version"]),
+                              SEARCH_VERSION_TTL)
+                return
+            following = cache.get(change_key(organization_id, head))
+            if following is not MISSING:
+                head = following["version"]
+        # No chain to extend: a fresh stamp that no copy can catch up to
+        cache.set(version_key(organization_id), uuid.uuid4().hex, SEARCH_VERSION_TTL)
+
+    def head(self, organization_id, version):
+        for _ in range(MAX_CHANGE_LINKS):
+            link = cache.get(change_key(organization_id, version))
+            if link is MISSING:
+                break
+            version = link["version"]
+        return version
+
+    def invalidate(self, organization_id):
+        self.changed(organization_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._orgs.clear()
+
+
+indexes = SearchIndexes()
+_trigram_support = {}
+
+
+def has_trigram_index(db):
+    bind = db.get_bind(Employee)
+    if bind.dialect.name != "postgresql":
+        return False
+    if bind.url not in _trigram_support:
+        with bind.connect() as conn:
+            _trigram_support[bind.url] = conn.execute(text(
+                "SELECT 1 FROM pg_indexes WHERE indexname = 'ix_employees_search_trgm'"
+            )).first() is not None
+    return _trigram_support[bind.url]
+
+
+def search_text():
+    # Must stay identical to the expression indexed by
+    # migrate_employee_search.py
+    space = literal_column("' '")
+    return func.lower(Employee.name.concat(space).concat(Employee.department)
+                      .concat(space).concat(Employee.role))
+
+
+def search_sql(db, organization_id, query, limit):
+    terms = list(dict.fromkeys(words(query)))
+    haystack = search_text()
+    # Each word has to start a word of the haystack, be one edit from a
+    # short word, or be trigram-similar to part of it, like OrgIndex.search
+    conditions = []
+    for term in terms:
+        pattern = rf"\m{term}"
+        if MIN_TYPO_LENGTH <= len(term) <= MAX_TYPO_LENGTH:
+            pattern = rf"\m(?:{term}|(?:{one_edit_pattern(term)})\M)"
+        conditions.append(haystack.op("~")(pattern) | literal(term).op("<%")(haystack))
+    phrase = " ".join(terms)
+    similarity = func.word_similarity(phrase, haystack)
+    rows = db.execute(
+        select(Employee.id, Employee.name, Employee.department, Employee.role, similarity)
+        .where(Employee.organization_id == organization_id, *conditions)
+        .order_by(func.lower(Employee.name).startswith(phrase, autoescape=True).desc(),
+                  similarity.desc(), Employee.name)
+        .limit(limit)
+    ).all()
+    return [employee_dict(row[:4], row[4]) for row in rows]
+
+
+def search_employees(db, organization_id, query, limit=20):
+    limit = max(1, min(limit, MAX_RESULTS))
+    if not words(query):
+        return []
+    if has_trigram_index(db):
+        return search_sql(db, organization_id, query, limit)
+    return indexes.get(db, organization_id).search(query, limit)
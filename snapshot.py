@@ -0,0 +1,359 @@
+from sqlalchemy import select, insert
+from database import engine, shard_engines, shard_for, tenant_session, NEW_ORG_SHARD, DEFAULT_SHARD
+from models import User, Organization, OrganizationMembership, OrganizationShard, Employee, WeeklyScore
+import archive
+import purge
+from array import array
+from datetime import datetime, timedelta
+import argparse
+import csv
+import io
+import json
+import math
+import struct
+import sys
+import time
+import uuid
+import zlib
+
+# Organization snapshots: every row of one tenant in a single file, for
+# moving an organization between environments or restoring one.
+#   python snapshot.py export ORG_ID --output acme.wss
+#   python snapshot.py import acme.wss [--org NEW_ID] [--name NAME] [--shard SHARD]
+#   python snapshot.py info acme.wss
+# A snapshot is MAGIC, a JSON header, then frames of up to CHUNK_ROWS rows
+# of one table. A frame is (table, rows, length) followed by one
+# zlib-compressed columnar block: a typed array per numeric column, and for
+# text columns an array of lengths followed by the UTF-8 bytes. Export
+# reads through server-side cursors and import loads frame by frame (scores
+# with COPY on Postgres), so memory is bounded by one frame either way,
+# plus the employee id map.
+#
+# Imported rows get new ids; scores are pointed at their employees' new
+# ids. Memberships and the owner are matched to existing users by
+# username, and users missing from the target are skipped and counted.
+# Archived weeks (archive.py) are exported with the hot scores and come
+# back as hot rows. An import that fails part way is purged again.
+MAGIC = b"WSS1"
+FORMAT_VERSION = 1
+CHUNK_ROWS = 10000
+NULL_INT = -1
+END = 255
+EPOCH = datetime(1970, 1, 1)
+FRAME = struct.Struct("<BII")
+
+# (table, [(column, kind)]); frames are written in this order
+TABLES = [
+    ("organization", [("id", "str"), ("name", "str"), ("owner", "str"), ("created_at", "datetime")]),
+    ("memberships", [("username", "str"), ("role", "str"), ("joined_at", "datetime")]),
+    ("employees", [("id", "int"), ("name", "str"), ("department", "str"), ("role", "str"),
+                   ("external_id", "str")]),
+    ("scores", [("id", "int"), ("employee_id", "int"), ("week", "str"),
+                ("task_completion", "float"), ("speed", "float"), ("professionalism", "float"),
+                ("activity", "float"), ("productivity_score", "float")]),
+]
+TABLE_INDEX = {name: index for index, (name, _) in enumerate(TABLES)}
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+def encode_column(kind, values):
+    if kind == "int":
+        return array("q", (NULL_INT if v is None else v for v in values)).tobytes()
+    if kind == "float":
+        return array("d", (math.nan if v is None else v for v in values)).tobytes()
+    if kind == "datetime":
+        return array("d", (math.nan if v is None else (v - EPOCH).total_seconds()
+                           for v in values)).tobytes()
+    encoded = [None if v is None else v.encode() for v in values]
+    lengths = array("i", (-1 if e is None else len(e) for e in encoded))
+    return lengths.tobytes() + b"".join(e for e in encoded if e)
+
+
+def decode_column(kind, data, offset, rows):
+    typecode = {"int": "q", "float": "d", "datetime": "d"}.get(kind, "i")
+    values = array(typecode)
+    end = offset + rows * values.itemsize
+    values.frombytes(data[offset:end])
+    if kind == "int":
+        return [None if v == NULL_INT else v for v in values], end
+    if kind == "float":
+        return [None if math.isnan(v) else v for v in values], end
+    if kind == "datetime":
+        return [None if math.isnan(v) else EPOCH + timedelta(seconds=v) for v in values], end
+    strings = []
+    for length in values:
+        if length < 0:
+            strings.append(None)
+        else:
+            strings.append(data[end:end + length].decode())
+            end += length
+    return strings, end
+
+
+def write_frame(out, table, rows):
+    columns = TABLES[TABLE_INDEX[table]][1]
+    block = b"".join(encode_column(kind, values)
+                     for (_, kind), values in zip(columns, zip(*rows)))
+    block = zlib.compress(block, 6)
+    out.write(FRAME.pack(TABLE_INDEX[table], len(rows), len(block)))
+    out.write(block)
+
+
+def write_chunks(out, table, rows, counts):
+    chunk = []
+    for row in rows:
+        chunk.append(tuple(row))
+        if len(chunk) == CHUNK_ROWS:
+            write_frame(out, table, chunk)
+            counts[table] += len(chunk)
+            chunk = []
+    if chunk:
+        write_frame(out, table, chunk)
+        counts[table] += len(chunk)
+
+
+def stream(conn, statement):
+    result = conn.execution_options(stream_results=True, yield_per=CHUNK_ROWS).execute(statement)
+    for partition in result.partitions():
+        yield from partition
+
+
+def archived_rows(conn, organization_id):
+    # Archived weeks, minus rows still in the hot table (those were just
+    # exported); see archive.merge_scores
+    for week in archive.archived_weeks(organization_id):
+        hot_ids = set(conn.execute(select(WeeklyScore.id).where(
+            WeeklyScore.organization_id == organization_id,
+            WeeklyScore.week == week)).scalars())
+        for score in archive.read_week(organization_id, week):
+            if score.id not in hot_ids:
+                yield (score.id, score.employee_id, week, score.task_completion, score.speed,
+                       score.professionalism, score.activity, score.productivity_score)
+
+
+def export_snapshot(organization_id, out):
+    shard, _ = shard_for(organization_id)
+    counts = {name: 0 for name, _ in TABLES}
+    with engine.connect() as conn:
+        organization = conn.execute(
+            select(Organization.id, Organization.name, User.username, Organization.created_at)
+            .outerjoin(User, User.id == Organization.owner_id)
+            .where(Organization.id == organization_id)).first()
+        if organization is None:
+            raise SnapshotError(f"No organization {organization_id}")
+
+        header = {"format": FORMAT_VERSION, "organization_id": organization_id,
+                  "exported_at": datetime.utcnow().isoformat(), "source_shard": shard,
+                  "tables": {name: columns for name, columns in TABLES}}
+        raw_header = json.dumps(header).encode()
+        out.write(MAGIC + struct.pack("<I", len(raw_header)) + raw_header)
+
+        write_chunks(out, "organization", [organization], counts)
+        write_chunks(out, "memberships", stream(conn, select(
+            User.username, OrganizationMembership.role, OrganizationMembership.joined_at
+        ).join(User, User.id == OrganizationMembership.user_id).where(
+            OrganizationMembership.organization_id == organization_id
+        ).order_by(OrganizationMembership.id)), counts)
+
+    with shard_engines[shard].connect() as conn:
+        write_chunks(out, "employees", stream(conn, select(
+            Employee.id, Employee.name, Employee.department, Employee.role, Employee.external_id
+        ).where(Employee.organization_id == organization_id).order_by(Employee.id)), counts)
+        write_chunks(out, "scores", stream(conn, select(
+            WeeklyScore.id, WeeklyScore.employee_id, WeeklyScore.week,
+            WeeklyScore.task_completion, WeeklyScore.speed, WeeklyScore.professionalism,
+            WeeklyScore.activity, WeeklyScore.productivity_score
+        ).where(WeeklyScore.organization_id == organization_id).order_by(WeeklyScore.id)), counts)
+        write_chunks(out, "scores", archived_rows(conn, organization_id), counts)
+
+    out.write(FRAME.pack(END, 0, 0))
+    return counts
+
+
+def read_header(f):
+    if f.read(4) != MAGIC:
+        raise SnapshotError("Not an organization snapshot")
+    (length,) = struct.unpack("<I", f.read(4))
+    header = json.loads(f.read(length))
+    if header.get("format") != FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot format {header.get('format')}")
+    return header
+
+
+def read_frames(f, decode=True):
+    # Yields (table, rows) until the end marker; rows are tuples in the
+    # column order of TABLES, or None when decode is False
+    while True:
+        raw = f.read(FRAME.size)
+        if len(raw) < FRAME.size:
+            raise SnapshotError("Snapshot is truncated")
+        index, rows, length = FRAME.unpack(raw)
+        if index == END:
+            return
+        if index >= len(TABLES):
+            raise SnapshotError(f"Unknown table {index} in snapshot")
+        block = f.read(length)
+        if len(block) < length:
+            raise SnapshotError("Snapshot is truncated")
+        table, columns = TABLES[index]
+        if not decode:
+            yield table, rows
+            continue
+        data = zlib.decompress(block)
+        offset, values = 0, []
+        for _, kind in columns:
+            column, offset = decode_column(kind, data, offset, rows)
+            values.append(column)
+        yield table, list(zip(*values))
+
+
+def user_ids(conn, usernames):
+    return dict(conn.execute(select(User.username, User.id).where(
+        User.username.in_(set(usernames)))).all()) if usernames else {}
+
+
+def load_scores(conn, organization_id, employee_ids, rows):
+    # Score ids are not kept, so nothing has to be read back
+    columns = [column for column, _ in TABLES[TABLE_INDEX["scores"]][1][1:]]
+    values = [(organization_id, employee_ids.get(row[1]), *row[2:]) for row in rows]
+    if conn.dialect.name != "postgresql":
+        conn.execute(insert(WeeklyScore), [
+            dict(zip(["organization_id", *columns], row)) for row in values])
+        return
+    # COPY loads several times faster than multi-row INSERTs. An empty
+    # unquoted CSV field is NULL, and no text column here can be empty.
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(values)
+    buffer.seek(0)
+    if not conn.in_transaction():
+        conn.begin()
+    cursor = conn.connection.driver_connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY weekly_scores (organization_id, {', '.join(columns)}) "
+            f"FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+
+def import_snapshot(f, organization_id=None, name=None, shard=NEW_ORG_SHARD, progress=None):
+    if shard not in shard_engines:
+        raise SnapshotError(f"Unknown shard {shard}")
+    read_header(f)
+    organization_id = organization_id or str(uuid.uuid4())
+    counts = {name_: 0 for name_, _ in TABLES}
+    counts["skipped_memberships"] = 0
+    employee_ids = {}
+    created = False
+
+    try:
+        with engine.connect() as directory, shard_engines[shard].connect() as conn:
+            for table, rows in read_frames(f):
+                if table == "organization":
+                    _, source_name, owner, created_at = rows[0]
+                    if directory.execute(select(Organization.id).where(
+                            Organization.id == organization_id)).first():
+                        raise SnapshotError(f"Organization {organization_id} already exists")
+                    directory.execute(insert(Organization), [{
+                        "id": organization_id, "name": name or source_name,
+                        "owner_id": user_ids(directory, [owner] if owner else []).get(owner),
+                        "created_at": created_at}])
+                    if shard != DEFAULT_SHARD:
+                        directory.execute(insert(OrganizationShard), [
+                            {"organization_id": organization_id, "shard": shard}])
+                    directory.commit()
+                    created = True
+                elif not created:
+                    raise SnapshotError("Snapshot does not start with its organization")
+                elif table == "memberships":
+                    ids = user_ids(directory, [row[0] for row in rows])
+                    members = [{"user_id": ids[username], "organization_id": organization_id,
+                                "role": role, "joined_at": joined_at}
+                               for username, role, joined_at in rows if username in ids]
+                    if members:
+                        directory.execute(insert(OrganizationMembership), members)
+                    directory.commit()
+                    counts["skipped_memberships"] += len(rows) - len(members)
+                    rows = members
+                elif table == "employees":
+                    new_ids = conn.execute(
+                        insert(Employee).returning(Employee.id, sort_by_parameter_order=True),
+                        [{"organization_id": organization_id, "name": employee_name,
+                          "department": department, "role": role, "external_id": external_id}
+                         for _, employee_name, department, role, external_id in rows]
+                    ).scalars().all()
+                    employee_ids.update(zip((row[0] for row in rows), new_ids))
+                    conn.commit()
+                else:
+                    load_scores(conn, organization_id, employee_ids, rows)
+                    conn.commit()
+                counts[table] += len(rows)
+                if progress:
+                    progress(table, counts)
+    except BaseException:
+        if created:
+            # Leave nothing half-imported behind
+            db = tenant_session(organization_id)
+            try:
+                purge.purge_organization(db, organization_id)
+            finally:
+                db.close()
+        raise
+    return organization_id, counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Organization snapshots")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export_parser = sub.add_parser("export", help="write an organization to a snapshot file")
+    export_parser.add_argument("organization_id")
+    export_parser.add_argument("--output", required=True)
+    import_parser = sub.add_parser("import", help="load a snapshot as a new organization")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--org", default=None, help="id for the new organization (default: new uuid)")
+    import_parser.add_argument("--name", default=None, help="name for the new organization")
+    import_parser.add_argument("--shard", default=NEW_ORG_SHARD)
+    info_parser = sub.add_parser("info", help="header and row counts of a snapshot")
+    info_parser.add_argument("path")
+    args = parser.parse_args()
+
+    started = time.monotonic()
+    try:
+        if args.command == "export":
+            with open(args.output, "wb") as out:
+                counts = export_snapshot(args.organization_id, out)
+            print(f"📦 Exported {args.organization_id} to {args.output}")
+        elif args.command == "import":
+            def report(table, counts):
+                print(f"  {table}: {counts[table]} rows", file=sys.stderr)
+            with open(args.path, "rb") as f:
+                organization_id, counts = import_snapshot(
+                    f, args.org, args.name, args.shard, progress=report)
+            print(f"📥 Imported {args.path} as {organization_id} on shard {args.shard}")
+            if counts["skipped_memberships"]:
+                print(f"⚠️  {counts['skipped_memberships']} memberships skipped, "
+                      f"their users do not exist here")
+        else:
+            with open(args.path, "rb") as f:
+                header = read_header(f)
+                counts = {name: 0 for name, _ in TABLES}
+                for table, rows in read_frames(f, decode=False):
+                    counts[table] += rows
+            print(f"🗂️  {header['organization_id']} exported {header['exported_at']} "
+                  f"from shard {header['source_shard']}")
+    except SnapshotError as e:
+        sys.exit(f"❌ {e}")
+
+    elapsed = max(time.monotonic() - started, 1e-6)
+    rows = sum(counts[name] for name, _ in TABLES)
+    for name, _ in TABLES:
+        print(f"  {name:<14} {counts[name]:>10}")
+    if args.command != "info":
+        print(f"✅ {rows} rows in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
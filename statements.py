@@ -0,0 +1,61 @@
+from sqlalchemy import select, bindparam
+from models import Employee, WeeklyScore, User, OrganizationMembership
+
+# Hot lookups, built once at import. Building a Query and its filters on
+# every call costs more than running the lookup on a warm connection; a
+# prebuilt select with bound parameters goes straight to SQLAlchemy's
+# compiled cache, and its SQL text is identical on every call, which is
+# what lets a driver or pooler reuse a server-side prepared statement.
+#   db.scalars(statements.employee, {"employee_id": 5, "organization_id": org}).first()
+# New filters belong in a new statement here, not appended at the call
+# site, or the statement stops being shared.
+
+user_by_id = select(User).where(User.id == bindparam("user_id"))
+
+user_by_username = select(User).where(User.username == bindparam("username"))
+
+membership = select(OrganizationMembership).where(
+    OrganizationMembership.user_id == bindparam("user_id"),
+    OrganizationMembership.organization_id == bindparam("organization_id"))
+
+any_membership = select(OrganizationMembership).where(
+    OrganizationMembership.user_id == bindparam("user_id")).limit(1)
+
+employee = select(Employee).where(
+    Employee.id == bindparam("employee_id"),
+    Employee.organization_id == bindparam("organization_id"))
+
+employee_ids_in_org = select(Employee.id).where(
+    Employee.organization_id == bindparam("organization_id"),
+    Employee.id.in_(bindparam("employee_ids", expanding=True)))
+
+score = select(WeeklyScore).where(
+    WeeklyScore.id == bindparam("score_id"),
+    WeeklyScore.organization_id == bindparam("organization_id"))
+
+# A week's report: every score with its employee's name
+week_report = select(WeeklyScore, Employee.name).outerjoin(
+    Employee, Employee.id == WeeklyScore.employee_id
+).where(
+    WeeklyScore.week == bindparam("week"),
+    WeeklyScore.organization_id == bindparam("organization_id")
+).order_by(WeeklyScore.id)
+
+
+def _scores(from_week, to_week):
+    statement = select(WeeklyScore).where(
+        WeeklyScore.organization_id == bindparam("organization_id"))
+    # Week bounds let a partitioned weekly_scores skip whole partitions
+    if from_week:
+        statement = statement.where(WeeklyScore.week >= bindparam("from_week"))
+    if to_week:
+        statement = statement.where(WeeklyScore.week <= bindparam("to_week"))
+    return statement
+
+
+# One statement per combination of week bounds, keyed (has from, has to)
+_org_scores = {(f, t): _scores(f, t) for f in (False, True) for t in (False, True)}
+
+
+def org_scores(from_week=None, to_week=None):
+    return _org_scores[bool(from_week), bool(to_week)]
@@ -0,0 +1,133 @@
+from sqlalchemy import select, update
+from models import WeeklyScore
+from scoring import calculate_productivity
+from reports import weekly_report_rows, render_excel, render_pdf, XLSX_MEDIA_TYPE
+from mailer import build_report_message, send_message
+from jobs import job_handler, JobResult, JobFailed
+from analytics import analytics
+import archive
+import digest  # noqa: F401  (week-close digest handlers)
+from digest import DIGEST_SMTP_SERVER, DIGEST_SMTP_PORT, DIGEST_SENDER_EMAIL, DIGEST_SENDER_PASSWORD
+import purge
+
+# Background job handlers. Each one receives a JobContext and opens its own
+# session; returning a JobResult stores a downloadable file on the job,
+# returning a dict stores JSON.
+
+BATCH_SIZE = 1000
+
+
+def _report_rows(ctx):
+    db = ctx.session()
+    try:
+        rows = weekly_report_rows(db, ctx.organization_id, ctx.payload["week"])
+        # Detach the loaded rows so they stay usable after close
+        db.expunge_all()
+        return rows
+    finally:
+        db.close()
+
+
+@job_handler("export_excel")
+def export_excel_job(ctx):
+    week = ctx.payload["week"]
+    rows = _report_rows(ctx)
+    if not rows:
+        raise JobFailed(f"No scores found for week {week}")
+    ctx.progress(0.5, "rendering")
+    return JobResult(render_excel(week, rows), f"weekly_report_{week}.xlsx", XLSX_MEDIA_TYPE)
+
+
+@job_handler("export_pdf")
+def export_pdf_job(ctx):
+    week = ctx.payload["week"]
+    rows = _report_rows(ctx)
+    if not rows:
+        raise JobFailed(f"No scores found for week {week}")
+    ctx.progress(0.5, "rendering")
+    return JobResult(render_pdf(week, rows), f"weekly_report_{week}.pdf", "application/pdf")
+
+
+# Sent from the server's SMTP account (DIGEST_SMTP_*), never with the
+# caller's credentials. sender_password stays listed so jobs queued before
+# that still get it wiped.
+@job_handler("email_report", secrets=("sender_password",))
+def email_report_job(ctx):
+    p = ctx.payload
+    if not DIGEST_SENDER_EMAIL:
+        raise JobFailed("Background sending is not configured on this server")
+    rows = _report_rows(ctx)
+    if not rows:
+        raise JobFailed(f"No scores for week {p['week']}")
+    msg = build_report_message(p["week"], rows, DIGEST_SENDER_EMAIL, p["recipient_email"])
+    if p.get("reply_to"):
+        msg["Reply-To"] = p["reply_to"]
+    ctx.progress(0.5, "sending")
+    send_message(msg, DIGEST_SMTP_SERVER, DIGEST_SMTP_PORT, DIGEST_SENDER_EMAIL, DIGEST_SENDER_PASSWORD)
+    return {"message": f"Report emailed successfully to {p['recipient_email']}"}
+
+
+@job_handler("recompute_scores")
+def recompute_scores_job(ctx):
+    # Recomputes productivity_score from the stored components in keyset
+    # batches, committing each batch
+    db = ctx.session()
+    try:
+        total = db.query(WeeklyScore).filter(
+            WeeklyScore.organization_id == ctx.organization_id).count()
+        done = changed = 0
+        last_id = 0
+        while True:
+            batch = db.execute(
+                select(WeeklyScore.id, WeeklyScore.task_completion, WeeklyScore.speed,
+                       WeeklyScore.professionalism, WeeklyScore.activity,
+                       WeeklyScore.productivity_score)
+                .where(WeeklyScore.organization_id == ctx.organization_id,
+                       WeeklyScore.id > last_id)
+                .order_by(WeeklyScore.id)
+                .limit(BATCH_SIZE)
+            ).all()
+            if not batch:
+                break
+            updates = []
+            for row in batch:
+                score = calculate_productivity(
+                    row.task_completion, row.speed, row.professionalism, row.activity)
+                if score != row.productivity_score:
+                    updates.append({"id": row.id, "productivity_score": score})
+            if updates:
+                # One executemany UPDATE by primary key for the batch
+                db.execute(update(WeeklyScore), updates)
+            db.commit()
+            changed += len(updates)
+            done += len(batch)
+            last_id = batch[-1].id
+            ctx.progress(done / total if total else 1.0, f"{done}/{total} scores")
+        analytics.invalidate(ctx.organization_id)
+        return {"scores": done, "changed": changed}
+    finally:
+        db.close()
+
+
+@job_handler("purge_organization")
+def purge_organization_job(ctx):
+    # Second half of DELETE /auth/account?background=true: the owner and
+    # memberships are already gone, this removes the org's data in batches
+    # so no single transaction has to hold every row
+    db = ctx.session()
+    try:
+        return purge.purge_organization(db, ctx.organization_id, progress=ctx.progress)
+    finally:
+        db.close()
+
+
+@job_handler("archive_scores")
+def archive_scores_job(ctx):
+    db = ctx.session()
+    try:
+        return archive.archive_organization(
+            db, ctx.organization_id, ctx.payload.get("before_week"), progress=ctx.progress)
+    except archive.ArchiveNotShared as e:
+        raise JobFailed(str(e))
+    finally:
+        db.close()
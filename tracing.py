@@ -0,0 +1,214 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from sqlalchemy import event
+import atexit
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import uuid
+
+# Minimal span API. A trace is opened per request by the middleware in
+# app.py and spans opened anywhere below it (including threadpool workers,
+# which inherit the context) are attached to that trace. Finished traces
+# are handed to the configured exporter; with no exporter every call here
+# is a cheap no-op.
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "")
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1"))
+# Finished traces waiting for the file writer; past this many the newest
+# are dropped rather than holding up requests on a slow disk
+TRACE_QUEUE_SIZE = int(os.getenv("TRACE_QUEUE_SIZE", "10000"))
+
+current_span = ContextVar("current_span", default=None)
+
+
+class Trace:
+    def __init__(self, name):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.started_at = datetime.utcnow()
+        self.spans = []
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name",
+                 "attributes", "start", "end_time", "thread")
+
+    def __init__(self, trace, name, parent_id, attributes):
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.end_time = None
+        self.thread = threading.current_thread().name
+        trace.spans.append(self)
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def end(self):
+        self.end_time = time.perf_counter()
+
+    @property
+    def duration_ms(self):
+        end = self.end_time if self.end_time is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+
+class JsonFileExporter:
+    # One JSON document per line, one line per trace. export() runs on the
+    # event loop, so it only queues the trace; a writer thread serializes
+    # and appends whatever has piled up since its last write.
+    def __init__(self, path=TRACE_FILE, max_queued=TRACE_QUEUE_SIZE):
+        self.path = path
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._writer = threading.Thread(target=self._write_loop, name="trace-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
+
+    def export(self, trace):
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self):
+        # Blocks until every trace queued so far is on disk
+        self._queue.join()
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with open(self.path, "a") as f:
+                    for t in batch:
+                        f.write(json.dumps(trace_to_dict(t), default=str) + "\n")
+            except Exception as e:
+                print(f"Trace export to {self.path} failed: {e!r}", file=sys.stderr)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+
+class ConsoleExporter:
+    def export(self, trace):
+        root = trace.spans[0] if trace.spans else None
+        total = root.duration_ms if root else 0
+        print(f"[trace {trace.trace_id}] {trace.name} {total:.1f}ms",
+              file=sys.stderr)
+        for s in trace.spans[1:]:
+            print(f"  {s.name:<24} {s.duration_ms:8.2f}ms  {s.attributes}",
+                  file=sys.stderr)
+
+
+EXPORTERS = {
+    "json": JsonFileExporter,
+    "console": ConsoleExporter,
+}
+
+_exporter = EXPORTERS[TRACE_EXPORTER]() if TRACE_EXPORTER in EXPORTERS else None
+
+
+def set_exporter(exporter):
+    global _exporter
+    _exporter = exporter
+
+
+def get_exporter():
+    return _exporter
+
+
+def trace_to_dict(trace):
+    root_start = trace.spans[0].start if trace.spans else 0
+    return {
+        "trace_id": trace.trace_id,
+        "name": trace.name,
+        "started_at": trace.started_at.isoformat(),
+        "spans": [
+            {
+                "span_id": s.span_id,
+                "parent_id": s.parent_id,
+                "name": s.name,
+                "start_offset_ms": round((s.start - root_start) * 1000, 3),
+                "duration_ms": round(s.duration_ms, 3),
+                "thread": s.thread,
+                "attributes": s.attributes,
+            }
+            for s in trace.spans
+        ]
+    }
+
+
+def start_span(name, **attributes):
+    parent = current_span.get()
+    if parent is None:
+        return None
+    return Span(parent.trace, name, parent.span_id, attributes)
+
+
+@contextmanager
+def span(name, **attributes):
+    s = start_span(name, **attributes)
+    if s is None:
+        yield None
+        return
+    token = current_span.set(s)
+    try:
+        yield s
+    except Exception as e:
+        s.set("error", repr(e))
+        raise
+    finally:
+        s.end()
+        current_span.reset(token)
+
+
+@contextmanager
+def trace(name, **attributes):
+    if _exporter is None or random.random() >= TRACE_SAMPLE_RATE:
+        yield None
+        return
+    t = Trace(name)
+    root = Span(t, name, None, attributes)
+    token = current_span.set(root)
+    try:
+        yield root
+    finally:
+        root.end()
+        current_span.reset(token)
+        _exporter.export(t)
+
+
+def instrument_engine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._trace_span = start_span(
+            "db.query", statement=statement, executemany=executemany)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        s = getattr(context, "_trace_span", None)
+        if s is not None:
+            s.set("rowcount", cursor.rowcount)
+            s.end()
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        context = exception_context.execution_context
+        s = getattr(context, "_trace_span", None) if context else None
+        if s is not None:
+            s.set("error", repr(exception_context.original_exception))
+            s.end()
@@ -0,0 +1,80 @@
+from database import SessionLocal
+from jobs import claim_next, run_job, requeue_stale, worker_id
+from partitioning import maintain as maintain_partitions
+from digest import schedule_week_close
+import tasks  # noqa: F401  (registers the job handlers)
+import argparse
+import os
+import signal
+import threading
+import time
+
+# Background job worker: python worker.py [--threads N]
+# Runs next to the web process (see Procfile) and can be scaled out; every
+# thread claims jobs independently.
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+
+stopping = threading.Event()
+
+
+def work(name):
+    me = worker_id()
+    print(f"👷 {name} started as {me}")
+    while not stopping.is_set():
+        db = SessionLocal()
+        try:
+            job = claim_next(db, me)
+            if job is None:
+                db.close()
+                stopping.wait(JOB_POLL_INTERVAL)
+                continue
+            started = time.perf_counter()
+            job = run_job(db, job)
+            print(f"  {job.kind} {job.id} -> {job.status} "
+                  f"(attempt {job.attempts}, {time.perf_counter() - started:.2f}s)")
+        except Exception as e:
+            print(f"⚠️  {name}: {e}")
+            stopping.wait(JOB_POLL_INTERVAL)
+        finally:
+            db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Background job worker")
+    parser.add_argument("--threads", type=int, default=int(os.getenv("JOB_WORKER_THREADS", "2")))
+    args = parser.parse_args()
+
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    signal.signal(signal.SIGINT, lambda *_: stopping.set())
+
+    threads = [threading.Thread(target=work, args=(f"worker-{i}",), daemon=True)
+               for i in range(args.threads)]
+    for t in threads:
+        t.start()
+
+    while not stopping.is_set():
+        db = SessionLocal()
+        try:
+            requeued, failed = requeue_stale(db)
+            if requeued:
+                print(f"♻️  Requeued {requeued} stale job(s)")
+            if failed:
+                print(f"💀 Failed {failed} stale job(s) out of attempts")
+            created = maintain_partitions()
+            if created:
+                print(f"🧱 Created partitions {', '.join(created)}")
+            for week in schedule_week_close():
+                print(f"📬 Queued the {week} digest")
+        except Exception as e:
+            print(f"⚠️  Maintenance failed: {e}")
+        finally:
+            db.close()
+        stopping.wait(60)
+
+    print("👋 Waiting for running jobs to finish...")
+    for t in threads:
+        t.join()
+
+
+if __name__ == "__main__":
+    main()